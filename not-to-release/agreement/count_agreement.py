@@ -1,35 +1,258 @@
-import sklearn
+"""
+Measure the agreement between any number of annotations of the same sentences
+
+Sentences are matched between the files by their text with the spaces
+removed, so a missing or reordered sentence in one file does not
+affect the others.  Within a sentence, words are matched by their
+character span in that text, so if one annotator split a word
+differently, only the words involved in the split are left out.
+
+For each column the labels of all annotators are encoded as an
+(annotators x words) integer array, and the agreement numbers all
+come from NumPy confusion matrices over those arrays:
+  - observed agreement, pairwise and over all annotators
+  - Cohen's kappa for each pair of annotators
+  - Fleiss' kappa over all of the annotators
+  - specific agreement for each deprel
+
+UAS compares the span of the head word, so that it still works
+when the word indices differ between the annotations.
+
+With --bootstrap N, each pair of annotators also gets confidence
+intervals for UPOS, LAS and the UPOS kappa from N sentence resamples.
+"""
+
+import argparse
+from itertools import combinations
+import os
+import sys
+
+import numpy as np
 
 from stanza.utils.conll import CoNLL
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from bootstrap import confidence_interval, format_interval, kappa_statistic, sentence_confusions, sentence_counts
+from normalize import normalize_text
+
+COLUMNS = ("upos", "xpos", "feats", "head", "deprel", "las")
+COLUMN_NAMES = {
+    "upos": "UPOS",
+    "xpos": "XPOS",
+    "feats": "UFeats",
+    "head": "UAS",
+    "deprel": "Deprel",
+    "las": "LAS",
+}
+
+def word_spans(sentence):
+    """
+    Return the (start, end) of each word in the normalized sentence text
+    """
+    spans = []
+    start = 0
+    for word in sentence.words:
+        end = start + len(normalize_text(word.text))
+        spans.append((start, end))
+        start = end
+    return spans
+
+def align_sentences(docs):
+    """
+    Return a list of tuples of sentences, one from each doc, which have the same text
+
+    Also returns the number of sentences in each doc which were not matched
+    """
+    indexed = []
+    for doc in docs:
+        by_text = {}
+        for sentence in doc.sentences:
+            by_text.setdefault(normalize_text(sentence.text), sentence)
+        indexed.append(by_text)
+    shared = [normalize_text(sentence.text) for sentence in docs[0].sentences]
+    shared = [text for text in dict.fromkeys(shared) if all(text in by_text for by_text in indexed)]
+    aligned = [tuple(by_text[text] for by_text in indexed) for text in shared]
+    unmatched = [len(doc.sentences) - len(aligned) for doc in docs]
+    return aligned, unmatched
+
+def word_labels(sentence, word, spans):
+    if word.head == 0:
+        head = "root"
+    else:
+        head = "%d-%d" % spans[word.head - 1]
+    return {
+        "upos": word.upos or "_",
+        "xpos": word.xpos or "_",
+        "feats": word.feats or "_",
+        "head": head,
+        "deprel": word.deprel or "_",
+        "las": "%s %s" % (head, word.deprel),
+    }
+
+def encode_annotations(docs):
+    """
+    Encode the aligned words of all docs as integer arrays
+
+    Returns a map from column to an (annotators x words) array, a map
+    from column to the list of labels which the integers refer to, and
+    some counts of what was aligned
+    """
+    aligned, unmatched = align_sentences(docs)
+
+    vocabs = {column: {} for column in COLUMNS}
+    ids = {column: [[] for _ in docs] for column in COLUMNS}
+    # sentence index of each aligned word, for resampling by sentence
+    sentence_ids = []
+    skipped_words = 0
+    for sent_idx, sentences in enumerate(aligned):
+        all_spans = [word_spans(sentence) for sentence in sentences]
+        shared_spans = set(all_spans[0]).intersection(*all_spans[1:])
+        skipped_words += sum(len(spans) - len(shared_spans) for spans in all_spans)
+        for doc_idx, (sentence, spans) in enumerate(zip(sentences, all_spans)):
+            for word, span in zip(sentence.words, spans):
+                if span not in shared_spans:
+                    continue
+                labels = word_labels(sentence, word, spans)
+                for column in COLUMNS:
+                    label_id = vocabs[column].setdefault(labels[column], len(vocabs[column]))
+                    ids[column][doc_idx].append(label_id)
+                if doc_idx == 0:
+                    sentence_ids.append(sent_idx)
+
+    arrays = {column: np.array(ids[column], dtype=np.int32).reshape(len(docs), -1) for column in COLUMNS}
+    labels = {column: list(vocabs[column]) for column in COLUMNS}
+    counts = {
+        "sentences": len(aligned),
+        "unmatched_sentences": unmatched,
+        "words": len(sentence_ids),
+        "skipped_words": skipped_words,
+        "sentence_ids": np.array(sentence_ids, dtype=np.int32),
+    }
+    return arrays, labels, counts
+
+def confusion_matrix(first, second, num_labels):
+    return np.bincount(first * num_labels + second, minlength=num_labels * num_labels).reshape(num_labels, num_labels)
+
+def cohen_kappa(confusion):
+    total = confusion.sum()
+    if total == 0:
+        return float("nan")
+    observed = np.trace(confusion) / total
+    expected = (confusion.sum(axis=0) * confusion.sum(axis=1)).sum() / (total * total)
+    if expected == 1.0:
+        return 1.0
+    return (observed - expected) / (1.0 - expected)
+
+def label_counts(labels, num_labels):
+    """
+    Return an (words x labels) array of how many annotators chose each label for each word
+    """
+    num_annotators, num_words = labels.shape
+    flat = (np.arange(num_words)[np.newaxis, :] * num_labels + labels).ravel()
+    return np.bincount(flat, minlength=num_words * num_labels).reshape(num_words, num_labels)
+
+def fleiss_kappa(counts):
+    num_words = counts.shape[0]
+    if num_words == 0:
+        return float("nan")
+    num_annotators = counts[0].sum()
+    per_word = ((counts * counts).sum(axis=1) - num_annotators) / (num_annotators * (num_annotators - 1))
+    observed = per_word.mean()
+    proportions = counts.sum(axis=0) / (num_words * num_annotators)
+    expected = (proportions * proportions).sum()
+    if expected == 1.0:
+        return 1.0
+    return (observed - expected) / (1.0 - expected)
 
-d1 = CoNLL.conll2doc("det.p1.sarwat.output")
-d2 = CoNLL.conll2doc("det.p1.shafi.output")
+def specific_agreement(confusion):
+    """
+    For each label, 2 * (both chose it) / (times either chose it), from a pooled confusion matrix
+    """
+    confusion = confusion + confusion.T
+    chosen = confusion.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.diag(confusion) / chosen, chosen // 2
 
+def column_agreement(labels, num_labels):
+    """
+    Compute the agreement statistics for one (annotators x words) column
+    """
+    num_annotators = labels.shape[0]
+    pairwise = {}
+    pooled = np.zeros((num_labels, num_labels), dtype=np.int64)
+    for first, second in combinations(range(num_annotators), 2):
+        confusion = confusion_matrix(labels[first], labels[second], num_labels)
+        pooled += confusion
+        pairwise[(first, second)] = {
+            "agree": int(np.trace(confusion)),
+            "kappa": cohen_kappa(confusion),
+        }
+    results = {
+        "pairwise": pairwise,
+        "all_agree": int((labels == labels[0]).all(axis=0).sum()),
+        "pooled": pooled,
+    }
+    results["fleiss"] = fleiss_kappa(label_counts(labels, num_labels))
+    return results
 
-agree_upos = 0
-agree_las = 0
-total_words = 0
+def print_agreement(results, labels, counts, names):
+    total = counts["words"]
+    print("%d sentences aligned across %d files" % (counts["sentences"], len(names)))
+    for name, unmatched in zip(names, counts["unmatched_sentences"]):
+        if unmatched > 0:
+            print("  %d sentences in %s were not in every file" % (unmatched, name))
+    print("%d words aligned, %d words skipped for tokenization differences" % (total, counts["skipped_words"]))
+    if total == 0:
+        return
 
-sarwat_pos = []
-shafi_pos = []
+    print()
+    for column in COLUMNS:
+        column_results = results[column]
+        print("%-7s all agree %d %d %.4f   Fleiss kappa %.4f" % (COLUMN_NAMES[column], column_results["all_agree"], total, column_results["all_agree"] / total, column_results["fleiss"]))
+        for (first, second), pair in column_results["pairwise"].items():
+            print("  %s vs %s: %d %d %.4f   Cohen kappa %.4f" % (names[first], names[second], pair["agree"], total, pair["agree"] / total, pair["kappa"]))
 
-assert len(d1.sentences) == len(d2.sentences)
-for s1, s2 in zip(d1.sentences, d2.sentences):
-    assert len(s1.words) == len(s2.words)
+    print()
+    print("Deprel specific agreement")
+    agreement, chosen = specific_agreement(results["deprel"]["pooled"])
+    for label_idx in np.argsort(-chosen, kind="stable"):
+        if chosen[label_idx] == 0:
+            continue
+        print("  %-16s %6d %.4f" % (labels["deprel"][label_idx], chosen[label_idx], agreement[label_idx]))
 
-    for w1, w2 in zip(s1.words, s2.words):
-        sarwat_pos.append(w1.upos)
-        shafi_pos.append(w2.upos)
+def print_bootstrap(arrays, labels, counts, names, num_resamples, seed, workers):
+    sentence_ids = counts["sentence_ids"]
+    num_sentences = counts["sentences"]
+    print()
+    print("Bootstrap confidence intervals from %d resamples of %d sentences" % (num_resamples, num_sentences))
+    num_annotators = arrays["upos"].shape[0]
+    for first, second in combinations(range(num_annotators), 2):
+        print("  %s vs %s" % (names[first], names[second]))
+        for column in ("upos", "las"):
+            correct = arrays[column][first] == arrays[column][second]
+            interval = confidence_interval(sentence_counts(sentence_ids, correct, num_sentences), num_resamples=num_resamples, seed=seed, workers=workers)
+            print("    %s" % format_interval(COLUMN_NAMES[column], interval))
+        confusions = sentence_confusions(sentence_ids, arrays["upos"][first], arrays["upos"][second], len(labels["upos"]), num_sentences)
+        interval = confidence_interval(confusions, kappa_statistic, num_resamples=num_resamples, seed=seed, workers=workers)
+        print("    %s" % format_interval("UPOS kappa", interval))
 
-        total_words += 1
-        if w1.upos == w2.upos:
-            agree_upos += 1
-        if w1.head == w2.head and w1.deprel == w2.deprel:
-            agree_las += 1
+def main():
+    parser = argparse.ArgumentParser(description='Measure the agreement between several annotations of the same sentences')
+    parser.add_argument('filenames', nargs='*', default=["det.p1.sarwat.output", "det.p1.shafi.output"], help='Annotated files to compare')
+    parser.add_argument('--bootstrap', type=int, default=0, help='Number of bootstrap resamples for confidence intervals.  0 to skip')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed for the bootstrap')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes for the bootstrap.  Defaults to the number of cores')
+    args = parser.parse_args()
 
-kappa = sklearn.metrics.cohen_kappa_score(sarwat_pos, shafi_pos)
+    if len(args.filenames) < 2:
+        raise ValueError("Need at least two files to compare")
+    docs = [CoNLL.conll2doc(filename) for filename in args.filenames]
+    names = [os.path.split(filename)[1] for filename in args.filenames]
+    arrays, labels, counts = encode_annotations(docs)
+    results = {column: column_agreement(arrays[column], len(labels[column])) for column in COLUMNS}
+    print_agreement(results, labels, counts, names)
+    if args.bootstrap > 0 and counts["words"] > 0:
+        print_bootstrap(arrays, labels, counts, names, args.bootstrap, args.seed, args.workers)
 
-print("UPOS", agree_upos, total_words, agree_upos / total_words)
-print("LAS", agree_las, total_words, agree_las / total_words)
-print("UPOS kappa", kappa)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Client for annotation_server.py
+
+  client = AnnotationClient()                      # http on 127.0.0.1:5905
+  client = AnnotationClient("unix:~/.cache/ud_sindhi_isra/annotate.sock")
+  conll = client.annotate(["first sentence", "second sentence"])
+  conll = client.annotate([["pre", "tokenized"]], pretokenized=True)
+  sentences = client(["first sentence"])           # stanza Sentences, like CachedPipeline
+
+Only the standard library is needed, except for __call__, which
+builds stanza Sentences from the CoNLL-U.
+"""
+
+import http.client
+import json
+import os
+import socket
+
+from annotation_server import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_ADDRESS = "%s:%d" % (DEFAULT_HOST, DEFAULT_PORT)
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+class AnnotationClient:
+    # scripts which can use either this or a CachedPipeline check for a cache to report
+    cache = None
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=600):
+        """
+        address is host:port or unix:/path/to/socket
+        """
+        self.address = address
+        self.timeout = timeout
+
+    def connection(self):
+        if self.address.startswith("unix:"):
+            return UnixHTTPConnection(os.path.expanduser(self.address[5:]), self.timeout)
+        host, port = self.address.rsplit(":", 1)
+        return http.client.HTTPConnection(host, int(port), timeout=self.timeout)
+
+    def request(self, method, path, data=None):
+        connection = self.connection()
+        try:
+            body = None
+            headers = {}
+            if data is not None:
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                headers["Content-Type"] = "application/json; charset=utf-8"
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            result = json.loads(response.read().decode("utf-8"))
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError("Annotation server at %s returned %d: %s" % (self.address, response.status, result.get("error")))
+        return result
+
+    def is_running(self):
+        try:
+            self.status()
+        except OSError:
+            return False
+        return True
+
+    def status(self):
+        return self.request("GET", "/status")
+
+    def annotate(self, sentences, pretokenized=False, batch_size=None):
+        """
+        Return one CoNLL-U string per sentence
+
+        With batch_size, the sentences are sent batch_size at a time,
+        which lets the server interleave them with other clients
+        """
+        sentences = list(sentences)
+        if batch_size is None:
+            batch_size = max(len(sentences), 1)
+        results = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start+batch_size]
+            results.extend(self.request("POST", "/annotate", {"sentences": batch, "pretokenized": pretokenized})["conllu"])
+        return results
+
+    def __call__(self, texts, batch_size=None):
+        """
+        Return a list of stanza Sentences, one per text, as CachedPipeline does
+        """
+        from stanza.utils.conll import CoNLL
+
+        if len(texts) == 0:
+            return []
+        conll = self.annotate(texts, batch_size=batch_size)
+        doc = CoNLL.conll2doc(input_str="\n\n".join(x.strip() for x in conll) + "\n\n")
+        if len(doc.sentences) != len(texts):
+            raise ValueError("Expected %d sentences from the annotation server, but got %d" % (len(texts), len(doc.sentences)))
+        return doc.sentences
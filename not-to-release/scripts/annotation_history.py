@@ -0,0 +1,437 @@
+"""
+Keep every version of every sentence from the dated batch files in one store
+
+The same sentences come back in many snapshots: the MLtwist
+*_output_<date> files, the *_labeled_<date> files in xpos_features,
+the files in dependencies as they are edited, and the released
+splits.  Each distinct annotation of a sentence (its word lines,
+without the sent_id) is stored once, under the sha256 of those lines,
+along with every snapshot it was seen in.  A snapshot is one version
+of one file, dated from its name if it has a date in it, otherwise
+from its last commit, or its mtime if it has changed since.  When a
+file is edited in place, the new contents are a new snapshot and the
+old ones are kept.  The lemma tsv files are stored the same way, as
+(word, UPOS, lemma) entries.
+
+The store is an sqlite database, indexed by sentence, so a lookup
+does not read any of the files:
+
+  python3 annotation_history.py --update                      # add any new or changed files
+  python3 annotation_history.py --update ../mltwist_dependencies/new_batch_output_Nov_02_2025
+  python3 annotation_history.py --update HEAD~5:sd_isra-ud-train.conllu
+  python3 annotation_history.py --sentence "اسان جو مذهب به ان جي اجازت نٿو ڏئي."
+  python3 annotation_history.py --sent_id ../dependencies/sd_780.conllu Kawish-20100810-017
+  python3 annotation_history.py --changes 2025-01-01 2025-04-30
+  python3 annotation_history.py --lemma ڪتابن NOUN
+
+--update with no files rereads the default files, skipping the ones
+whose size and mtime have not changed.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+
+from check_consistency import sentence_key
+from conllu_diff import diff_sentence, is_git_spec, looks_like_conllu, read_git_blobs
+from conllu_io import parse_conllu
+from normalize import normalize_text
+
+DEFAULT_DB = os.path.join(os.path.expanduser("~"), ".cache", "ud_sindhi_isra", "history", "annotations.sqlite")
+
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+DEFAULT_FILES = [
+    "../../sd_isra-ud-*.conllu",
+    "../dependencies/*.conllu",
+    "../edits/*.conllu",
+    "../mltwist_dependencies/*",
+    "../upos/*.conllu",
+    "../xpos_features/*",
+    "../xpos_standard/*.conllu",
+    "../lemmas/*.tsv",
+    "../lemmas/original/*.tsv",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    date_source TEXT NOT NULL,
+    UNIQUE (path, sha)
+);
+CREATE INDEX IF NOT EXISTS snapshots_date ON snapshots (date);
+
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    snapshot INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS annotations (
+    sha TEXT PRIMARY KEY,
+    sentence TEXT NOT NULL,
+    text TEXT,
+    rows TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS annotations_sentence ON annotations (sentence);
+
+CREATE TABLE IF NOT EXISTS occurrences (
+    snapshot INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    sent_id TEXT,
+    annotation TEXT NOT NULL,
+    PRIMARY KEY (snapshot, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS occurrences_annotation ON occurrences (annotation);
+CREATE INDEX IF NOT EXISTS occurrences_sent_id ON occurrences (sent_id, snapshot);
+
+CREATE TABLE IF NOT EXISTS lemmas (
+    snapshot INTEGER NOT NULL,
+    form TEXT NOT NULL,
+    upos TEXT NOT NULL,
+    lemma TEXT NOT NULL,
+    PRIMARY KEY (snapshot, form, upos, lemma)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS lemmas_form ON lemmas (form, upos);
+"""
+
+MONTHS = {name: idx + 1 for idx, name in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"))}
+
+def date_from_name(path):
+    """
+    The date in a name such as sd_batch_3_labeled_2025-03-31.txt or det.p1_output_jul_28_2024, or None
+    """
+    name = os.path.split(path)[1]
+    match = re.search(r"(\d{4})-(\d{2})-(\d{2})", name)
+    if match:
+        return "%s-%s-%s" % match.groups()
+    match = re.search(r"([A-Za-z]{3})_(\d{1,2})_(\d{4})", name)
+    if match and match.group(1).lower() in MONTHS:
+        return "%s-%02d-%02d" % (match.group(3), MONTHS[match.group(1).lower()], int(match.group(2)))
+    return None
+
+def git_output(*command):
+    return subprocess.run(["git"] + list(command), check=True, capture_output=True, text=True, cwd=REPO_ROOT).stdout.strip()
+
+def file_date(path):
+    """
+    The date of a file in the working tree, and where the date came from
+    """
+    date = date_from_name(path)
+    if date is not None:
+        return date, "name"
+    relative = os.path.relpath(os.path.abspath(path), REPO_ROOT)
+    try:
+        # the last commit is only the date of the file if it has not changed since
+        date = git_output("log", "-1", "--format=%cs", "--", relative)
+        if date and not git_output("status", "--porcelain", "--", relative):
+            return date, "git"
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return datetime.date.fromtimestamp(os.stat(path).st_mtime).isoformat(), "mtime"
+
+def git_spec_date(spec):
+    date = date_from_name(spec.split(":", maxsplit=1)[1])
+    if date is not None:
+        return date, "name"
+    return git_output("log", "-1", "--format=%cs", spec.split(":", maxsplit=1)[0]), "git"
+
+def store_path(path):
+    """
+    The path a file is stored under: relative to the top of the repo, so the store can be used from any directory
+    """
+    if is_git_spec(path):
+        return path.split(":", maxsplit=1)[1]
+    return os.path.relpath(os.path.abspath(path), REPO_ROOT)
+
+def annotation_rows(sentence):
+    return "\n".join(row.to_line() for row in sentence.rows)
+
+def read_lemma_tsv(text):
+    """
+    The (word, UPOS, lemma) entries of a lemma tsv, with or without a header, ignoring the remarks
+    """
+    entries = set()
+    for line_idx, line in enumerate(text.split("\n")):
+        pieces = line.strip().split("\t")
+        if len(pieces) < 3 or not pieces[2]:
+            continue
+        if line_idx == 0 and pieces[1] in ("POS", "UPOS"):
+            continue
+        entries.add((pieces[0], pieces[1], pieces[2]))
+    return sorted(entries)
+
+def read_snapshot(path, text):
+    """
+    Parse one version of a file into what is stored for it
+
+    Returns the kind, "conllu" or "lemmas", and the entries: (sent_id,
+    annotation sha, sentence key, text, rows) for each sentence, or
+    (word, UPOS, lemma) for a lemma file.  Returns None for anything else
+    """
+    if path.endswith(".tsv"):
+        return "lemmas", read_lemma_tsv(text)
+    if not looks_like_conllu(text):
+        return None
+    doc = parse_conllu(text, path)
+    entries = []
+    for sentence in doc.sentences:
+        if not sentence.rows:
+            continue
+        rows = annotation_rows(sentence)
+        sha = hashlib.sha256(rows.encode("utf-8")).hexdigest()
+        entries.append((sentence.sent_id, sha, sentence_key(sentence), sentence.text, rows))
+    return "conllu", entries
+
+def read_file_snapshot(path):
+    with open(path, encoding="utf-8", newline="") as fin:
+        text = fin.read()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest(), read_snapshot(path, text)
+
+class AnnotationHistory:
+    """
+    The sqlite store of snapshots, annotations and where each annotation was seen
+    """
+    def __init__(self, db_path):
+        if db_path != ":memory:":
+            os.makedirs(os.path.split(db_path)[0] or ".", exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def find_snapshot(self, path, sha):
+        row = self.db.execute("SELECT id FROM snapshots WHERE path = ? AND sha = ?", (path, sha)).fetchone()
+        return None if row is None else row[0]
+
+    def add_snapshot(self, path, sha, parsed, date, date_source):
+        """
+        Store one version of a file, returning its snapshot id.  A version which is already stored is not added again
+        """
+        snapshot = self.find_snapshot(path, sha)
+        if snapshot is not None:
+            return snapshot
+        kind, entries = parsed
+        cursor = self.db.execute("INSERT INTO snapshots (path, sha, kind, date, date_source) VALUES (?, ?, ?, ?, ?)",
+                                 (path, sha, kind, date, date_source))
+        snapshot = cursor.lastrowid
+        if kind == "lemmas":
+            self.db.executemany("INSERT INTO lemmas (snapshot, form, upos, lemma) VALUES (?, ?, ?, ?)",
+                                [(snapshot,) + entry for entry in entries])
+            return snapshot
+        self.db.executemany("INSERT OR IGNORE INTO annotations (sha, sentence, text, rows) VALUES (?, ?, ?, ?)",
+                            [(sha, key, text, rows) for _, sha, key, text, rows in entries])
+        self.db.executemany("INSERT INTO occurrences (snapshot, position, sent_id, annotation) VALUES (?, ?, ?, ?)",
+                            [(snapshot, position, entry[0], entry[1]) for position, entry in enumerate(entries)])
+        return snapshot
+
+    def update(self, paths, workers=1):
+        """
+        Add the files and REV:path specs which are not already stored, returning how many snapshots were added
+        """
+        before = self.db.execute("SELECT count(*) FROM snapshots").fetchone()[0]
+        changed = []
+        for path in paths:
+            if is_git_spec(path):
+                continue
+            stat = os.stat(path)
+            known = self.db.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (store_path(path),)).fetchone()
+            if known != (stat.st_size, stat.st_mtime_ns):
+                changed.append(path)
+
+        if workers <= 1 or len(changed) <= 1:
+            results = [read_file_snapshot(x) for x in changed]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(read_file_snapshot, changed))
+
+        with self.db:
+            for path, (sha, parsed) in zip(changed, results):
+                stat = os.stat(path)
+                snapshot = self.find_snapshot(store_path(path), sha)
+                if snapshot is None and parsed is not None:
+                    snapshot = self.add_snapshot(store_path(path), sha, parsed, *file_date(path))
+                # 0 for a file with nothing to store, so it is not reread until it changes
+                if snapshot is None:
+                    snapshot = 0
+                self.db.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, snapshot) VALUES (?, ?, ?, ?)",
+                                (store_path(path), stat.st_size, stat.st_mtime_ns, snapshot))
+
+            specs = [x for x in paths if is_git_spec(x)]
+            for spec, text in read_git_blobs(specs).items():
+                if text is None:
+                    raise FileNotFoundError("Could not find %s in git" % spec)
+                sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if self.find_snapshot(store_path(spec), sha) is not None:
+                    continue
+                parsed = read_snapshot(store_path(spec), text)
+                if parsed is not None:
+                    self.add_snapshot(store_path(spec), sha, parsed, *git_spec_date(spec))
+        return self.db.execute("SELECT count(*) FROM snapshots").fetchone()[0] - before
+
+    def sightings(self, annotation):
+        """
+        The (path, date, sent_id) of every snapshot an annotation was seen in, oldest first
+        """
+        return self.db.execute("SELECT s.path, s.date, o.sent_id FROM occurrences o JOIN snapshots s ON s.id = o.snapshot "
+                               "WHERE o.annotation = ? ORDER BY s.date, s.path, o.position", (annotation,)).fetchall()
+
+    def versions(self, key):
+        """
+        Every annotation of the sentence with this key, as (sha, first date, text, rows), in the order they first appeared.
+        Versions from the same day are in the order they were stored
+        """
+        return self.db.execute("SELECT a.sha, min(s.date) AS first, a.text, a.rows FROM annotations a "
+                               "JOIN occurrences o ON o.annotation = a.sha JOIN snapshots s ON s.id = o.snapshot "
+                               "WHERE a.sentence = ? GROUP BY a.sha ORDER BY first, min(s.id)", (key,)).fetchall()
+
+    def key_for_sent_id(self, path, sent_id):
+        """
+        The sentence key of sent_id in the most recent snapshot of path
+        """
+        row = self.db.execute("SELECT a.sentence FROM occurrences o JOIN snapshots s ON s.id = o.snapshot "
+                              "JOIN annotations a ON a.sha = o.annotation WHERE o.sent_id = ? AND s.path = ? "
+                              "ORDER BY s.date DESC, s.id DESC LIMIT 1", (sent_id, store_path(path))).fetchone()
+        return None if row is None else row[0]
+
+    def changes(self, start, end):
+        """
+        The sentences which got a new annotation in a snapshot dated after start and up to end
+
+        Returns {sentence key: [(sha, first date, text, rows), ...]}, each
+        list starting with the version as of start, or None for a sentence
+        first seen in that time, followed by the new versions in order
+        """
+        candidates = self.db.execute("SELECT DISTINCT a.sentence FROM snapshots s JOIN occurrences o ON o.snapshot = s.id "
+                                     "JOIN annotations a ON a.sha = o.annotation WHERE s.date > ? AND s.date <= ?",
+                                     (start, end)).fetchall()
+        changes = {}
+        for (key,) in candidates:
+            versions = self.versions(key)
+            new_versions = [x for x in versions if start < x[1] <= end]
+            if not new_versions:
+                continue
+            old_versions = [x for x in versions if x[1] <= start]
+            changes[key] = [old_versions[-1] if old_versions else None] + new_versions
+        return changes
+
+    def lemma_history(self, form, upos):
+        return self.db.execute("SELECT l.lemma, s.date, s.path FROM lemmas l JOIN snapshots s ON s.id = l.snapshot "
+                               "WHERE l.form = ? AND l.upos = ? ORDER BY s.date, s.path", (form, upos)).fetchall()
+
+    def stats(self):
+        return {table: self.db.execute("SELECT count(*) FROM %s" % table).fetchone()[0]
+                for table in ("snapshots", "annotations", "occurrences", "lemmas")}
+
+def rows_to_sentence(rows):
+    return parse_conllu(rows + "\n\n").sentences[0]
+
+def print_version_diff(old_rows, new_rows):
+    changes = diff_sentence(rows_to_sentence(old_rows), rows_to_sentence(new_rows))
+    if "tokenization" in changes:
+        print("    tokens: %s" % " ".join(changes["tokenization"][0]))
+        print("        ->  %s" % " ".join(changes["tokenization"][1]))
+        return
+    for word_id, form, column, old_value, new_value in changes["words"]:
+        print("    %s %s %s: %s -> %s" % (word_id, form, column, old_value, new_value))
+
+def versions_text(versions, key):
+    """
+    The text of the most recent version which has a text comment, or else the sentence key
+    """
+    return next((x[2] for x in reversed(versions) if x is not None and x[2]), key)
+
+def print_versions(history, versions, full=False, previous=None):
+    """
+    Print each version, where it was seen, and what changed from the one before
+    """
+    for version_idx, (sha, first, text, rows) in enumerate(versions):
+        print("version %d  %s  first seen %s" % (version_idx + 1, sha[:12], first))
+        for path, date, sent_id in history.sightings(sha):
+            print("  %s  %s#%s" % (date, path, sent_id))
+        if full:
+            print(rows)
+        elif previous is not None:
+            print_version_diff(previous, rows)
+        previous = rows
+    print()
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if is_git_spec(pattern):
+            paths.append(pattern)
+            continue
+        matches = sorted(x for x in glob.glob(pattern) if os.path.isfile(x))
+        if not matches:
+            raise FileNotFoundError("%s matched nothing" % pattern)
+        paths.extend(x for x in matches if x not in paths)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description='A content addressed store of every version of every sentence in the dated batch files')
+    parser.add_argument('--db', default=DEFAULT_DB, help='The sqlite file to keep the history in.  Default %s' % DEFAULT_DB)
+    parser.add_argument('--update', nargs='*', default=None, help='Add these files, globs or REV:path specs to the store.  With no files, the default batch, dependency, lemma and release files')
+    parser.add_argument('--workers', type=int, default=None, help='How many processes to read new files with')
+    parser.add_argument('--sentence', default=None, help='Print every version of the sentence with this text')
+    parser.add_argument('--sent_id', nargs=2, default=None, metavar=('FILE', 'SENT_ID'), help='Print every version of the sentence with this sent_id in this file')
+    parser.add_argument('--changes', nargs=2, default=None, metavar=('START', 'END'), help='Print the sentences which got a new annotation after START and up to END, as YYYY-MM-DD')
+    parser.add_argument('--lemma', nargs=2, default=None, metavar=('WORD', 'UPOS'), help='Print every lemma a word was given in the lemma files')
+    parser.add_argument('--full', action='store_true', default=False, help='Print the whole annotation of each version, not the changes from the previous one')
+    args = parser.parse_args()
+
+    history = AnnotationHistory(args.db)
+    if args.update is not None:
+        paths = expand_paths(args.update if args.update else [x for x in DEFAULT_FILES if glob.glob(x)])
+        workers = args.workers if args.workers is not None else os.cpu_count() or 1
+        added = history.update(paths, workers)
+        print("Added %d snapshots from %d files" % (added, len(paths)), file=sys.stderr)
+
+    if args.sentence or args.sent_id:
+        if args.sentence:
+            key = normalize_text(args.sentence)
+        else:
+            key = history.key_for_sent_id(*args.sent_id)
+            if key is None:
+                raise ValueError("No sentence %s in %s has been stored" % (args.sent_id[1], args.sent_id[0]))
+        versions = history.versions(key)
+        if not versions:
+            raise ValueError("No versions of |%s| have been stored" % key)
+        print("# text = %s" % versions_text(versions, key))
+        print_versions(history, versions, args.full)
+
+    if args.changes:
+        changes = history.changes(*args.changes)
+        for key, versions in sorted(changes.items(), key=lambda x: (x[1][1][1], x[0])):
+            print("# text = %s" % versions_text(versions, key))
+            if versions[0] is None:
+                print("new sentence")
+                print_versions(history, versions[1:], args.full)
+            else:
+                print_versions(history, versions[1:], args.full, previous=versions[0][3])
+        print("%d sentences changed after %s and up to %s" % (len(changes), args.changes[0], args.changes[1]), file=sys.stderr)
+
+    if args.lemma:
+        for lemma, date, path in history.lemma_history(*args.lemma):
+            print("%s\t%s\t%s" % (date, lemma, path))
+
+    if args.update is None and not (args.sentence or args.sent_id or args.changes or args.lemma):
+        for table, count in history.stats().items():
+            print("%8d %s" % (count, table))
+    history.close()
+
+if __name__ == '__main__':
+    main()
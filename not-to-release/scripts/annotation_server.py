@@ -0,0 +1,299 @@
+"""
+A long running Sindhi annotation server which keeps the models loaded
+
+Loading the Stanza models takes longer than parsing a few hundred
+sentences, so scripts which pre-annotate text can send it here
+instead of building their own Pipeline:
+
+  python3 annotation_server.py                        # http on 127.0.0.1:5905
+  python3 annotation_server.py --socket ~/.cache/ud_sindhi_isra/annotate.sock
+
+and then, from another script, see annotation_client.py:
+
+  client = AnnotationClient()
+  conll = client.annotate(["first sentence", "second sentence"])
+
+Requests are POSTed to /annotate as json:
+
+  {"sentences": ["raw text", ...]}
+  {"sentences": [["pre", "tokenized"], ...], "pretokenized": true}
+
+and the reply is {"conllu": [one CoNLL-U string per sentence]}.
+GET /status reports the model and how many requests have been served.
+
+Requests from several clients are queued, and one worker thread
+collects whatever arrives within --max_wait seconds, up to
+--max_batch sentences, into a single call to the pipeline.  Results
+go through the same on-disk cache as CachedPipeline, so a sentence
+which was parsed before is not parsed again.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+from pipeline_cache import CachedPipeline, DEFAULT_CACHE_DIR, sentence_to_conll
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5905
+DEFAULT_PROCESSORS = "tokenize,pos,lemma,depparse"
+DEFAULT_PACKAGE = "default_accurate"
+
+# keeps the cache keys of pretokenized sentences apart from raw text with the same characters
+PRETOKENIZED_PREFIX = "\u0000pretokenized\u0000"
+
+class Request:
+    __slots__ = ("sentences", "pretokenized", "done", "result", "error")
+
+    def __init__(self, sentences, pretokenized):
+        self.sentences = sentences
+        self.pretokenized = pretokenized
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Annotator:
+    """
+    Micro-batches the requests from many threads into calls to one pipeline
+    """
+    def __init__(self, pipe, max_batch=64, max_wait=0.02):
+        self.pipe = pipe
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.requests = 0
+        self.sentences = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.started = time.time()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def annotate(self, sentences, pretokenized=False):
+        """
+        Queue the sentences and wait for their CoNLL-U
+        """
+        request = Request(sentences, pretokenized)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        self.queue.put(None)
+        self.worker.join()
+
+    def next_batch(self):
+        """
+        Wait for one request, then take any others which arrive in the next max_wait seconds
+
+        Returns None once stop() has been called
+        """
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        size = len(first.sentences)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # finish this batch first
+                self.queue.put(None)
+                break
+            batch.append(request)
+            size += len(request.sentences)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            for pretokenized in (False, True):
+                requests = [x for x in batch if x.pretokenized == pretokenized]
+                if requests:
+                    self.process(requests, pretokenized)
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+
+    def process(self, requests, pretokenized):
+        sentences = [sentence for request in requests for sentence in request.sentences]
+        try:
+            if pretokenized:
+                results = self.process_pretokenized(sentences)
+            else:
+                results = self.pipe.process_conll(sentences, self.max_batch)
+        except Exception as e:
+            for request in requests:
+                request.error = e
+                request.done.set()
+            return
+        start = 0
+        for request in requests:
+            request.result = results[start:start+len(request.sentences)]
+            start += len(request.sentences)
+            self.requests += 1
+            self.sentences += len(request.sentences)
+            request.done.set()
+
+    def process_pretokenized(self, sentences):
+        """
+        Tag and parse lists of tokens, skipping the tokenizer
+
+        Uses the same cache as the raw text, with keys marked as pretokenized
+        """
+        cache = self.pipe.cache
+        keys = None
+        results = [None] * len(sentences)
+        if cache is not None:
+            keys, results = self.pipe.lookup([PRETOKENIZED_PREFIX + "\t".join(tokens) for tokens in sentences])
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if missing:
+            from stanza.models.common.doc import Document
+            doc = Document([[{"id": word_idx + 1, "text": token} for word_idx, token in enumerate(sentences[idx])] for idx in missing])
+            processors = ",".join(x for x in self.pipe.processors.split(",") if x.strip() != "tokenize")
+            doc = self.pipe.get_pipeline()(doc, processors=processors)
+            for idx, sentence in zip(missing, doc.sentences):
+                results[idx] = sentence_to_conll(sentence)
+                if cache is not None:
+                    cache.put(keys[idx], results[idx])
+            if cache is not None:
+                cache.evict()
+        return results
+
+    def status(self):
+        return {
+            "lang": self.pipe.lang,
+            "processors": self.pipe.processors,
+            "package": self.pipe.package,
+            "loaded": self.pipe.pipe is not None,
+            "uptime": time.time() - self.started,
+            "requests": self.requests,
+            "sentences": self.sentences,
+            "batches": self.batches,
+            "busy_seconds": self.busy_seconds,
+            "queued": self.queue.qsize(),
+            "cache": self.pipe.cache.stats() if self.pipe.cache is not None else None,
+        }
+
+class AnnotationHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.send_json(404, {"error": "Unknown path %s" % self.path})
+            return
+        self.send_json(200, self.server.annotator.status())
+
+    def do_POST(self):
+        if self.path != "/annotate":
+            self.send_json(404, {"error": "Unknown path %s" % self.path})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            sentences = request["sentences"]
+            pretokenized = bool(request.get("pretokenized", False))
+            if pretokenized:
+                sentences = [x.split() if isinstance(x, str) else list(x) for x in sentences]
+                if any(not tokens for tokens in sentences):
+                    raise ValueError("Pretokenized sentences need at least one token")
+            elif not all(isinstance(x, str) for x in sentences):
+                raise ValueError("Sentences should be strings unless pretokenized is set")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": "Bad request: %s" % e})
+            return
+        try:
+            conll = self.server.annotator.annotate(sentences, pretokenized) if sentences else []
+        except Exception as e:
+            self.send_json(500, {"error": "%s: %s" % (type(e).__name__, e)})
+            return
+        self.send_json(200, {"conllu": conll})
+
+    def address_string(self):
+        # client_address is empty for a unix socket
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class AnnotationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, annotator, verbose=False):
+        self.annotator = annotator
+        self.verbose = verbose
+        super().__init__(address, AnnotationHandler)
+
+class UnixAnnotationServer(AnnotationServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind looks up a host name, which a socket path does not have
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Sindhi annotations from a pipeline which stays loaded')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--socket', default=None, help='Listen on this unix socket instead of http')
+    parser.add_argument('--processors', default=DEFAULT_PROCESSORS, help='Which processors to run')
+    parser.add_argument('--package', default=DEFAULT_PACKAGE, help='Which model package to use')
+    parser.add_argument('--max_batch', type=int, default=64, help='Most sentences to send through the pipeline at once')
+    parser.add_argument('--max_wait', type=float, default=0.02, help='How long to wait for more requests before starting a batch, in seconds')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help='Where to cache the pipeline output')
+    parser.add_argument('--no_cache', dest='cache_dir', action='store_const', const=None, help="Don't cache the pipeline output")
+    parser.add_argument('--verbose', action='store_true', default=False, help='Log every request')
+    args = parser.parse_args()
+
+    pipe = CachedPipeline("sd", processors=args.processors, package=args.package, cache_dir=args.cache_dir)
+    print("Loading the %s %s models" % (args.package, args.processors), file=sys.stderr)
+    pipe.get_pipeline()
+    annotator = Annotator(pipe, args.max_batch, args.max_wait)
+
+    if args.socket:
+        server = UnixAnnotationServer(args.socket, annotator, args.verbose)
+        print("Listening on %s" % args.socket, file=sys.stderr)
+    else:
+        server = AnnotationServer((args.host, args.port), annotator, args.verbose)
+        print("Listening on http://%s:%d" % (args.host, args.port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        annotator.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Sentence level bootstrap confidence intervals
+
+The scores are all computed from counts which can be summed over
+sentences: words correct & total words for an accuracy, or a
+flattened confusion matrix for a kappa.  The caller builds an
+(sentences x counts) array once.  Each resample is then a vector of
+how many times each sentence was drawn, and summing the counts for
+a whole chunk of resamples is a single matrix multiply.
+
+The chunks are spread over several processes.  Each chunk gets its
+own seed from the one seed passed in, so the result only depends on
+the seed and the number of resamples, not the number of workers.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+DEFAULT_RESAMPLES = 10000
+DEFAULT_CHUNK_SIZE = 500
+
+def ratio_statistic(summed):
+    """
+    summed[:, 0] / summed[:, 1], eg correct words / total words
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return summed[:, 0] / summed[:, 1]
+
+def kappa_statistic(summed):
+    """
+    Cohen's kappa of each row, where each row is a flattened KxK confusion matrix
+    """
+    num_labels = int(round(np.sqrt(summed.shape[1])))
+    confusion = summed.reshape(-1, num_labels, num_labels)
+    total = confusion.sum(axis=(1, 2))
+    observed = np.trace(confusion, axis1=1, axis2=2) / total
+    expected = (confusion.sum(axis=1) * confusion.sum(axis=2)).sum(axis=1) / (total * total)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(expected == 1.0, 1.0, (observed - expected) / (1.0 - expected))
+
+def resample_weights(rng, num_sentences, num_resamples):
+    """
+    Return a (num_resamples x num_sentences) array of how often each sentence was drawn
+    """
+    draws = rng.integers(0, num_sentences, size=(num_resamples, num_sentences))
+    draws += np.arange(num_resamples)[:, np.newaxis] * num_sentences
+    return np.bincount(draws.ravel(), minlength=num_resamples * num_sentences).reshape(num_resamples, num_sentences)
+
+def bootstrap_chunk(counts, statistic, num_resamples, seed):
+    rng = np.random.default_rng(seed)
+    weights = resample_weights(rng, counts.shape[0], num_resamples)
+    return statistic(weights.astype(np.float64) @ counts)
+
+def bootstrap(counts, statistic=ratio_statistic, num_resamples=DEFAULT_RESAMPLES, seed=1234, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Return the statistic of each of num_resamples resamples of the rows of counts
+
+    counts is (sentences x M), statistic maps an (resamples x M) array
+    of summed counts to one value per resample.  statistic needs to be
+    a module level function so it can be sent to the worker processes.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    if counts.ndim == 1:
+        counts = counts[:, np.newaxis]
+    chunk_sizes = [min(chunk_size, num_resamples - start) for start in range(0, num_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(chunk_sizes))
+    if workers <= 1:
+        results = [bootstrap_chunk(counts, statistic, size, chunk_seed) for size, chunk_seed in zip(chunk_sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(bootstrap_chunk, [counts] * len(chunk_sizes), [statistic] * len(chunk_sizes), chunk_sizes, seeds))
+    return np.concatenate(results)
+
+def confidence_interval(counts, statistic=ratio_statistic, confidence=0.95, **kwargs):
+    """
+    Return (point estimate, low, high) for the statistic over the rows of counts
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    if counts.ndim == 1:
+        counts = counts[:, np.newaxis]
+    point = statistic(counts.sum(axis=0, keepdims=True))[0]
+    resampled = bootstrap(counts, statistic, **kwargs)
+    resampled = resampled[~np.isnan(resampled)]
+    alpha = (1.0 - confidence) / 2
+    low, high = np.quantile(resampled, [alpha, 1.0 - alpha])
+    return point, low, high
+
+def sentence_counts(sentence_ids, correct, num_sentences=None):
+    """
+    Turn per-word correct flags into a (sentences x 2) array of correct, total
+    """
+    if num_sentences is None:
+        num_sentences = int(sentence_ids.max()) + 1 if len(sentence_ids) > 0 else 0
+    correct = np.bincount(sentence_ids, weights=correct, minlength=num_sentences)
+    total = np.bincount(sentence_ids, minlength=num_sentences)
+    return np.stack([correct, total], axis=1)
+
+def sentence_confusions(sentence_ids, first, second, num_labels, num_sentences=None):
+    """
+    Turn two per-word label arrays into a (sentences x labels*labels) array of confusion matrices
+    """
+    if num_sentences is None:
+        num_sentences = int(sentence_ids.max()) + 1 if len(sentence_ids) > 0 else 0
+    flat = (sentence_ids.astype(np.int64) * num_labels + first) * num_labels + second
+    return np.bincount(flat, minlength=num_sentences * num_labels * num_labels).reshape(num_sentences, num_labels * num_labels)
+
+def format_interval(name, interval, confidence=0.95):
+    point, low, high = interval
+    return "%s %.4f  %d%% CI [%.4f, %.4f]" % (name, point, int(round(confidence * 100)), low, high)
@@ -0,0 +1,417 @@
+"""
+Build the released train, dev and test files from a manifest
+
+release_manifest.json lists the lemma files and, for each split in
+priority order, the output file and the source files which go into it.
+A source is a path or a glob, relative to the manifest, or an object
+with a path and a sent_id_prefix for files whose sent_ids would clash
+with another file's.  Each source file goes to the first split which
+lists it, so "../xpos_features/*" in train does not pick up the test
+and dev files again.
+
+Each source file is read on its own: the known lemmas are merged in,
+as merge_lemmas.py does, sentences with blank required columns are
+skipped, and the line endings are made uniform.  A sentence already in
+an earlier split (by normalized text, see normalize.py) is dropped, so
+a test sentence never leaks into train.  Each split is then checked
+with validate.py and written, and the sha256 of every input and output
+goes in the checksum file named in the manifest.  If validation finds
+a problem, or two sentences share a sent_id, nothing is written unless
+--force is given, and --check fails.
+
+The result for each source file is cached under the sha256 of its
+contents and of the lemma files, and the validation of each output
+under the sha256 of the output, so a rebuild only rereads the files
+which changed.  The same inputs always give the same bytes.
+
+  python3 build_release.py                 # rebuild the release files
+  python3 build_release.py --check         # exit 1 if the release files are out of date or invalid
+  python3 build_release.py --output_dir /tmp/release
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+
+from check_consistency import sentence_key
+from conllu_io import read_conllu
+from merge_lemmas import find_lemma, read_tsv_files
+from pipeline_cache import hash_file
+from profiling import add_profile_args, profiler_from_args
+
+DEFAULT_MANIFEST = "release_manifest.json"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ud_sindhi_isra", "release")
+
+# part of every cache key.  change it whenever process_source changes what it produces
+BUILD_VERSION = 2
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class Source:
+    __slots__ = ("path", "sent_id_prefix", "sha")
+
+    def __init__(self, path, sent_id_prefix=""):
+        self.path = path
+        self.sent_id_prefix = sent_id_prefix
+        self.sha = None
+
+class Split:
+    __slots__ = ("name", "output", "sources")
+
+    def __init__(self, name, output, sources):
+        self.name = name
+        self.output = output
+        self.sources = sources
+
+class Manifest:
+    """
+    The splits, lemma files and settings from a manifest file, with the paths made relative to the current directory
+    """
+    def __init__(self, filename):
+        with open(filename, encoding="utf-8") as fin:
+            data = json.load(fin)
+        self.filename = filename
+        base = os.path.dirname(filename)
+
+        def resolve(path):
+            return os.path.normpath(os.path.join(base, path))
+
+        self.lemma_files = []
+        for pattern in data.get("lemmas", []):
+            matches = sorted(glob.glob(resolve(pattern)))
+            if not matches:
+                raise FileNotFoundError("Lemma files %s in %s matched nothing" % (pattern, filename))
+            self.lemma_files.extend(matches)
+        self.required_columns = tuple(data.get("required_columns", ()))
+        self.validate = data.get("validate", True)
+        self.checksums = resolve(data["checksums"]) if data.get("checksums") else None
+
+        # glob matches skip anything named explicitly, wherever it is named
+        explicit = set()
+        for split in data["splits"]:
+            for source in split["sources"]:
+                path = source if isinstance(source, str) else source["path"]
+                if not glob.has_magic(path):
+                    explicit.add(resolve(path))
+
+        self.splits = []
+        assigned = {}
+        for split in data["splits"]:
+            sources = []
+            for source in split["sources"]:
+                if isinstance(source, str):
+                    source = {"path": source}
+                pattern = resolve(source["path"])
+                if glob.has_magic(source["path"]):
+                    matches = [x for x in sorted(glob.glob(pattern)) if os.path.isfile(x) and x not in explicit]
+                else:
+                    if not os.path.isfile(pattern):
+                        raise FileNotFoundError("Source %s in %s does not exist" % (source["path"], filename))
+                    matches = [pattern]
+                if not matches:
+                    raise FileNotFoundError("Source %s in %s matched nothing" % (source["path"], filename))
+                for path in matches:
+                    if path in assigned:
+                        if assigned[path] == split["name"]:
+                            continue
+                        if not glob.has_magic(source["path"]):
+                            raise ValueError("%s is listed in both %s and %s" % (path, assigned[path], split["name"]))
+                        continue
+                    assigned[path] = split["name"]
+                    sources.append(Source(path, source.get("sent_id_prefix", "")))
+            self.splits.append(Split(split["name"], resolve(split["output"]), sources))
+
+    @property
+    def sources(self):
+        return [source for split in self.splits for source in split.sources]
+
+def process_source(path, sent_id_prefix, lemma_files, required_columns):
+    """
+    Read one source file and return its sentences as (key, sent_id, number of words, text) plus the number skipped
+
+    Reads the lemma files itself, so that it can run in another process
+    without the lemma tables being sent to it
+    """
+    lemmas = read_tsv_files(lemma_files)
+    doc = read_conllu(path)
+    sentences = []
+    skipped = 0
+    for sentence in doc.sentences:
+        words = sentence.words
+        if any(getattr(word, column) == "_" for word in words for column in required_columns):
+            skipped += 1
+            continue
+        for word in words:
+            lemma = find_lemma(word.form, word.upos, lemmas)
+            if lemma is not None:
+                word.lemma = lemma
+        if sent_id_prefix and sentence.sent_id is not None:
+            sentence.set_comment("sent_id", sent_id_prefix + sentence.sent_id)
+        sentence.newline = "\n"
+        sentence.separator = "\n\n"
+        sentences.append((sentence_key(sentence), sentence.sent_id, len(words), sentence.to_text()))
+    return {"sentences": sentences, "skipped": skipped}
+
+class SourceCache:
+    """
+    The processed sentences of each source file, keyed by everything which goes into them
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.used = set()
+
+    def key(self, source, lemma_hash, required_columns):
+        return hash_text(json.dumps([BUILD_VERSION, source.sha, source.sent_id_prefix, lemma_hash, list(required_columns)]))
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, "sources", key + ".json")
+
+    def get(self, key):
+        self.used.add(key)
+        if self.cache_dir is None or not os.path.exists(self.path(key)):
+            return None
+        with open(self.path(key), encoding="utf-8") as fin:
+            return json.load(fin)
+
+    def put(self, key, result):
+        if self.cache_dir is None:
+            return
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        # written to a temp file first, so an interrupted build never leaves half a result
+        temp = self.path(key) + ".tmp"
+        with open(temp, "w", encoding="utf-8") as fout:
+            json.dump(result, fout, ensure_ascii=False)
+        os.replace(temp, self.path(key))
+
+    def evict(self):
+        """
+        Remove the results for old versions of the source files
+        """
+        if self.cache_dir is None:
+            return
+        for filename in glob.glob(os.path.join(self.cache_dir, "sources", "*.json")):
+            if os.path.split(filename)[1][:-5] not in self.used:
+                os.remove(filename)
+
+def read_sources(manifest, cache, workers):
+    """
+    Return {path: result of process_source} for every source, rereading only the ones not in the cache
+    """
+    lemma_hash = hash_text(json.dumps([[os.path.split(x)[1], hash_file(x)] for x in manifest.lemma_files]))
+    results = {}
+    missing = []
+    for source in manifest.sources:
+        source.sha = hash_file(source.path)
+        key = cache.key(source, lemma_hash, manifest.required_columns)
+        result = cache.get(key)
+        if result is None:
+            missing.append((source, key))
+        else:
+            results[source.path] = result
+
+    args = [(source.path, source.sent_id_prefix, manifest.lemma_files, manifest.required_columns) for source, _ in missing]
+    if workers <= 1 or len(missing) <= 1:
+        processed = [process_source(*x) for x in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            processed = list(executor.map(process_source, *zip(*args)))
+    for (source, key), result in zip(missing, processed):
+        cache.put(key, result)
+        results[source.path] = result
+    return results, len(missing)
+
+class SplitResult:
+    __slots__ = ("split", "texts", "sentences", "words", "skipped", "duplicates", "sha")
+
+    def __init__(self, split):
+        self.split = split
+        self.texts = []
+        self.sentences = 0
+        self.words = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.sha = None
+
+    def text(self):
+        return "".join(self.texts)
+
+def assemble(manifest, results):
+    """
+    Put the sentences in their splits, dropping any sentence already in an earlier split or earlier in the same one
+
+    Returns the SplitResults and a list of (sent_id, split, split) for sent_ids used more than once
+    """
+    seen = set()
+    sent_ids = {}
+    clashes = []
+    split_results = []
+    for split in manifest.splits:
+        split_result = SplitResult(split)
+        for source in split.sources:
+            result = results[source.path]
+            split_result.skipped += result["skipped"]
+            for key, sent_id, num_words, text in result["sentences"]:
+                if key in seen:
+                    split_result.duplicates += 1
+                    continue
+                seen.add(key)
+                if sent_id in sent_ids:
+                    clashes.append((sent_id, sent_ids[sent_id], "%s (%s)" % (split.name, source.path)))
+                else:
+                    sent_ids[sent_id] = "%s (%s)" % (split.name, source.path)
+                split_result.texts.append(text)
+                split_result.sentences += 1
+                split_result.words += num_words
+        split_result.sha = hash_text(split_result.text())
+        split_results.append(split_result)
+    return split_results, clashes
+
+def validate_split(text, cache_dir):
+    """
+    Run validate.py on the text of a split, returning the number of problem sentences and what it printed
+    """
+    # validate.py is part of the key, so new checks are run over unchanged splits
+    sha = hash_text(text + hash_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "validate.py")))
+    path = os.path.join(cache_dir, "validation", sha + ".json") if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as fin:
+            result = json.load(fin)
+        return result["problems"], result["report"]
+
+    # stanza is slow to import, so it is only loaded when something needs validating
+    from stanza.utils.conll import CoNLL
+    from validate import validate
+
+    doc = CoNLL.conll2doc(input_str=text, keep_line_numbers=True)
+    report = io.StringIO()
+    with redirect_stdout(report):
+        problems = validate(doc)
+    result = {"problems": len(problems), "report": report.getvalue()}
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fout:
+            json.dump(result, fout, ensure_ascii=False)
+    return result["problems"], result["report"]
+
+def file_sha(filename):
+    if not os.path.exists(filename):
+        return None
+    return hash_file(filename)
+
+def build_checksums(manifest, split_results, outputs):
+    checksums = {
+        "manifest": hash_file(manifest.filename),
+        "lemmas": {path: hash_file(path) for path in manifest.lemma_files},
+        "sources": {source.path: source.sha for source in manifest.sources},
+        "outputs": {},
+    }
+    for split_result, output in zip(split_results, outputs):
+        checksums["outputs"][output] = {
+            "split": split_result.split.name,
+            "sha256": split_result.sha,
+            "sentences": split_result.sentences,
+            "words": split_result.words,
+        }
+    return json.dumps(checksums, ensure_ascii=False, indent=1, sort_keys=True) + "\n"
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Build the released train, dev and test files from a manifest')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='Which manifest to build')
+    parser.add_argument('--output_dir', default=None, help='Write the splits and checksums here instead of where the manifest says')
+    parser.add_argument('--check', action='store_true', default=False, help="Don't write anything, just exit with 1 if the release files differ from a fresh build or the build has problems")
+    parser.add_argument('--force', action='store_true', default=False, help="Write the release even if validation finds a problem or two sentences share a sent_id")
+    parser.add_argument('--no_validate', dest='validate', action='store_false', default=None, help="Don't run validate.py on the splits")
+    parser.add_argument('--show_problems', action='store_true', default=False, help='Print the full validation report for each split')
+    parser.add_argument('--workers', type=int, default=None, help='How many processes to read the changed source files with')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help='Where to cache the processed source files and validation results')
+    parser.add_argument('--no_cache', dest='cache_dir', action='store_const', const=None, help="Don't cache anything")
+    add_profile_args(parser)
+    args = parser.parse_args(args)
+    profiler = profiler_from_args(args, "build_release")
+
+    manifest = Manifest(args.manifest)
+    cache = SourceCache(args.cache_dir)
+    with profiler.stage("read"):
+        workers = args.workers if args.workers is not None else min(os.cpu_count() or 1, len(manifest.sources))
+        results, reread = read_sources(manifest, cache, workers)
+    print("%d source files, %d reread, %d lemma files" % (len(manifest.sources), reread, len(manifest.lemma_files)), file=sys.stderr)
+
+    with profiler.stage("assemble") as stage:
+        split_results, clashes = assemble(manifest, results)
+        for split_result in split_results:
+            stage.add(split_result.sentences, split_result.words)
+    for split_result in split_results:
+        print("%-6s %5d sentences %6d words from %d files  (%d already in an earlier split or file, %d missing a required column)" %
+              (split_result.split.name, split_result.sentences, split_result.words, len(split_result.split.sources), split_result.duplicates, split_result.skipped), file=sys.stderr)
+    for sent_id, first, second in clashes[:10]:
+        print("sent_id %s is used in %s and %s" % (sent_id, first, second), file=sys.stderr)
+    if len(clashes) > 10:
+        print("... %d sent_ids are used more than once" % len(clashes), file=sys.stderr)
+
+    failed = bool(clashes)
+    do_validate = manifest.validate if args.validate is None else args.validate
+    if do_validate:
+        with profiler.stage("validate"):
+            for split_result in split_results:
+                problems, report = validate_split(split_result.text(), args.cache_dir)
+                if problems:
+                    failed = True
+                    print("%s: validate.py found problems in %d sentences" % (split_result.split.name, problems), file=sys.stderr)
+                    if args.show_problems:
+                        print(report, file=sys.stderr)
+
+    if args.output_dir:
+        outputs = [os.path.join(args.output_dir, os.path.split(x.split.output)[1]) for x in split_results]
+        checksums_path = os.path.join(args.output_dir, os.path.split(manifest.checksums)[1]) if manifest.checksums else None
+    else:
+        outputs = [x.split.output for x in split_results]
+        checksums_path = manifest.checksums
+    checksums = build_checksums(manifest, split_results, outputs)
+
+    if args.check:
+        stale = [output for split_result, output in zip(split_results, outputs) if file_sha(output) != split_result.sha]
+        if checksums_path and file_sha(checksums_path) != hash_text(checksums):
+            stale.append(checksums_path)
+        for output in stale:
+            print("%s is out of date" % output, file=sys.stderr)
+        profiler.finish()
+        if stale or failed:
+            sys.exit(1)
+        return
+
+    if failed and not args.force:
+        print("Not writing the release because of the problems above.  Use --force to write it anyway", file=sys.stderr)
+        profiler.finish()
+        sys.exit(1)
+
+    with profiler.stage("write"):
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        written = []
+        for split_result, output in zip(split_results, outputs):
+            # an unchanged file is left alone, so its timestamp does not change either
+            if file_sha(output) == split_result.sha:
+                continue
+            with open(output, "w", encoding="utf-8", newline="") as fout:
+                fout.write(split_result.text())
+            written.append(output)
+        if checksums_path and file_sha(checksums_path) != hash_text(checksums):
+            with open(checksums_path, "w", encoding="utf-8", newline="") as fout:
+                fout.write(checksums)
+            written.append(checksums_path)
+    cache.evict()
+    if written:
+        print("Wrote %s" % " ".join(written), file=sys.stderr)
+    else:
+        print("The release is up to date", file=sys.stderr)
+    profiler.finish()
+
+if __name__ == '__main__':
+    main()
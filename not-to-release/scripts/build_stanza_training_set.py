@@ -10,6 +10,12 @@ from stanza.utils.conll import CoNLL
 from stanza.utils.default_paths import get_default_paths
 from stanza.utils.datasets.random_split_conllu import random_split
 
+from normalize import normalize_text
+from profiling import add_profile_args, profiler_from_args
+from select_auxiliary import CorpusProfile, top_indices
+
+EXTRA_LANGUAGES = ('hindi', 'marathi', 'tamil', 'urdu')
+
 def remove_xpos_and_features(doc):
     for sent in doc.sentences:
         for word in sent.words:
@@ -37,13 +43,13 @@ def read_directory(*globs, strip_xpos=True):
     return doc
 
 def filter_duplicates(orig_doc, filter_doc):
-    filter_text = {sent.text.replace(" ", "") for sent in filter_doc.sentences}
+    filter_text = {normalize_text(sent.text) for sent in filter_doc.sentences}
 
     filtered_sentences = []
     filtered_comments = []
 
     for sent in orig_doc.sentences:
-        if sent.text.replace(" ", "") in filter_text:
+        if normalize_text(sent.text) in filter_text:
             continue
         filtered_sentences.append(sent.to_dict())
         filtered_comments.append(sent.comments)
@@ -62,6 +68,43 @@ def random_select(doc, size):
     sentence_comments = [sent.comments for sent in sentences[:size]]
     return Document(sentence_dicts, comments=sentence_comments)
 
+def stanza_columns(*docs):
+    return [([word.text for word in sent.words], [word.upos for word in sent.words], [word.deprel for word in sent.words])
+            for doc in docs for sent in doc.sentences]
+
+def parse_budgets(pieces):
+    budgets = {}
+    for piece in pieces:
+        name, _, size = piece.partition("=")
+        if name not in EXTRA_LANGUAGES or not size.isdigit():
+            raise ValueError("Expected a budget such as hindi=1000 for one of %s, but got %s" % (", ".join(EXTRA_LANGUAGES), piece))
+        budgets[name] = int(size)
+    return budgets
+
+def select_extra_docs(extra_docs, sindhi_docs, budgets, selection):
+    """
+    Cut each extra doc with a budget down to that many sentences
+
+    With selection 'similar', the sentences kept are the ones which score
+    highest against a profile of the Sindhi training sentences (see
+    select_auxiliary.py).  With 'random', they are a random sample
+    """
+    profile = None
+    selected = {}
+    for name, doc in extra_docs.items():
+        size = budgets.get(name)
+        if size is None or size >= len(doc.sentences):
+            selected[name] = doc
+        elif selection == 'random':
+            selected[name] = random_select(doc, size)
+        else:
+            if profile is None:
+                profile = CorpusProfile(stanza_columns(*sindhi_docs))
+            scores, _ = profile.score(stanza_columns(doc), urdu=(name == 'urdu'))
+            kept = top_indices(scores, size)
+            print("Selected %d of %d %s sentences, mean similarity %.3f against %.3f for all of them" % (len(kept), len(doc.sentences), name, scores[kept].mean(), scores.mean()))
+            selected[name] = Document([doc.sentences[idx].to_dict() for idx in kept], comments=[doc.sentences[idx].comments for idx in kept])
+    return selected
 
 def main():
     paths = get_default_paths()
@@ -77,35 +120,45 @@ def main():
     parser.add_argument('--use_marathi', default=False, action='store_true', help="Include Marathi trees in the dataset")
     parser.add_argument('--use_tamil', default=False, action='store_true', help="Include Tamil trees in the dataset")
     parser.add_argument('--use_urdu', default=False, action='store_true', help="Include Urdu trees in the dataset")
+    parser.add_argument('--aux_budget', nargs='+', default=['hindi=1000', 'urdu=1000'], help="How many trees to use from each other language, such as hindi=1000.  A language with no budget is used whole")
+    parser.add_argument('--aux_selection', default='similar', choices=['similar', 'random'], help="Use the trees from the other languages which are most like the Sindhi trees, or a random sample")
 
     parser.add_argument('--dataset_name', default='sd_isra', help='What name to use for the dataset')
     parser.add_argument('--sindhi_train_size', type=int, default=None, help='Only use this many Sindhi trees for train')
     parser.add_argument('--sindhi_dev_size', type=int, default=None, help='Only use this many Sindhi trees for dev')
+    add_profile_args(parser)
     args = parser.parse_args()
+    budgets = parse_budgets(args.aux_budget)
+    profiler = profiler_from_args(args, "build_stanza_training_set")
 
-    noxpos_doc = read_directory(os.path.join(paths["UDBASE_GIT"], "UD_Sindhi-Isra/not-to-release/dependencies/*"))
-    xpos_doc = read_directory(os.path.join(paths["UDBASE_GIT"], "UD_Sindhi-Isra/not-to-release/xpos_features/*"),
-                              os.path.join(paths["UDBASE_GIT"], "UD_Sindhi-Isra/not-to-release/xpos_standard/xpos_tagged_with_features.conllu"), strip_xpos=False)
+    with profiler.stage("read") as stage:
+        noxpos_doc = read_directory(os.path.join(paths["UDBASE_GIT"], "UD_Sindhi-Isra/not-to-release/dependencies/*"))
+        xpos_doc = read_directory(os.path.join(paths["UDBASE_GIT"], "UD_Sindhi-Isra/not-to-release/xpos_features/*"),
+                                  os.path.join(paths["UDBASE_GIT"], "UD_Sindhi-Isra/not-to-release/xpos_standard/xpos_tagged_with_features.conllu"), strip_xpos=False)
+        stage.add_doc(noxpos_doc)
+        stage.add_doc(xpos_doc)
 
     print("%d sentences with xpos and features" % len(xpos_doc.sentences))
     print("%d sentences with no xpos or features" % len(noxpos_doc.sentences))
 
-    noxpos_doc = filter_duplicates(noxpos_doc, xpos_doc)
+    with profiler.stage("dedup") as stage:
+        stage.add_doc(noxpos_doc)
+        noxpos_doc = filter_duplicates(noxpos_doc, xpos_doc)
     print("%d sentences with no xpos or features after filtering duplicates" % len(noxpos_doc.sentences))
 
     extra_docs = {}
-    if args.use_tamil:
-        extra_docs['tamil'] = read_directory(os.path.join(paths["UDBASE"], "UD_Tamil-TTB/ta_ttb-ud-train.conllu"))
-    if args.use_marathi:
-        extra_docs['marathi'] = read_directory(os.path.join(paths["UDBASE"], "UD_Marathi-UFAL/mr_ufal-ud-train.conllu"))
-    if args.use_hindi:
-        hindi_doc = read_directory(os.path.join(paths["UDBASE"], "UD_Hindi-HDTB/hi_hdtb-ud-train.conllu"))
-        hindi_doc = random_select(hindi_doc, 1000)
-        extra_docs['hindi'] = hindi_doc
-    if args.use_urdu:
-        urdu_doc = read_directory(os.path.join(paths["UDBASE"], "UD_Urdu-UDTB/ur_udtb-ud-train.conllu"))
-        urdu_doc = random_select(urdu_doc, 1000)
-        extra_docs['urdu'] = urdu_doc
+    with profiler.stage("read extra") as stage:
+        if args.use_tamil:
+            extra_docs['tamil'] = read_directory(os.path.join(paths["UDBASE"], "UD_Tamil-TTB/ta_ttb-ud-train.conllu"))
+        if args.use_marathi:
+            extra_docs['marathi'] = read_directory(os.path.join(paths["UDBASE"], "UD_Marathi-UFAL/mr_ufal-ud-train.conllu"))
+        # the whole treebanks are read, and cut down to their budgets once the Sindhi training set is known
+        if args.use_hindi:
+            extra_docs['hindi'] = read_directory(os.path.join(paths["UDBASE"], "UD_Hindi-HDTB/hi_hdtb-ud-train.conllu"))
+        if args.use_urdu:
+            extra_docs['urdu'] = read_directory(os.path.join(paths["UDBASE"], "UD_Urdu-UDTB/ur_udtb-ud-train.conllu"))
+        for extra_doc in extra_docs.values():
+            stage.add_doc(extra_doc)
 
     if args.mode == 'pos':
         output_directory = "data/pos"
@@ -113,18 +166,29 @@ def main():
         # read one specific doc with the intention of training on it exactly,
         # so we keep the UPOS close to the original
         if args.retagged:
-            filter_doc = read_directory(args.retagged)
+            with profiler.stage("read") as stage:
+                filter_doc = read_directory(args.retagged)
+                stage.add_doc(filter_doc)
             print("Doc to be tagged, before filtering: %d sentences" % len(filter_doc.sentences))
-            filter_doc = filter_duplicates(filter_doc, xpos_doc)
-            print("Doc to be tagged, after filtering: %d sentences" % len(filter_doc.sentences))
-            noxpos_doc = filter_duplicates(noxpos_doc, filter_doc)
-
-        random.seed(1234)
-        train, dev, test = random_split(xpos_doc, weights=(0.8, 0.1, 0.1))
+            with profiler.stage("dedup") as stage:
+                stage.add_doc(filter_doc)
+                filter_doc = filter_duplicates(filter_doc, xpos_doc)
+                print("Doc to be tagged, after filtering: %d sentences" % len(filter_doc.sentences))
+                stage.add_doc(noxpos_doc)
+                noxpos_doc = filter_duplicates(noxpos_doc, filter_doc)
+
+        with profiler.stage("split") as stage:
+            random.seed(1234)
+            train, dev, test = random_split(xpos_doc, weights=(0.8, 0.1, 0.1))
+            stage.add_doc(xpos_doc)
         print("Split the xpos doc into %d train, %d dev, %d test" % (len(train.sentences), len(dev.sentences), len(test.sentences)))
 
         if args.retagged and args.raw_retagged:
             CoNLL.write_doc2conll(filter_doc, args.raw_retagged)
+        with profiler.stage("select extra") as stage:
+            for extra_doc in extra_docs.values():
+                stage.add_doc(extra_doc)
+            extra_docs = select_extra_docs(extra_docs, [train, noxpos_doc], budgets, args.aux_selection)
         train_datasets = {
             "sd_isra_train.in.conllu": train,
             "sd_isra_noxpos.conllu":   noxpos_doc,
@@ -142,8 +206,10 @@ def main():
         print("%d total training sentences" % len(xpos_doc.sentences))
         remove_xpos_and_features(xpos_doc)
 
-        random.seed(1234)
-        train, dev, test = random_split(xpos_doc, weights=(0.8, 0.1, 0.1))
+        with profiler.stage("split") as stage:
+            random.seed(1234)
+            train, dev, test = random_split(xpos_doc, weights=(0.8, 0.1, 0.1))
+            stage.add_doc(xpos_doc)
         print("Split the combined doc into %d train, %d dev, %d test" % (len(train.sentences), len(dev.sentences), len(test.sentences)))
 
     elif args.mode == 'depparse' or args.mode == 'upos':
@@ -157,12 +223,18 @@ def main():
         else:
             output_directory = paths["DEPPARSE_DATA_DIR"]
 
-        random.seed(1234)
-        train, dev, test = random_split(xpos_doc, weights=(0.8, 0.1, 0.1))
+        with profiler.stage("split") as stage:
+            random.seed(1234)
+            train, dev, test = random_split(xpos_doc, weights=(0.8, 0.1, 0.1))
+            stage.add_doc(xpos_doc)
         print("Split the combined doc into %d train, %d dev, %d test" % (len(train.sentences), len(dev.sentences), len(test.sentences)))
 
         if args.sindhi_train_size is not None:
             train = random_select(train, args.sindhi_train_size)
+        with profiler.stage("select extra") as stage:
+            for extra_doc in extra_docs.values():
+                stage.add_doc(extra_doc)
+            extra_docs = select_extra_docs(extra_docs, [train], budgets, args.aux_selection)
 
         train_datasets = {
             "sd_isra_train.in.conllu": train
@@ -179,24 +251,33 @@ def main():
 
     print("Writing to %s" % output_directory)
     shortname = args.dataset_name
-    CoNLL.write_doc2conll(dev, os.path.join(output_directory, "%s.dev.in.conllu" % shortname))
-    CoNLL.write_doc2conll(test, os.path.join(output_directory, "%s.test.in.conllu" % shortname))
+    with profiler.stage("write") as stage:
+        CoNLL.write_doc2conll(dev, os.path.join(output_directory, "%s.dev.in.conllu" % shortname))
+        CoNLL.write_doc2conll(test, os.path.join(output_directory, "%s.test.in.conllu" % shortname))
+        stage.add_doc(dev)
+        stage.add_doc(test)
     if args.mode == 'lemma':
         train_filename = os.path.join(output_directory, "%s.train.in.conllu" % shortname)
         print("Writing training data to %s" % train_filename)
-        CoNLL.write_doc2conll(train, train_filename)
+        with profiler.stage("write") as stage:
+            CoNLL.write_doc2conll(train, train_filename)
+            stage.add_doc(train)
     else:
         train_filename = os.path.join(output_directory, "%s.train.in.zip" % shortname)
         print("Writing training data to %s" % train_filename)
-        with zipfile.ZipFile(train_filename, "w") as zout:
-            for name in train_datasets:
-                train_doc = train_datasets[name]
-                if len(train_doc.sentences) == 0:
-                    continue
-                with zout.open(name, mode='w') as fout:
-                    with io.TextIOWrapper(fout, encoding="utf-8") as tout:
-                        print("Writing %d sentences from %s to zipfile" % (len(train_doc.sentences), name))
-                        CoNLL.write_doc2conll(train_doc, tout)
+        with profiler.stage("write zip") as stage:
+            with zipfile.ZipFile(train_filename, "w") as zout:
+                for name in train_datasets:
+                    train_doc = train_datasets[name]
+                    if len(train_doc.sentences) == 0:
+                        continue
+                    with zout.open(name, mode='w') as fout:
+                        with io.TextIOWrapper(fout, encoding="utf-8") as tout:
+                            print("Writing %d sentences from %s to zipfile" % (len(train_doc.sentences), name))
+                            CoNLL.write_doc2conll(train_doc, tout)
+                    stage.add_doc(train_doc)
+
+    profiler.finish()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,182 @@
+"""
+Find sentences which are annotated differently in different files
+
+Many sentences are in more than one place: sd_batch_5_600 is in both
+dependencies/ and xpos_features/, sd_780 is split into part_A and
+part_B, the labeled_*.txt batches repeat earlier batches, and the
+released splits were built from all of them.  An edit made in one
+copy does not reach the others.
+
+Every sentence in every conllu file is keyed by its normalized text
+(see normalize.py) in one pass over the files, so the copies of a
+sentence are found without comparing files to each other.  Copies
+with the same words are then compared column by column.  A blank
+column, such as the missing lemmas or heads in the older batches,
+is not counted as a disagreement, and neither is a different sent_id
+on its own, although it is counted in the sent_id column.
+
+  python3 check_consistency.py                       # summary of every pair of files
+  python3 check_consistency.py --details 20          # also show the differing words
+  python3 check_consistency.py --files ../dependencies/sd_780.conllu ../xpos_features/sd_780_part_A.conllu ../xpos_features/sd_780_part_B.conllu
+"""
+
+import argparse
+from collections import Counter
+from collections import defaultdict
+from itertools import combinations
+import sys
+
+from columnar_corpus import find_corpus_files
+from conllu_io import read_conllu
+from normalize import normalize_text, normalize_word
+
+DEFAULT_COLUMNS = ("upos", "head", "deprel", "lemma", "sent_id")
+ALL_COLUMNS = ("upos", "xpos", "feats", "head", "deprel", "lemma", "sent_id")
+# the annotators' raw output, which is expected to disagree with the corrected files
+DEFAULT_EXCLUDE = ("mltwist_dependencies", "agreement")
+
+def sentence_key(sentence):
+    """
+    The normalized text of the sentence, from the text comment or else the tokens
+    """
+    text = sentence.text
+    if text is None:
+        forms = []
+        mwt_end = 0
+        for row in sentence.rows:
+            if row.is_empty:
+                continue
+            if row.is_mwt:
+                mwt_end = int(row.id.split("-")[1])
+                forms.append(row.form)
+            elif int(row.id) > mwt_end:
+                forms.append(row.form)
+        text = " ".join(forms)
+    return normalize_text(text)
+
+def index_sentences(filenames):
+    """
+    Return the docs read from each file and a map from sentence key to (file index, sentence index)
+    """
+    docs = []
+    copies = defaultdict(list)
+    for file_idx, filename in enumerate(filenames):
+        doc = read_conllu(filename)
+        docs.append(doc)
+        for sent_idx, sentence in enumerate(doc.sentences):
+            copies[sentence_key(sentence)].append((file_idx, sent_idx))
+    return docs, copies
+
+def compare_sentences(first, second, columns):
+    """
+    List the (word id, form, column, first value, second value) where two copies disagree
+
+    Returns None if the copies are not tokenized the same way
+    """
+    first_words = first.words
+    second_words = second.words
+    if len(first_words) != len(second_words):
+        return None
+    if any(normalize_word(x.form) != normalize_word(y.form) for x, y in zip(first_words, second_words)):
+        return None
+    differences = []
+    if "sent_id" in columns:
+        first_id, second_id = first.sent_id, second.sent_id
+        if first_id and second_id and first_id != second_id:
+            differences.append(("-", "-", "sent_id", first_id, second_id))
+    for first_word, second_word in zip(first_words, second_words):
+        for column in columns:
+            if column == "sent_id":
+                continue
+            first_value = getattr(first_word, column)
+            second_value = getattr(second_word, column)
+            if first_value == "_" or second_value == "_" or first_value == second_value:
+                continue
+            differences.append((first_word.id, first_word.form, column, first_value, second_value))
+    return differences
+
+class PairSummary:
+    """
+    How the copies shared by two files compare
+    """
+    def __init__(self):
+        self.shared = 0
+        self.tokenization = 0
+        self.divergent = 0
+        self.columns = Counter()
+
+def check_consistency(filenames, columns=DEFAULT_COLUMNS):
+    """
+    Compare every copy of every sentence which is in more than one place
+
+    Returns the docs, the map from sentence key to its copies, a map
+    from (file index, file index) to PairSummary, and a list of the
+    divergent copies as
+    (key, (file index, sentence index), (file index, sentence index), differences)
+    """
+    docs, copies = index_sentences(filenames)
+    pairs = defaultdict(PairSummary)
+    divergent = []
+    for key, places in copies.items():
+        if len(places) < 2:
+            continue
+        for first, second in combinations(places, 2):
+            summary = pairs[(first[0], second[0])]
+            summary.shared += 1
+            differences = compare_sentences(docs[first[0]].sentences[first[1]], docs[second[0]].sentences[second[1]], columns)
+            if differences is None:
+                summary.tokenization += 1
+                continue
+            summary.columns.update({column for _, _, column, _, _ in differences})
+            # a different sent_id on its own is common and is only counted in its column
+            if any(column != "sent_id" for _, _, column, _, _ in differences):
+                summary.divergent += 1
+                divergent.append((key, first, second, differences))
+    return docs, copies, pairs, divergent
+
+def main():
+    parser = argparse.ArgumentParser(description='Find sentences which are annotated differently in different files')
+    parser.add_argument('--files', nargs='+', default=None, help='Which files to compare.  Defaults to every conllu file in the treebank')
+    parser.add_argument('--exclude', nargs='*', default=DEFAULT_EXCLUDE, help='Skip the files with any of these in their path.  By default the raw annotator outputs are skipped')
+    parser.add_argument('--columns', nargs='+', default=DEFAULT_COLUMNS, choices=ALL_COLUMNS, help='Which columns to compare')
+    parser.add_argument('--details', type=int, default=0, help='Print the differing words of this many divergent copies')
+    parser.add_argument('--all_pairs', action='store_true', default=False, help='List every pair of files which share sentences, not just the ones which disagree')
+    parser.add_argument('--check', action='store_true', default=False, help='Exit with 1 if any copies disagree')
+    args = parser.parse_args()
+
+    if args.files:
+        filenames = args.files
+    else:
+        filenames = [x for x in find_corpus_files() if not any(exclude in x for exclude in args.exclude)]
+    docs, copies, pairs, divergent = check_consistency(filenames, args.columns)
+
+    num_sentences = sum(len(doc.sentences) for doc in docs)
+    repeated = sum(1 for places in copies.values() if len(places) > 1)
+    print("%d sentences in %d files, %d distinct texts, %d in more than one place" % (num_sentences, len(filenames), len(copies), repeated))
+    print("%d pairs of copies have different annotations" % len(divergent))
+    print()
+
+    print("%-5s %-5s %-7s %-7s %-9s %s" % ("file", "file", "shared", "retok", "diverge", " ".join("%-8s" % column for column in args.columns)))
+    used = set()
+    for (first, second), summary in sorted(pairs.items(), key=lambda x: (-x[1].divergent, x[0])):
+        if not summary.divergent and not args.all_pairs:
+            continue
+        used.update((first, second))
+        print("%-5d %-5d %-7d %-7d %-9d %s" % (first, second, summary.shared, summary.tokenization, summary.divergent, " ".join("%-8d" % summary.columns[column] for column in args.columns)))
+    print()
+    for file_idx in sorted(used):
+        print("%5d  %s" % (file_idx, filenames[file_idx]))
+
+    for key, first, second, differences in divergent[:args.details]:
+        first_sentence = docs[first[0]].sentences[first[1]]
+        second_sentence = docs[second[0]].sentences[second[1]]
+        print()
+        print("%s  %s (%s)  vs  %s (%s)" % (first_sentence.text, filenames[first[0]], first_sentence.sent_id, filenames[second[0]], second_sentence.sent_id))
+        for word_id, form, column, first_value, second_value in differences:
+            print("  %s %s %s: %s | %s" % (word_id, form, column, first_value, second_value))
+
+    if args.check and divergent:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+A columnar, memory mapped copy of every conllu file in the treebank
+
+Each column of the corpus is one .npy file:
+  form, lemma, upos, xpos, feats, deprel   int32 ids into the vocabularies
+  head, word_id                            int16, head is 0 for root and -1 for _
+  line                                     int32, the line number of each word in its file
+  sent_offsets                             int64, sentence i is words [sent_offsets[i], sent_offsets[i+1])
+  sent_file, sent_id, sent_text            int32, per sentence
+and meta.json holds the vocabularies and the list of files.  Each
+source file is also kept as a segment with its own vocabularies, so
+a rebuild only rereads the files which changed.
+
+Loading only reads meta.json and maps the arrays, so questions such
+as "how many NOUN have no features" become NumPy expressions:
+
+  corpus = load_corpus()
+  noun = corpus.vocab_id("upos", "NOUN")
+  blank = corpus.vocab_id("feats", "_")
+  print(((corpus.upos == noun) & (corpus.feats == blank)).sum())
+
+The corpus is rebuilt from the conllu files whenever one of them
+has changed since the last build.
+
+  python3 columnar_corpus.py            # build or refresh the default copy
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ud_sindhi_isra", "columns")
+
+# relative to the not-to-release/scripts directory, like the rest of the scripts
+DEFAULT_ROOT = ".."
+RELEASED_FILES = ["../../sd_isra-ud-train.conllu", "../../sd_isra-ud-dev.conllu", "../../sd_isra-ud-test.conllu"]
+SKIPPED_EXTENSIONS = (".py", ".tsv", ".docx", ".json", ".npy")
+
+WORD_COLUMNS = ("form", "lemma", "upos", "xpos", "feats", "deprel")
+CONLLU_COLUMN = {"form": 1, "lemma": 2, "upos": 3, "xpos": 4, "feats": 5, "deprel": 7}
+SENTENCE_VOCABS = ("sent_id", "text")
+
+def is_conllu(filename):
+    """
+    Check if the first word line of the file looks like conllu
+    """
+    with open(filename, encoding="utf-8", errors="replace") as fin:
+        for line in fin:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            return len(line.split("\t")) == 10
+    return False
+
+def find_corpus_files(root=DEFAULT_ROOT, released=RELEASED_FILES):
+    """
+    Every conllu file in the not-to-release tree, plus the released splits
+    """
+    filenames = []
+    for filename in sorted(glob.glob(os.path.join(root, "**", "*"), recursive=True)):
+        if not os.path.isfile(filename) or filename.endswith(SKIPPED_EXTENSIONS):
+            continue
+        if is_conllu(filename):
+            filenames.append(filename)
+    filenames.extend(x for x in released if os.path.exists(x))
+    return [os.path.normpath(x) for x in filenames]
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class Interner:
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self.ids = {label: idx for idx, label in enumerate(self.labels)}
+
+    def __call__(self, label):
+        label_id = self.ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.ids[label] = label_id
+            self.labels.append(label)
+        return label_id
+
+def read_columns(filename, interners):
+    """
+    Read one conllu file into python lists of ids
+
+    Multiword token lines and empty nodes are skipped
+    """
+    words = {column: [] for column in WORD_COLUMNS + ("head", "word_id", "line")}
+    sentences = {"length": [], "sent_id": [], "text": []}
+
+    sent_id = None
+    text = None
+    forms = []
+    def finish_sentence():
+        if not forms:
+            return
+        sentences["length"].append(len(forms))
+        sentences["sent_id"].append(interners["sent_id"](sent_id if sent_id is not None else ""))
+        sentences["text"].append(interners["text"](text if text is not None else " ".join(forms)))
+
+    with open(filename, encoding="utf-8") as fin:
+        for line_idx, line in enumerate(fin):
+            line = line.rstrip("\n")
+            if not line.strip():
+                finish_sentence()
+                sent_id, text, forms = None, None, []
+                continue
+            if line.startswith("#"):
+                if line.startswith("# sent_id") and "=" in line:
+                    sent_id = line.split("=", 1)[1].strip()
+                elif line.startswith("# text ") and "=" in line:
+                    text = line.split("=", 1)[1].strip()
+                continue
+            pieces = line.split("\t")
+            if len(pieces) != 10:
+                raise ValueError("%s line %d: expected 10 columns, found %d" % (filename, line_idx+1, len(pieces)))
+            if "-" in pieces[0] or "." in pieces[0]:
+                continue
+            for column in WORD_COLUMNS:
+                words[column].append(interners[column](pieces[CONLLU_COLUMN[column]]))
+            words["head"].append(-1 if pieces[6] == "_" else int(pieces[6]))
+            words["word_id"].append(int(pieces[0]))
+            words["line"].append(line_idx + 1)
+            forms.append(pieces[1])
+    finish_sentence()
+    return words, sentences
+
+def segment_path(corpus_dir, filename):
+    signature = "%s %d %d" % (os.path.abspath(filename), *file_signature(filename))
+    return os.path.join(corpus_dir, "segments", hashlib.sha256(signature.encode("utf-8")).hexdigest() + ".npz")
+
+def load_segment(corpus_dir, filename):
+    """
+    Return the columns of one file with its own vocabularies, reading the file only if it changed since the last build
+    """
+    path = segment_path(corpus_dir, filename)
+    if os.path.exists(path):
+        with np.load(path) as segment:
+            arrays = {key: segment[key] for key in segment.files if key != "vocab"}
+            vocab = json.loads(str(segment["vocab"]))
+        return arrays, vocab, True
+
+    interners = {column: Interner() for column in WORD_COLUMNS + SENTENCE_VOCABS}
+    words, sentences = read_columns(filename, interners)
+    arrays = {column: np.array(words[column], dtype=np.int32) for column in WORD_COLUMNS}
+    arrays["head"] = np.array(words["head"], dtype=np.int16)
+    arrays["word_id"] = np.array(words["word_id"], dtype=np.int16)
+    arrays["line"] = np.array(words["line"], dtype=np.int32)
+    arrays["length"] = np.array(sentences["length"], dtype=np.int64)
+    arrays["sent_id"] = np.array(sentences["sent_id"], dtype=np.int32)
+    arrays["text"] = np.array(sentences["text"], dtype=np.int32)
+    vocab = {column: interners[column].labels for column in interners}
+    os.makedirs(os.path.split(path)[0], exist_ok=True)
+    np.savez(path, vocab=json.dumps(vocab, ensure_ascii=False), **arrays)
+    return arrays, vocab, False
+
+def build_corpus(filenames, corpus_dir=DEFAULT_CORPUS_DIR):
+    """
+    Build the columns for filenames in corpus_dir
+
+    Each file is kept as a segment with its own vocabularies, so only
+    files which changed since the last build are read again.  The
+    segments are then merged by remapping their ids to the combined
+    vocabularies.  Returns the number of files which were reread.
+    """
+    interners = {column: Interner() for column in WORD_COLUMNS + SENTENCE_VOCABS}
+    pieces = {column: [] for column in WORD_COLUMNS + ("head", "word_id", "line", "length", "sent_file", "sent_id", "text")}
+    files = []
+    num_sentences = 0
+    reread = 0
+    used_segments = set()
+    for file_idx, filename in enumerate(filenames):
+        arrays, vocab, cached = load_segment(corpus_dir, filename)
+        used_segments.add(os.path.split(segment_path(corpus_dir, filename))[1])
+        if not cached:
+            reread += 1
+        for column in WORD_COLUMNS + ("sent_id", "text"):
+            remap = np.array([interners[column](label) for label in vocab[column]], dtype=np.int32)
+            pieces[column].append(remap[arrays[column]] if len(arrays[column]) > 0 else arrays[column])
+        for column in ("head", "word_id", "line", "length"):
+            pieces[column].append(arrays[column])
+        pieces["sent_file"].append(np.full(len(arrays["length"]), file_idx, dtype=np.int32))
+        files.append({"path": filename,
+                      "signature": file_signature(filename),
+                      "first_sentence": num_sentences,
+                      "num_sentences": len(arrays["length"])})
+        num_sentences += len(arrays["length"])
+
+    def concatenate(column, dtype):
+        if not pieces[column]:
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate(pieces[column]).astype(dtype, copy=False)
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    for column in WORD_COLUMNS:
+        np.save(os.path.join(corpus_dir, column + ".npy"), concatenate(column, np.int32))
+    np.save(os.path.join(corpus_dir, "head.npy"), concatenate("head", np.int16))
+    np.save(os.path.join(corpus_dir, "word_id.npy"), concatenate("word_id", np.int16))
+    np.save(os.path.join(corpus_dir, "line.npy"), concatenate("line", np.int32))
+    offsets = np.zeros(num_sentences + 1, dtype=np.int64)
+    np.cumsum(concatenate("length", np.int64), out=offsets[1:])
+    np.save(os.path.join(corpus_dir, "sent_offsets.npy"), offsets)
+    np.save(os.path.join(corpus_dir, "sent_file.npy"), concatenate("sent_file", np.int32))
+    np.save(os.path.join(corpus_dir, "sent_id.npy"), concatenate("sent_id", np.int32))
+    np.save(os.path.join(corpus_dir, "sent_text.npy"), concatenate("text", np.int32))
+
+    # segments for old versions of the files are no longer needed
+    for segment in glob.glob(os.path.join(corpus_dir, "segments", "*.npz")):
+        if os.path.split(segment)[1] not in used_segments:
+            os.remove(segment)
+
+    build_id = hashlib.sha256(json.dumps([[x["path"], x["signature"]] for x in files]).encode("utf-8")).hexdigest()
+    meta = {
+        "build_id": build_id,
+        "files": files,
+        "vocab": {column: interners[column].labels for column in interners},
+    }
+    # written last, so an interrupted build is never mistaken for a finished one
+    with open(os.path.join(corpus_dir, "meta.json"), "w", encoding="utf-8") as fout:
+        json.dump(meta, fout, ensure_ascii=False)
+    return reread
+
+class ColumnarCorpus:
+    def __init__(self, corpus_dir=DEFAULT_CORPUS_DIR):
+        self.corpus_dir = corpus_dir
+        with open(os.path.join(corpus_dir, "meta.json"), encoding="utf-8") as fin:
+            meta = json.load(fin)
+        self.build_id = meta["build_id"]
+        self.files = meta["files"]
+        self.vocab = meta["vocab"]
+        self._vocab_ids = {}
+        for column in WORD_COLUMNS + ("head", "word_id", "line", "sent_offsets", "sent_file", "sent_id", "sent_text"):
+            setattr(self, column, np.load(os.path.join(corpus_dir, column + ".npy"), mmap_mode="r"))
+
+    @property
+    def num_words(self):
+        return len(self.form)
+
+    @property
+    def num_sentences(self):
+        return len(self.sent_offsets) - 1
+
+    @property
+    def filenames(self):
+        return [x["path"] for x in self.files]
+
+    def vocab_id(self, column, label):
+        """
+        The id of label in column, or -1 if it never occurs
+        """
+        if column not in self._vocab_ids:
+            self._vocab_ids[column] = {label: idx for idx, label in enumerate(self.vocab[column])}
+        return self._vocab_ids[column].get(label, -1)
+
+    def labels(self, column, ids):
+        vocab = self.vocab[column]
+        return [vocab[x] for x in ids]
+
+    def word_sentence(self):
+        """
+        The sentence index of every word
+        """
+        return np.repeat(np.arange(self.num_sentences), np.diff(self.sent_offsets))
+
+    def head_index(self):
+        """
+        The corpus position of the head of every word, or -1 for root and unknown heads
+        """
+        heads = np.asarray(self.head, dtype=np.int64)
+        starts = np.repeat(self.sent_offsets[:-1], np.diff(self.sent_offsets))
+        return np.where(heads > 0, starts + heads - 1, -1)
+
+    def sentence_words(self, sent_idx):
+        return slice(int(self.sent_offsets[sent_idx]), int(self.sent_offsets[sent_idx + 1]))
+
+    def sentence_file(self, sent_idx):
+        return self.files[self.sent_file[sent_idx]]["path"]
+
+    def sentence_id(self, sent_idx):
+        return self.vocab["sent_id"][self.sent_id[sent_idx]]
+
+    def sentence_text(self, sent_idx):
+        return self.vocab["text"][self.sent_text[sent_idx]]
+
+    def is_stale(self, filenames):
+        if [x["path"] for x in self.files] != list(filenames):
+            return True
+        return any(x["signature"] != file_signature(x["path"]) for x in self.files)
+
+def load_corpus(corpus_dir=DEFAULT_CORPUS_DIR, filenames=None, rebuild=True):
+    """
+    Map the corpus in corpus_dir, building it first if it is missing or out of date
+    """
+    if filenames is None:
+        filenames = find_corpus_files()
+    if os.path.exists(os.path.join(corpus_dir, "meta.json")):
+        corpus = ColumnarCorpus(corpus_dir)
+        if not rebuild or not corpus.is_stale(filenames):
+            return corpus
+    build_corpus(filenames, corpus_dir)
+    return ColumnarCorpus(corpus_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a columnar copy of all of the conllu files')
+    parser.add_argument('--corpus_dir', default=DEFAULT_CORPUS_DIR, help='Where to write the columns')
+    parser.add_argument('--force', action='store_true', default=False, help='Rebuild even if no file changed')
+    args = parser.parse_args()
+
+    filenames = find_corpus_files()
+    if args.force:
+        reread = build_corpus(filenames, args.corpus_dir)
+        print("Reread %d files" % reread, file=sys.stderr)
+    corpus = load_corpus(args.corpus_dir, filenames)
+    print("%d files, %d sentences, %d words in %s" % (len(corpus.files), corpus.num_sentences, corpus.num_words, args.corpus_dir), file=sys.stderr)
+    for column in WORD_COLUMNS:
+        print("  %-7s %6d distinct" % (column, len(corpus.vocab[column])), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+Show what changed in the annotation between two versions of a conllu file
+
+A line diff of a conllu file is mostly noise when the sentences were
+renumbered, as renumber_780.py did, or reordered.  Here the sentences
+of the two versions are matched by their normalized text (see
+normalize.py), in one pass over each version, and only the changes to
+the annotation are reported: the words of a sentence, if it was
+retokenized, and otherwise the UPOS, XPOS, features, head, deprel and
+lemma of each word.  A sentence which is only in one version is
+reported as added or removed.  A changed sent_id is counted, but not
+listed as a change.
+
+A version is a file, or REV:path for the file at a git revision:
+
+  python3 conllu_diff.py old.conllu new.conllu
+  python3 conllu_diff.py HEAD~1:../dependencies/sd_780.conllu ../dependencies/sd_780.conllu
+  python3 conllu_diff.py --git HEAD~1 HEAD           # every conllu file which changed between two commits
+  python3 conllu_diff.py --git HEAD --summary        # every conllu file changed since HEAD in the working tree
+  python3 conllu_diff.py --git HEAD~1 HEAD --json changes.json
+"""
+
+import argparse
+from bisect import bisect_left
+from collections import Counter
+import json
+import os
+import subprocess
+import sys
+
+from check_consistency import sentence_key
+from conllu_io import parse_conllu, read_conllu
+
+COLUMNS = ("upos", "xpos", "feats", "head", "deprel", "lemma")
+
+# far bigger than any of the treebank files.  anything larger is not read when diffing revisions
+MAX_CONLLU_BYTES = 16 * 1024 * 1024
+
+def is_git_spec(spec):
+    return ":" in spec and not os.path.exists(spec)
+
+def git_toplevel():
+    return subprocess.run(["git", "rev-parse", "--show-toplevel"], check=True, capture_output=True, text=True).stdout.strip()
+
+def git_blob_sizes(specs):
+    """
+    Look up REV:path blobs with one git cat-file process, returning {spec: size}, or None for a missing file or anything but a blob
+    """
+    if not specs:
+        return {}
+    process = subprocess.run(["git", "cat-file", "--batch-check"], input="".join(spec + "\n" for spec in specs).encode("utf-8"),
+                             check=True, capture_output=True)
+    sizes = {}
+    for spec, header in zip(specs, process.stdout.decode("utf-8").split("\n")):
+        pieces = header.split()
+        sizes[spec] = int(pieces[2]) if len(pieces) == 3 and pieces[1] == "blob" else None
+    return sizes
+
+def read_git_blobs(specs):
+    """
+    Read REV:path blobs with one git cat-file process, returning {spec: text}, or None for a missing file
+
+    Bytes which are not utf-8 are replaced rather than raising an error
+    """
+    if not specs:
+        return {}
+    process = subprocess.run(["git", "cat-file", "--batch"], input="".join(spec + "\n" for spec in specs).encode("utf-8"),
+                             check=True, capture_output=True)
+    output = process.stdout
+    blobs = {}
+    position = 0
+    for spec in specs:
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].decode("utf-8")
+        position = header_end + 1
+        if header.endswith(" missing") or header.endswith(" ambiguous"):
+            blobs[spec] = None
+            continue
+        size = int(header.split()[2])
+        blobs[spec] = output[position:position+size].decode("utf-8", errors="replace")
+        # each blob is followed by a newline
+        position += size + 1
+    return blobs
+
+def read_version(spec, blobs=None):
+    """
+    Read a file or REV:path into a ConlluDoc.  A file which does not exist in that version is an empty doc
+    """
+    if is_git_spec(spec):
+        text = blobs[spec] if blobs is not None else read_git_blobs([spec])[spec]
+        return parse_conllu(text if text is not None else "", spec)
+    if not os.path.exists(spec):
+        return parse_conllu("", spec)
+    return read_conllu(spec)
+
+def looks_like_conllu(text):
+    """
+    Check if the first word line of the text has the ten conllu columns, as columnar_corpus.is_conllu does for files
+    """
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        return len(line.split("\t")) == 10
+    return False
+
+def align_sentences(old_doc, new_doc):
+    """
+    Match the sentences of the two docs by normalized text
+
+    Repeated sentences are matched in the order they appear.  Returns
+    the (old index, new index) pairs in the order of the new doc, the
+    old indices with no match and the new indices with no match
+    """
+    old_indices = {}
+    for sent_idx, sentence in enumerate(old_doc.sentences):
+        old_indices.setdefault(sentence_key(sentence), []).append(sent_idx)
+    used = Counter()
+    pairs = []
+    added = []
+    for sent_idx, sentence in enumerate(new_doc.sentences):
+        key = sentence_key(sentence)
+        candidates = old_indices.get(key)
+        if candidates is None or used[key] >= len(candidates):
+            added.append(sent_idx)
+            continue
+        pairs.append((candidates[used[key]], sent_idx))
+        used[key] += 1
+    matched = {old_idx for old_idx, _ in pairs}
+    removed = [sent_idx for sent_idx in range(len(old_doc.sentences)) if sent_idx not in matched]
+    return pairs, removed, added
+
+def diff_sentence(old_sentence, new_sentence, columns=COLUMNS):
+    """
+    Return the changes between two copies of a sentence
+
+    If the words differ, the change is a tokenization change, and is
+    returned as {"tokenization": [old forms, new forms]}.  Otherwise
+    it is {"words": [(word id, form, column, old value, new value), ...]}
+    """
+    old_words = old_sentence.words
+    new_words = new_sentence.words
+    old_forms = [word.form for word in old_words]
+    new_forms = [word.form for word in new_words]
+    if old_forms != new_forms:
+        return {"tokenization": [old_forms, new_forms]}
+    changes = []
+    for old_word, new_word in zip(old_words, new_words):
+        for column in columns:
+            old_value = getattr(old_word, column)
+            new_value = getattr(new_word, column)
+            if old_value != new_value:
+                changes.append((new_word.id, new_word.form, column, old_value, new_value))
+    return {"words": changes}
+
+def count_moved(pairs):
+    """
+    The fewest matched sentences which have to move to put the new version in the old order
+
+    That is every sentence outside the longest run of pairs whose old
+    indices increase, found in O(n log n) with patience sorting
+    """
+    # tails[n] is the smallest old index which ends an increasing run of n+1 pairs
+    tails = []
+    for old_idx, _ in pairs:
+        idx = bisect_left(tails, old_idx)
+        if idx == len(tails):
+            tails.append(old_idx)
+        else:
+            tails[idx] = old_idx
+    return len(pairs) - len(tails)
+
+class FileDiff:
+    """
+    The changes between two versions of one file
+    """
+    def __init__(self, old_name, new_name, old_doc, new_doc, columns=COLUMNS):
+        self.old_name = old_name
+        self.new_name = new_name
+        self.old_sentences = len(old_doc.sentences)
+        self.new_sentences = len(new_doc.sentences)
+        pairs, removed, added = align_sentences(old_doc, new_doc)
+        self.matched = len(pairs)
+        self.removed = [self.describe(old_doc.sentences[x], x) for x in removed]
+        self.added = [self.describe(new_doc.sentences[x], x) for x in added]
+        self.renamed = 0
+        self.reordered = count_moved(pairs)
+        self.retokenized = 0
+        self.column_counts = Counter()
+        self.changed = []
+        for old_idx, new_idx in pairs:
+            old_sentence = old_doc.sentences[old_idx]
+            new_sentence = new_doc.sentences[new_idx]
+            if old_sentence.sent_id != new_sentence.sent_id:
+                self.renamed += 1
+            changes = diff_sentence(old_sentence, new_sentence, columns)
+            if "tokenization" in changes:
+                self.retokenized += 1
+            elif changes["words"]:
+                self.column_counts.update(column for _, _, column, _, _ in changes["words"])
+            else:
+                continue
+            entry = self.describe(new_sentence, new_idx)
+            entry["old_sent_id"] = old_sentence.sent_id
+            entry["old_index"] = old_idx
+            entry.update(changes)
+            self.changed.append(entry)
+
+    @staticmethod
+    def describe(sentence, sent_idx):
+        return {"sent_id": sentence.sent_id, "index": sent_idx, "text": sentence.text}
+
+    def is_empty(self):
+        return not (self.changed or self.added or self.removed)
+
+    def to_json(self):
+        return {
+            "old": self.old_name,
+            "new": self.new_name,
+            "old_sentences": self.old_sentences,
+            "new_sentences": self.new_sentences,
+            "matched": self.matched,
+            "renamed": self.renamed,
+            "reordered": self.reordered,
+            "retokenized": self.retokenized,
+            "columns": dict(self.column_counts),
+            "added": self.added,
+            "removed": self.removed,
+            "changed": self.changed,
+        }
+
+def git_changed_files(old_rev, new_rev=None):
+    """
+    The paths, relative to the top of the repo, which differ between the two revisions, or between old_rev and the working tree
+    """
+    command = ["git", "diff", "--name-only", "-z", old_rev]
+    if new_rev is not None:
+        command.append(new_rev)
+    output = subprocess.run(command, check=True, capture_output=True, cwd=git_toplevel()).stdout.decode("utf-8")
+    return [x for x in output.split("\0") if x]
+
+def diff_git_revisions(old_rev, new_rev=None, columns=COLUMNS):
+    """
+    Diff every conllu file which changed between two revisions, or between old_rev and the working tree
+    """
+    top = git_toplevel()
+    paths = git_changed_files(old_rev, new_rev)
+    revs = [old_rev] if new_rev is None else [old_rev, new_rev]
+    # the sizes are checked first, so a large binary file is never read
+    sizes = git_blob_sizes(["%s:%s" % (rev, path) for rev in revs for path in paths])
+    paths = [path for path in paths if all((sizes["%s:%s" % (rev, path)] or 0) <= MAX_CONLLU_BYTES for rev in revs)]
+    old_specs = ["%s:%s" % (old_rev, path) for path in paths]
+    blobs = read_git_blobs(old_specs)
+    if new_rev is not None:
+        new_specs = ["%s:%s" % (new_rev, path) for path in paths]
+        blobs.update(read_git_blobs(new_specs))
+    diffs = []
+    for idx, path in enumerate(paths):
+        old_text = blobs[old_specs[idx]]
+        if new_rev is not None:
+            new_name = new_specs[idx]
+            new_text = blobs[new_name]
+        else:
+            new_name = os.path.relpath(os.path.join(top, path))
+            new_text = None
+            if os.path.isfile(new_name) and os.path.getsize(new_name) <= MAX_CONLLU_BYTES:
+                with open(new_name, encoding="utf-8", errors="replace", newline="") as fin:
+                    new_text = fin.read()
+        if not any(text is not None and looks_like_conllu(text) for text in (old_text, new_text)):
+            continue
+        old_doc = parse_conllu(old_text or "", old_specs[idx])
+        new_doc = parse_conllu(new_text or "", new_name)
+        diffs.append(FileDiff(old_specs[idx], new_name, old_doc, new_doc, columns))
+    return diffs
+
+def print_summary(diffs, columns):
+    header = "%7s %7s %7s %7s %7s %7s %7s  %s  %s" % ("old", "new", "added", "removed", "renamed", "moved", "retok", " ".join("%7s" % x for x in columns), "file")
+    print(header)
+    for diff in diffs:
+        print("%7d %7d %7d %7d %7d %7d %7d  %s  %s" % (diff.old_sentences, diff.new_sentences, len(diff.added), len(diff.removed), diff.renamed,
+                                                   diff.reordered, diff.retokenized, " ".join("%7d" % diff.column_counts[x] for x in columns), diff.new_name))
+
+def print_details(diff):
+    print()
+    print("--- %s" % diff.old_name)
+    print("+++ %s" % diff.new_name)
+    for entry in diff.removed:
+        print("- removed %s: %s" % (entry["sent_id"], entry["text"]))
+    for entry in diff.added:
+        print("+ added %s: %s" % (entry["sent_id"], entry["text"]))
+    for entry in diff.changed:
+        sent_id = entry["sent_id"] if entry["sent_id"] == entry["old_sent_id"] else "%s (was %s)" % (entry["sent_id"], entry["old_sent_id"])
+        print("@ %s: %s" % (sent_id, entry["text"]))
+        if "tokenization" in entry:
+            print("    tokens: %s" % " ".join(entry["tokenization"][0]))
+            print("        ->  %s" % " ".join(entry["tokenization"][1]))
+            continue
+        for word_id, form, column, old_value, new_value in entry["words"]:
+            print("    %s %s %s: %s -> %s" % (word_id, form, column, old_value, new_value))
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the annotation changes between two versions of a conllu file, matching sentences by text')
+    parser.add_argument('versions', nargs='*', help='The old and new version, each a file or REV:path')
+    parser.add_argument('--git', nargs='+', default=None, metavar='REV', help='Diff every conllu file which changed between two revisions, or between one revision and the working tree')
+    parser.add_argument('--columns', nargs='+', default=COLUMNS, choices=COLUMNS, help='Which columns to compare')
+    parser.add_argument('--summary', action='store_true', default=False, help='Only print the table of counts, not the changes')
+    parser.add_argument('--json', default=None, help='Write the changes as json to this file, or - for stdout')
+    args = parser.parse_args()
+
+    if args.git:
+        if args.versions or len(args.git) > 2:
+            raise ValueError("--git takes one or two revisions and no files")
+        diffs = diff_git_revisions(args.git[0], args.git[1] if len(args.git) > 1 else None, args.columns)
+    else:
+        if len(args.versions) != 2:
+            raise ValueError("Expected two versions to compare, but got %d" % len(args.versions))
+        specs = [x for x in args.versions if is_git_spec(x)]
+        blobs = read_git_blobs(specs)
+        old_doc, new_doc = [read_version(x, blobs) for x in args.versions]
+        diffs = [FileDiff(args.versions[0], args.versions[1], old_doc, new_doc, args.columns)]
+
+    if args.json == "-":
+        json.dump([diff.to_json() for diff in diffs], sys.stdout, ensure_ascii=False, indent=1)
+        print()
+        return
+
+    print_summary(diffs, args.columns)
+    if not args.summary:
+        for diff in diffs:
+            if not diff.is_empty():
+                print_details(diff)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fout:
+            json.dump([diff.to_json() for diff in diffs], fout, ensure_ascii=False, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+A small conllu reader and writer which round trips files exactly
+
+Stanza's conll2doc builds a full Document of Token and Word objects,
+which is slow and large for scripts that only look at a column or
+two, and writing it back out can change details of the file.  Here
+each row is a Word with __slots__ holding the ten columns as the
+strings from the file, and each Sentence keeps its comment lines and
+the blank lines after it as they were.  Reading a file and writing
+it back gives the same bytes, including Windows line endings and a
+missing final newline.
+
+  doc = read_conllu(filename)
+  for sentence in doc.sentences:
+      for word in sentence.words:
+          if word.upos == "AUX":
+              word.lemma = "_"
+  write_conllu(doc, filename)
+
+Columns which are blank in the file are "_", not None.  sentence.rows
+also has the multiword token and empty node rows; sentence.words only
+has the syntactic words.  to_document and from_document convert to
+and from a stanza Document for the code which needs one.
+"""
+
+COLUMNS = ("id", "form", "lemma", "upos", "xpos", "feats", "head", "deprel", "deps", "misc")
+
+class Word:
+    __slots__ = COLUMNS
+
+    def __init__(self, id, form, lemma, upos, xpos, feats, head, deprel, deps, misc):
+        self.id = id
+        self.form = form
+        self.lemma = lemma
+        self.upos = upos
+        self.xpos = xpos
+        self.feats = feats
+        self.head = head
+        self.deprel = deprel
+        self.deps = deps
+        self.misc = misc
+
+    @property
+    def is_mwt(self):
+        return "-" in self.id
+
+    @property
+    def is_empty(self):
+        return "." in self.id
+
+    @property
+    def space_after(self):
+        return "SpaceAfter=No" not in self.misc.split("|")
+
+    def to_line(self):
+        return "\t".join((self.id, self.form, self.lemma, self.upos, self.xpos, self.feats, self.head, self.deprel, self.deps, self.misc))
+
+    def __repr__(self):
+        return "<Word %s>" % self.to_line()
+
+class Sentence:
+    """
+    The comment lines and rows of one sentence
+
+    newline is the line ending used inside the sentence, and separator
+    is everything from the end of the last row to the next sentence,
+    usually newline twice
+    """
+    __slots__ = ("comments", "rows", "newline", "separator")
+
+    def __init__(self, comments=None, rows=None, newline="\n", separator="\n\n"):
+        self.comments = comments if comments is not None else []
+        self.rows = rows if rows is not None else []
+        self.newline = newline
+        self.separator = separator
+
+    @property
+    def words(self):
+        return [row for row in self.rows if "-" not in row.id and "." not in row.id]
+
+    def get_comment(self, key):
+        """
+        The value of a "# key = value" comment, or None
+        """
+        prefix = "# %s =" % key
+        for comment in self.comments:
+            if comment.startswith(prefix):
+                return comment[len(prefix):].strip()
+        return None
+
+    def set_comment(self, key, value):
+        """
+        Replace the "# key = value" comment, or add one if there is none
+        """
+        prefix = "# %s =" % key
+        line = "# %s = %s" % (key, value)
+        for idx, comment in enumerate(self.comments):
+            if comment.startswith(prefix):
+                self.comments[idx] = line
+                return
+        self.comments.append(line)
+
+    @property
+    def sent_id(self):
+        return self.get_comment("sent_id")
+
+    @property
+    def text(self):
+        return self.get_comment("text")
+
+    def to_text(self):
+        """
+        The sentence as it is written in the file, including the separator
+        """
+        return self.newline.join(self.comments + [row.to_line() for row in self.rows]) + self.separator
+
+class ConlluDoc:
+    """
+    The sentences of a file, plus any blank lines before the first one
+    """
+    __slots__ = ("sentences", "prefix")
+
+    def __init__(self, sentences=None, prefix=""):
+        self.sentences = sentences if sentences is not None else []
+        self.prefix = prefix
+
+    def to_text(self):
+        return self.prefix + "".join(sentence.to_text() for sentence in self.sentences)
+
+def parse_conllu(text, filename="<string>"):
+    """
+    Parse the text of a conllu file into a ConlluDoc
+    """
+    doc = ConlluDoc()
+    sentence = None
+    in_sentence = False
+    lines = text.split("\n")
+    for line_idx, line in enumerate(lines):
+        if line_idx + 1 < len(lines):
+            line = line + "\n"
+        elif not line:
+            break
+        content = line.rstrip("\r\n")
+        ending = line[len(content):]
+        if not content.strip():
+            if sentence is None:
+                doc.prefix += line
+            else:
+                sentence.separator += line
+            in_sentence = False
+            continue
+        if not in_sentence:
+            sentence = Sentence(newline=ending or "\n", separator="")
+            doc.sentences.append(sentence)
+            in_sentence = True
+        elif sentence.separator != sentence.newline:
+            raise ValueError("%s line %d: mixed line endings inside a sentence" % (filename, line_idx+1))
+        if content.startswith("#"):
+            if sentence.rows:
+                raise ValueError("%s line %d: comment after the words of a sentence" % (filename, line_idx+1))
+            sentence.comments.append(content)
+        else:
+            pieces = content.split("\t")
+            if len(pieces) != 10:
+                raise ValueError("%s line %d: expected 10 columns, found %d" % (filename, line_idx+1, len(pieces)))
+            sentence.rows.append(Word(*pieces))
+        # replaced by the blank lines after the sentence, if there are any
+        sentence.separator = ending
+    return doc
+
+def read_conllu(filename):
+    # newline="" keeps any \r\n line endings so they can be written back
+    with open(filename, encoding="utf-8", newline="") as fin:
+        return parse_conllu(fin.read(), filename)
+
+def write_conllu(doc, filename):
+    with open(filename, "w", encoding="utf-8", newline="") as fout:
+        fout.write(doc.to_text())
+
+def to_document(doc):
+    """
+    Build a stanza Document with the same sentences
+    """
+    # stanza is only needed here, so the rest of the module works without it
+    from stanza.utils.conll import CoNLL
+    text = "".join("\n".join(sentence.comments + [row.to_line() for row in sentence.rows]) + "\n\n" for sentence in doc.sentences)
+    return CoNLL.conll2doc(input_str=text)
+
+def from_document(document):
+    """
+    Convert a stanza Document to a ConlluDoc, as CoNLL.write_doc2conll would write it
+    """
+    text = "".join("{:C}\n\n".format(sentence) for sentence in document.sentences)
+    return parse_conllu(text)
@@ -1,69 +1,322 @@
 """
-Convert a Sindhi dependency tree to Latex
+Convert Sindhi dependency trees to Latex (tikz-dependency) and SVG
+
+With just a filename, the first tree in the file is printed as Latex:
+
+  python3 convert_latex_tree.py sentence.conllu --heads 1,2,3
+
+Trees can also be picked by sent_id or by a treebank_search query.
+These are looked up in the columnar copy of the corpus, so none of
+the conllu files are parsed, and each tree is written to its own
+.tex and .svg file in --output_dir:
+
+  python3 convert_latex_tree.py --sent_id xpos_68 dev_12 --output_dir trees
+  python3 convert_latex_tree.py --query deprel=advmod:emph head.upos=NOUN --limit 20 --output_dir trees
+  python3 convert_latex_tree.py ../../sd_isra-ud-dev.conllu --sent_id dev_12 --output_dir trees
+
+A sent_id which is in several files is taken from the released
+treebank if possible, otherwise from the first file which has it.
+Giving a filename restricts the search to that file.
+
+Both formats share the right to left layout: the last word is
+drawn first, and arcs are numbered by their position from the left.
 """
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+import os
+import re
 import sys
 
+import numpy as np
+
 from stanza.utils.conll import CoNLL
 
+from columnar_corpus import DEFAULT_CORPUS_DIR, RELEASED_FILES, load_corpus
+from treebank_search import InvertedIndex, parse_query
+
 sys.stdout.reconfigure(encoding='utf-8')
 
-parser = argparse.ArgumentParser(description='Convert the first dependency tree in this file to a Latex format')
-parser.add_argument('filename', help='File to convert')
-parser.add_argument('--separation', default='0.25cm', help='How wide apart to make the nodes')
-parser.add_argument('--label', help='Label to add to the graph')
-parser.add_argument('--caption', help='Caption to add to the graph')
-parser.add_argument('--heads', default='', help='Which heads to include as arcs')
-args = parser.parse_args()
+# SVG measurements, in pixels
+SVG_CHAR_WIDTH = 9
+SVG_MIN_WORD_WIDTH = 40
+SVG_WORD_GAP = 20
+SVG_LEVEL_HEIGHT = 22
+SVG_MARGIN = 20
+SVG_FONT = "'Noto Naskh Arabic', 'MB Lateefi', serif"
 
-doc = CoNLL.conll2doc(args.filename)
-sentence = doc.sentences[0]
+class Tree:
+    """
+    The pieces of a sentence needed to draw it
 
-print("{:C}".format(sentence))
+    words is a list of (text, upos, head, deprel), with head 0 for the root and -1 for no head
+    """
+    def __init__(self, sent_id, words, source=None):
+        self.sent_id = sent_id
+        self.words = words
+        self.source = source
 
-words = sentence.words
-if words[-1].pos == 'PUNCT':
-    words = words[:-1]
+    @staticmethod
+    def from_sentence(sentence, source=None):
+        words = [(word.text, word.upos, word.head if word.head is not None else -1, word.deprel) for word in sentence.words]
+        return Tree(sentence.sent_id, words, source)
 
-print(r"""
-\begin{figure*}
+    @staticmethod
+    def from_corpus(corpus, sent_idx):
+        words = corpus.sentence_words(sent_idx)
+        vocab = corpus.vocab
+        words = [(vocab["form"][form], vocab["upos"][upos], int(head), vocab["deprel"][deprel])
+                 for form, upos, head, deprel in zip(corpus.form[words], corpus.upos[words], corpus.head[words], corpus.deprel[words])]
+        source = "%s:%d" % (corpus.sentence_file(sent_idx), corpus.line[corpus.sentence_words(sent_idx).start])
+        return Tree(corpus.sentence_id(sent_idx), words, source)
+
+def layout(tree, heads=None):
+    """
+    Place the words right to left and list the arcs to draw
+
+    The final punctuation is left out, as are any arcs to or from it.
+    heads is a list of the 1-based words whose arcs to draw, defaulting to all of them.
+
+    Returns the words in drawing order and a list of (dependent position, head position, deprel),
+    where positions count from 1 at the left and the head position is 0 for the root
+    """
+    words = tree.words
+    if words and words[-1][1] == 'PUNCT':
+        words = words[:-1]
+    if heads is None:
+        heads = range(1, len(words) + 1)
+
+    arcs = []
+    for word_idx in heads:
+        if word_idx < 1 or word_idx > len(words):
+            raise ValueError("Sentence %s has %d words, cannot draw the arc of word %d" % (tree.sent_id, len(words), word_idx))
+        _, _, head, deprel = words[word_idx-1]
+        if head < 0 or head > len(words):
+            continue
+        target = len(words) + 1 - word_idx
+        source = 0 if head == 0 else len(words) + 1 - head
+        arcs.append((target, source, "root" if head == 0 else deprel))
+    return [word[0] for word in reversed(words)], arcs
+
+def to_latex(words, arcs, separation='0.25cm', caption=None, label=None):
+    lines = [r"""\begin{figure*}
 \begin{center}
 \begin{dependency}
-  \begin{deptext}[column sep=%s]""" % args.separation)
+  \begin{deptext}[column sep=%s]""" % separation]
 
-converted_text = ["{\\sindhifont %s}" % word.text for word in reversed(words)]
-for chunk in range(0, len(converted_text), 3):
-    if chunk + 3 >= len(converted_text):
-        ending = " \\\\"
-    else:
-        ending = " \\&"
-    print("    %s%s" % (" \\& ".join(converted_text[chunk:chunk+3]), ending))
+    converted_text = ["{\\sindhifont %s}" % word for word in words]
+    for chunk in range(0, len(converted_text), 3):
+        if chunk + 3 >= len(converted_text):
+            ending = " \\\\"
+        else:
+            ending = " \\&"
+        lines.append("    %s%s" % (" \\& ".join(converted_text[chunk:chunk+3]), ending))
 
-print(r"  \end{deptext}")
+    lines.append(r"  \end{deptext}")
 
-heads = map(int, args.heads.split(","))
-for head in heads:
-    target = len(words) + 1 - head
-    if words[head-1].head == 0:
-        print("""  \\deproot[edge style={blue!60!black,ultra thick},
+    for target, source, deprel in arcs:
+        if source == 0:
+            lines.append("""  \\deproot[edge style={blue!60!black,ultra thick},
            label style={fill=green!60,font=\\bfseries,text=black}]{%d}{root}""" % target)
-    else:
-        deprel = words[head-1].deprel
-        source = words[head-1].head
-        source = len(words) + 1 - source
-        print("""  \\depedge[edge height=3ex,
+        else:
+            lines.append("""  \\depedge[edge height=3ex,
            edge style={blue!60!black,ultra thick},
            label style={fill=green!60,font=\\bfseries,text=black}]{%d}{%d}{%s}""" % (source, target, deprel))
 
-
-print(r"""\end{dependency}
+    lines.append(r"""\end{dependency}
 \end{center}""")
+    if caption:
+        lines.append("\\caption{%s}" % caption)
+    if label:
+        lines.append("\\label{%s}" % label)
+    lines.append(r"\end{figure*}")
+    return "\n".join(lines) + "\n"
 
-if args.caption:
-    print("\\caption{%s}" % args.caption)
+def arc_levels(arcs):
+    """
+    Stack the arcs so that an arc is drawn above every arc it covers
+    """
+    levels = {}
+    for arc in sorted((arc for arc in arcs if arc[1] != 0), key=lambda x: abs(x[0] - x[1])):
+        low, high = sorted(arc[:2])
+        covered = [levels[other] for other in levels if low <= min(other[:2]) and max(other[:2]) <= high]
+        levels[arc] = max(covered, default=0) + 1
+    return levels
 
-if args.label:
-    print("\\label{%s}" % args.label)
+def to_svg(words, arcs):
+    widths = [max(SVG_MIN_WORD_WIDTH, SVG_CHAR_WIDTH * len(word)) for word in words]
+    centers = []
+    x = SVG_MARGIN
+    for width in widths:
+        centers.append(x + width / 2)
+        x += width + SVG_WORD_GAP
+    width = x - SVG_WORD_GAP + SVG_MARGIN
+
+    levels = arc_levels(arcs)
+    top = max(levels.values(), default=0) + 1
+    baseline = SVG_MARGIN + (top + 1) * SVG_LEVEL_HEIGHT
+    height = baseline + SVG_MARGIN
+
+    lines = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">' % (width, height, width, height),
+             '  <defs><marker id="arrow" viewBox="0 0 8 8" refX="8" refY="4" markerWidth="6" markerHeight="6" orient="auto"><path d="M0,0 L8,4 L0,8 z" fill="#1f3b70"/></marker></defs>',
+             '  <g font-family="%s" font-size="16" text-anchor="middle">' % SVG_FONT]
+    for word, center in zip(words, centers):
+        lines.append('    <text x="%.1f" y="%d" direction="rtl">%s</text>' % (center, baseline, escape(word)))
+    lines.append('  </g>')
+
+    arc_bottom = baseline - 20
+    lines.append('  <g fill="none" stroke="#1f3b70" stroke-width="2">')
+    for arc in arcs:
+        target, source, deprel = arc
+        end = centers[target-1]
+        if source == 0:
+            arc_top = SVG_MARGIN
+            lines.append('    <path d="M%.1f,%d L%.1f,%d" marker-end="url(#arrow)"/>' % (end, arc_top, end, arc_bottom))
+            continue
+        start = centers[source-1]
+        arc_top = arc_bottom - levels[arc] * SVG_LEVEL_HEIGHT
+        lines.append('    <path d="M%.1f,%d C%.1f,%d %.1f,%d %.1f,%d" marker-end="url(#arrow)"/>' % (start, arc_bottom, start, arc_top, end, arc_top, end, arc_bottom))
+    lines.append('  </g>')
+
+    lines.append('  <g font-family="sans-serif" font-size="11" text-anchor="middle">')
+    for arc in arcs:
+        target, source, deprel = arc
+        if source == 0:
+            x, y = centers[target-1], SVG_MARGIN - 4
+        else:
+            x = (centers[target-1] + centers[source-1]) / 2
+            y = arc_bottom - levels[arc] * SVG_LEVEL_HEIGHT * 0.75 - 2
+        lines.append('    <text x="%.1f" y="%.1f" fill="black" stroke="white" stroke-width="3" paint-order="stroke">%s</text>' % (x, y, escape(deprel)))
+    lines.append('  </g>')
+    lines.append('</svg>')
+    return "\n".join(lines) + "\n"
+
+def output_name(tree, used):
+    """
+    A file name for the tree which is safe to write and not already used
+    """
+    name = re.sub(r"[^\w.-]+", "_", tree.sent_id or "tree")
+    candidate = name
+    idx = 1
+    while candidate in used:
+        idx += 1
+        candidate = "%s_%d" % (name, idx)
+    used.add(candidate)
+    return candidate
+
+def tree_labels(label, names):
+    """
+    The \\label of each tree.  With more than one tree, each label gets the tree's name, so the labels stay unique
+    """
+    if not label:
+        return [None] * len(names)
+    if len(names) == 1:
+        return [label]
+    return ["%s:%s" % (label, name) for name in names]
+
+def render(tree, output_base, label, options):
+    """
+    Write output_base.tex and output_base.svg for one tree
+    """
+    words, arcs = layout(tree, options["heads"])
+    latex = to_latex(words, arcs, options["separation"], options["caption"], label)
+    if tree.source:
+        latex = "%% %s %s\n" % (tree.sent_id, tree.source) + latex
+    with open(output_base + ".tex", "w", encoding="utf-8") as fout:
+        fout.write(latex)
+    with open(output_base + ".svg", "w", encoding="utf-8") as fout:
+        fout.write(to_svg(words, arcs))
+    return output_base
+
+def find_sentences(corpus, sent_ids, filename=None):
+    """
+    The corpus index of the sentence with each of the sent_ids
+    """
+    released = {os.path.normpath(x) for x in RELEASED_FILES}
+    if filename is not None:
+        filename = os.path.normpath(filename)
+    sent_indices = []
+    for sent_id in sent_ids:
+        vocab_id = corpus.vocab_id("sent_id", sent_id)
+        candidates = np.nonzero(np.asarray(corpus.sent_id) == vocab_id)[0] if vocab_id >= 0 else []
+        if filename is not None:
+            candidates = [x for x in candidates if corpus.sentence_file(x) == filename]
+        if len(candidates) == 0:
+            raise ValueError("Could not find sent_id %s%s" % (sent_id, " in %s" % filename if filename else ""))
+        in_release = [x for x in candidates if corpus.sentence_file(x) in released]
+        sent_indices.append(in_release[0] if in_release else candidates[0])
+        if len(candidates) > 1:
+            print("%s is in %d places, using %s" % (sent_id, len(candidates), corpus.sentence_file(sent_indices[-1])), file=sys.stderr)
+    return sent_indices
+
+def query_sentences(corpus, query, filename=None):
+    """
+    The corpus indices of the sentences with at least one word matching the query
+    """
+    index = InvertedIndex(corpus)
+    matches = index.search(parse_query(query))
+    sent_indices = np.unique(np.searchsorted(corpus.sent_offsets, matches, side="right") - 1)
+    if filename is not None:
+        filename = os.path.normpath(filename)
+        sent_indices = [x for x in sent_indices if corpus.sentence_file(x) == filename]
+    return list(sent_indices)
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert dependency trees to Latex and SVG')
+    parser.add_argument('filename', nargs='?', default=None, help='File to convert.  Without --sent_id or --query, the first tree in it is printed')
+    parser.add_argument('--sent_id', nargs='+', default=None, help='Which sentences to convert')
+    parser.add_argument('--query', nargs='+', default=None, help='Convert the sentences with a word matching this treebank_search query')
+    parser.add_argument('--limit', type=int, default=None, help='Only convert this many sentences')
+    parser.add_argument('--output_dir', default=None, help='Write a .tex and .svg file for each tree here.  Otherwise the Latex is printed')
+    parser.add_argument('--corpus_dir', default=DEFAULT_CORPUS_DIR, help='Where the columnar corpus is kept')
+    parser.add_argument('--workers', type=int, default=None, help='How many processes to render with')
+    parser.add_argument('--separation', default='0.25cm', help='How wide apart to make the nodes')
+    parser.add_argument('--label', help='Label to add to the graph.  With several trees, each one gets :NAME added, NAME being its sent_id')
+    parser.add_argument('--caption', help='Caption to add to the graph')
+    parser.add_argument('--heads', default=None, help='Which words to include the arcs of, such as 1,2,3.  Defaults to all of them')
+    args = parser.parse_args()
+
+    if args.sent_id is None and args.query is None:
+        if args.filename is None:
+            raise ValueError("Need a filename, --sent_id, or --query")
+        doc = CoNLL.conll2doc(args.filename)
+        sentence = doc.sentences[0]
+        print("{:C}".format(sentence))
+        print()
+        trees = [Tree.from_sentence(sentence)]
+    else:
+        corpus = load_corpus(args.corpus_dir)
+        if args.sent_id is not None:
+            sent_indices = find_sentences(corpus, args.sent_id, args.filename)
+        else:
+            sent_indices = query_sentences(corpus, args.query, args.filename)
+        if args.limit is not None:
+            sent_indices = sent_indices[:args.limit]
+        print("Converting %d trees" % len(sent_indices), file=sys.stderr)
+        trees = [Tree.from_corpus(corpus, x) for x in sent_indices]
+
+    heads = None if not args.heads else [int(x) for x in args.heads.split(",")]
+    used = set()
+    names = [output_name(tree, used) for tree in trees]
+    labels = tree_labels(args.label, names)
+    if args.output_dir is None:
+        for tree, label in zip(trees, labels):
+            words, arcs = layout(tree, heads)
+            print(to_latex(words, arcs, args.separation, args.caption, label))
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {"separation": args.separation, "caption": args.caption, "heads": heads}
+    output_bases = [os.path.join(args.output_dir, name) for name in names]
+    workers = args.workers if args.workers is not None else min(os.cpu_count() or 1, len(trees))
+    if workers <= 1:
+        for tree, output_base, label in zip(trees, output_bases, labels):
+            render(tree, output_base, label, options)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render, trees, output_bases, labels, [options] * len(trees), chunksize=16))
+    print("Wrote %d trees to %s" % (len(trees), args.output_dir), file=sys.stderr)
 
-print(r"\end{figure*}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Regenerate stats.xml for the released treebank
+
+Produces the same document as the UD tools' conllu-stats.pl: the size
+of each split, the unique lemmas and forms, the UPOS tags with their
+most frequent lemmas, the features with their most frequent forms,
+and the relations.  Ties in the frequency lists are broken by
+comparing the strings.
+
+Each split is read in one streaming pass into a set of counts, and
+those counts are saved in the cache directory under the hash of the
+file contents.  Editing one split only recounts that split; the
+others are loaded from the cache and the counts are added together.
+
+  python3 corpus_stats.py              # rewrite ../../stats.xml
+  python3 corpus_stats.py --check      # report what would change
+"""
+
+import argparse
+from collections import Counter
+from collections import defaultdict
+import hashlib
+import json
+import os
+import sys
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ud_sindhi_isra", "stats")
+
+SPLITS = ("train", "dev", "test")
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<treebank>
+  <!-- tokens means "surface tokens", e.g. Spanish "vámonos" counts as one token
+       words means "syntactic words", e.g. Spanish "vámonos" is split to two words, "vamos" and "nos"
+       fused is the number of tokens that are split to two or more syntactic words
+       The words and fused elements can be omitted if no token is split to smaller syntactic words. -->
+"""
+
+class SplitStats:
+    """
+    The counts from one conllu file.  Can be added together and saved as json
+    """
+    def __init__(self):
+        self.sentences = 0
+        self.tokens = 0
+        self.words = 0
+        self.fused = 0
+        self.lemmas = Counter()
+        self.forms = Counter()
+        self.fusions = Counter()
+        self.tags = Counter()
+        self.tag_lemmas = defaultdict(Counter)
+        self.feats = Counter()
+        self.feat_forms = defaultdict(Counter)
+        self.feat_upos = defaultdict(set)
+        self.deps = Counter()
+
+    @staticmethod
+    def from_file(filename):
+        stats = SplitStats()
+        in_sentence = False
+        mwt_end = 0
+        with open(filename, encoding="utf-8") as fin:
+            for line in fin:
+                line = line.rstrip("\n")
+                if not line:
+                    if in_sentence:
+                        stats.sentences += 1
+                        in_sentence = False
+                    mwt_end = 0
+                    continue
+                if line.startswith("#"):
+                    continue
+                pieces = line.split("\t")
+                if "." in pieces[0]:
+                    continue
+                in_sentence = True
+                if "-" in pieces[0]:
+                    mwt_end = int(pieces[0].split("-")[1])
+                    stats.tokens += 1
+                    stats.fused += 1
+                    stats.fusions[pieces[1]] += 1
+                    continue
+                if int(pieces[0]) > mwt_end:
+                    stats.tokens += 1
+                stats.words += 1
+                form, lemma, upos, feats, deprel = pieces[1], pieces[2], pieces[3], pieces[5], pieces[7]
+                stats.forms[form] += 1
+                stats.lemmas[lemma] += 1
+                stats.tags[upos] += 1
+                stats.tag_lemmas[upos][lemma] += 1
+                stats.deps[deprel] += 1
+                if feats != "_":
+                    for feat in feats.split("|"):
+                        stats.feats[feat] += 1
+                        stats.feat_forms[feat][form] += 1
+                        stats.feat_upos[feat].add(upos)
+        if in_sentence:
+            stats.sentences += 1
+        return stats
+
+    def __iadd__(self, other):
+        self.sentences += other.sentences
+        self.tokens += other.tokens
+        self.words += other.words
+        self.fused += other.fused
+        self.lemmas.update(other.lemmas)
+        self.forms.update(other.forms)
+        self.fusions.update(other.fusions)
+        self.tags.update(other.tags)
+        for key, counts in other.tag_lemmas.items():
+            self.tag_lemmas[key].update(counts)
+        self.feats.update(other.feats)
+        for key, counts in other.feat_forms.items():
+            self.feat_forms[key].update(counts)
+        for key, upos in other.feat_upos.items():
+            self.feat_upos[key].update(upos)
+        self.deps.update(other.deps)
+        return self
+
+    def to_json(self):
+        return {
+            "sentences": self.sentences,
+            "tokens": self.tokens,
+            "words": self.words,
+            "fused": self.fused,
+            "lemmas": self.lemmas,
+            "forms": self.forms,
+            "fusions": self.fusions,
+            "tags": self.tags,
+            "tag_lemmas": self.tag_lemmas,
+            "feats": self.feats,
+            "feat_forms": self.feat_forms,
+            "feat_upos": {key: sorted(value) for key, value in self.feat_upos.items()},
+            "deps": self.deps,
+        }
+
+    @staticmethod
+    def from_json(data):
+        stats = SplitStats()
+        for key in ("sentences", "tokens", "words", "fused"):
+            setattr(stats, key, data[key])
+        for key in ("lemmas", "forms", "fusions", "tags", "feats", "deps"):
+            setattr(stats, key, Counter(data[key]))
+        for key, counts in data["tag_lemmas"].items():
+            stats.tag_lemmas[key] = Counter(counts)
+        for key, counts in data["feat_forms"].items():
+            stats.feat_forms[key] = Counter(counts)
+        for key, upos in data["feat_upos"].items():
+            stats.feat_upos[key] = set(upos)
+        return stats
+
+def file_hash(filename):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as fin:
+        sha.update(fin.read())
+    return sha.hexdigest()
+
+def load_split(filename, cache_dir):
+    """
+    Return the SplitStats for filename and whether it was loaded from the cache
+    """
+    if cache_dir is None:
+        return SplitStats.from_file(filename), False
+    cache_filename = os.path.join(cache_dir, file_hash(filename) + ".json")
+    if os.path.exists(cache_filename):
+        with open(cache_filename, encoding="utf-8") as fin:
+            return SplitStats.from_json(json.load(fin)), True
+    stats = SplitStats.from_file(filename)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_filename, "w", encoding="utf-8") as fout:
+        json.dump(stats.to_json(), fout, ensure_ascii=False)
+    return stats, False
+
+def most_frequent(counts, limit):
+    """
+    The keys of counts, most frequent first, ties in string order
+    """
+    return [key for key, _ in sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:limit]]
+
+def size_line(name, stats):
+    return "    <%s><sentences>%d</sentences><tokens>%d</tokens><words>%d</words><fused>%d</fused></%s>\n" % (name, stats.sentences, stats.tokens, stats.words, stats.fused, name)
+
+def build_xml(split_stats):
+    total = SplitStats()
+    for split in SPLITS:
+        total += split_stats[split]
+
+    lines = [HEADER, "  <size>\n", size_line("total", total)]
+    for split in SPLITS:
+        lines.append(size_line(split, split_stats[split]))
+    lines.append("  </size>\n")
+
+    lemmas = Counter({key: value for key, value in total.lemmas.items() if key != "_"})
+    forms = Counter({key: value for key, value in total.forms.items() if key != "_"})
+    lines.append('  <lemmas unique="%d" /><!-- %s -->\n' % (len(lemmas), ", ".join(most_frequent(lemmas, 15))))
+    lines.append('  <forms unique="%d" /><!-- %s -->\n' % (len(forms), ", ".join(most_frequent(forms, 15))))
+    lines.append('  <fusions unique="%d" /><!-- %s -->\n' % (len(total.fusions), ", ".join(most_frequent(total.fusions, 15))))
+
+    lines.append("  <!-- Statistics of universal POS tags. The comments show the most frequent lemmas. -->\n")
+    lines.append('  <tags unique="%d">\n' % len(total.tags))
+    for tag in sorted(total.tags):
+        lines.append('    <tag name="%s">%d</tag><!-- %s -->\n' % (tag, total.tags[tag], ", ".join(most_frequent(total.tag_lemmas[tag], 10))))
+    lines.append("  </tags>\n")
+
+    lines.append("  <!-- Statistics of features and values. The comments show the most frequent word forms. -->\n")
+    lines.append('  <feats unique="%d">\n' % len(total.feats))
+    for feat in sorted(total.feats, key=lambda x: tuple(x.split("=", 1))):
+        name, value = feat.split("=", 1)
+        lines.append('    <feat name="%s" value="%s" upos="%s">%d</feat><!-- %s -->\n' % (name, value, ",".join(sorted(total.feat_upos[feat])), total.feats[feat], ", ".join(most_frequent(total.feat_forms[feat], 10))))
+    lines.append("  </feats>\n")
+
+    lines.append("  <!-- Statistics of universal dependency relations. -->\n")
+    lines.append('  <deps unique="%d">\n' % len(total.deps))
+    for dep in sorted(total.deps):
+        lines.append('    <dep name="%s">%d</dep>\n' % (dep, total.deps[dep]))
+    lines.append("  </deps>\n")
+    lines.append("</treebank>\n")
+    return "".join(lines)
+
+def summarize_change(old_xml, new_xml):
+    """
+    Print the lines of the size and coverage sections which changed
+    """
+    old_lines = set(old_xml.split("\n"))
+    new_lines = set(new_xml.split("\n"))
+    for line in old_xml.split("\n"):
+        if line not in new_lines:
+            print("- %s" % line.strip())
+    for line in new_xml.split("\n"):
+        if line not in old_lines:
+            print("+ %s" % line.strip())
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenerate stats.xml from the released conllu files')
+    parser.add_argument('--treebank_dir', default="../..", help='Directory with the sd_isra-ud-*.conllu files and stats.xml')
+    parser.add_argument('--output', default=None, help='Where to write the stats.  Defaults to stats.xml in the treebank directory')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help='Where to keep the per-file counts')
+    parser.add_argument('--no_cache', dest='cache_dir', action='store_const', const=None, help="Don't cache the per-file counts")
+    parser.add_argument('--check', action='store_true', default=False, help="Only report the differences from the current stats.xml.  Exits with 1 if there are any")
+    args = parser.parse_args()
+
+    output = args.output if args.output else os.path.join(args.treebank_dir, "stats.xml")
+
+    split_stats = {}
+    for split in SPLITS:
+        filename = os.path.join(args.treebank_dir, "sd_isra-ud-%s.conllu" % split)
+        split_stats[split], cached = load_split(filename, args.cache_dir)
+        print("%s: %d sentences, %d words%s" % (filename, split_stats[split].sentences, split_stats[split].words, " (cached)" if cached else ""), file=sys.stderr)
+
+    new_xml = build_xml(split_stats)
+
+    old_xml = None
+    if os.path.exists(output):
+        with open(output, encoding="utf-8") as fin:
+            old_xml = fin.read()
+
+    if old_xml == new_xml:
+        print("%s is up to date" % output, file=sys.stderr)
+        return
+    if old_xml is not None:
+        summarize_change(old_xml, new_xml)
+    if args.check:
+        sys.exit(1)
+    with open(output, "w", encoding="utf-8") as fout:
+        fout.write(new_xml)
+    print("Wrote %s" % output, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
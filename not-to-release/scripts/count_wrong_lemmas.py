@@ -4,13 +4,22 @@ report how many were correct and how many should have been the
 identity lemma.
 
 Useful for paper writing about how well the lemma prediction is working
+
+--bootstrap N adds a confidence interval for the accuracy, resampling
+the lemma entries N times
 """
 
 import argparse
 
+import numpy as np
+
+from bootstrap import confidence_interval, format_interval, sentence_counts
+
 parser = argparse.ArgumentParser(description='Count how many correct predictions are in a lemmatization file')
 parser.add_argument('--original', default="../lemmas/original/predicted_lemmas_b2.tsv", help='File of original predictions')
 parser.add_argument('--fixed',    default="../lemmas/predicted_lemmas_b2_corrected.tsv", help='File of gold updates')
+parser.add_argument('--bootstrap', type=int, default=0, help='Number of bootstrap resamples for a confidence interval.  0 to skip')
+parser.add_argument('--seed', type=int, default=1234, help='Random seed for the bootstrap')
 args = parser.parse_args()
 
 with open(args.fixed) as fin:
@@ -29,6 +38,7 @@ total = 0
 correct = 0
 identity = 0
 correct_predicted_identity = 0
+correct_flags = []
 predicted_identity = 0
 
 for fl, ol in zip(fixed_lines, orig_lines):
@@ -37,6 +47,7 @@ for fl, ol in zip(fixed_lines, orig_lines):
     if len(fixed_pieces) > 3:
         continue
     total += 1
+    correct_flags.append(fixed_pieces[2] == orig_pieces[2])
     if fixed_pieces[2] == orig_pieces[2]:
         correct += 1
     if fixed_pieces[0] == fixed_pieces[2]:
@@ -51,3 +62,7 @@ print("%d identity out of %d" % (identity, total))
 print("%d identity predictions" % predicted_identity)
 print("%d correct identity predictions" % correct_predicted_identity)
 
+if args.bootstrap > 0 and total > 0:
+    counts = sentence_counts(np.arange(total), np.array(correct_flags))
+    interval = confidence_interval(counts, num_resamples=args.bootstrap, seed=args.seed)
+    print(format_interval("Lemma accuracy", interval))
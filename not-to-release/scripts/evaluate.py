@@ -0,0 +1,314 @@
+"""
+Score predicted conllu files against gold conllu files
+
+Computes the same scores as the CoNLL 2018 shared task evaluation:
+  Tokens, Words, UPOS, XPOS, UFeats, AllTags, Lemmas, UAS, LAS, CLAS, MLAS, BLEX
+
+Each file is read in one pass straight into integer columns, with no
+stanza objects.  Words are aligned between gold and predicted by their
+character span in the text with all whitespace removed, so the
+prediction can have different tokenization or sentence splits than the
+gold.  A word which does not line up with a gold word counts against
+precision, and a gold word with no match counts against recall.  With
+identical tokenization, precision, recall and F1 are all the accuracy.
+
+As in the shared task, only the universal part of the deprel and the
+universal features are compared.
+
+  python3 evaluate.py sd_isra.test.in.conllu sd_isra.test.pred.conllu
+  python3 evaluate.py gold1 pred1 gold2 pred2 --per_label
+"""
+
+import argparse
+
+import numpy as np
+
+CONTENT_DEPRELS = {
+    "nsubj", "obj", "iobj", "csubj", "ccomp", "xcomp", "obl", "vocative",
+    "expl", "dislocated", "advcl", "advmod", "discourse", "nmod", "appos",
+    "nummod", "acl", "amod", "conj", "fixed", "flat", "compound", "list",
+    "parataxis", "orphan", "goeswith", "reparandum", "root", "dep"
+}
+
+FUNCTIONAL_DEPRELS = {
+    "aux", "cop", "mark", "det", "clf", "case", "cc"
+}
+
+UNIVERSAL_FEATURES = {
+    "PronType", "NumType", "Poss", "Reflex", "Foreign", "Abbr", "Gender",
+    "Animacy", "Number", "Case", "Definite", "Degree", "VerbForm", "Mood",
+    "Tense", "Aspect", "Voice", "Evident", "Polarity", "Person", "Polite"
+}
+
+METRICS = ("Tokens", "Words", "UPOS", "XPOS", "UFeats", "AllTags", "Lemmas", "UAS", "LAS", "CLAS", "MLAS", "BLEX")
+
+class Vocab:
+    """
+    Interns strings to ids.  Shared between gold and predicted so the ids can be compared
+    """
+    def __init__(self):
+        self.ids = {}
+        self.labels = []
+
+    def __call__(self, label):
+        label_id = self.ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.ids[label] = label_id
+            self.labels.append(label)
+        return label_id
+
+def universal_feats(feats):
+    if feats == "_":
+        return feats
+    feats = [x for x in feats.split("|") if x.split("=", 1)[0] in UNIVERSAL_FEATURES]
+    if not feats:
+        return "_"
+    return "|".join(feats)
+
+class Columns:
+    """
+    The words of one conllu file as integer arrays
+
+    head is the index of the head word in the whole file, -1 for root.
+    start, end and sub give the character span of each word, where the
+    words of a multiword token all share the token span and are
+    told apart by sub.
+    """
+    def __init__(self, filename, vocabs):
+        upos, xpos, feats, lemma, deprel, head = [], [], [], [], [], []
+        start, end, sub = [], [], []
+        token_spans = []
+
+        offset = 0
+        sentence_start = 0
+        num_words = 0
+        mwt_end = -1
+        mwt_span = None
+        mwt_sub = 0
+        with open(filename, encoding="utf-8") as fin:
+            for line_idx, line in enumerate(fin):
+                line = line.rstrip("\n")
+                if not line:
+                    sentence_start = num_words
+                    mwt_end = -1
+                    continue
+                if line.startswith("#"):
+                    continue
+                pieces = line.split("\t")
+                if len(pieces) != 10:
+                    raise ValueError("%s line %d: expected 10 columns, found %d" % (filename, line_idx+1, len(pieces)))
+                if "." in pieces[0]:
+                    continue
+                form = "".join(pieces[1].split())
+                if "-" in pieces[0]:
+                    first, last = pieces[0].split("-")
+                    mwt_end = int(last)
+                    mwt_span = (offset, offset + len(form))
+                    mwt_sub = 0
+                    token_spans.append(mwt_span)
+                    offset += len(form)
+                    continue
+
+                word_id = int(pieces[0])
+                if word_id <= mwt_end:
+                    start.append(mwt_span[0])
+                    end.append(mwt_span[1])
+                    sub.append(mwt_sub)
+                    mwt_sub += 1
+                else:
+                    start.append(offset)
+                    end.append(offset + len(form))
+                    sub.append(0)
+                    token_spans.append((offset, offset + len(form)))
+                    offset += len(form)
+                upos.append(vocabs["upos"](pieces[3]))
+                xpos.append(vocabs["xpos"](pieces[4]))
+                feats.append(vocabs["feats"](universal_feats(pieces[5])))
+                lemma.append(vocabs["lemma"](pieces[2]))
+                deprel.append(vocabs["deprel"](pieces[7].split(":")[0]))
+                head.append(-1 if pieces[6] in ("0", "_") else sentence_start + int(pieces[6]) - 1)
+                num_words += 1
+
+        self.upos = np.array(upos, dtype=np.int32)
+        self.xpos = np.array(xpos, dtype=np.int32)
+        self.feats = np.array(feats, dtype=np.int32)
+        self.lemma = np.array(lemma, dtype=np.int32)
+        self.deprel = np.array(deprel, dtype=np.int32)
+        self.head = np.array(head, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+        self.sub = np.array(sub, dtype=np.int64)
+        self.token_spans = np.array(token_spans, dtype=np.int64).reshape(-1, 2)
+        self.num_chars = offset
+
+    def __len__(self):
+        return len(self.upos)
+
+    def span_keys(self):
+        # offsets are all < num_chars, and a token has at most a few words
+        width = self.num_chars + 1
+        return (self.start * width + self.end) * 64 + self.sub
+
+def align(gold, system):
+    """
+    Return, for each system word, the index of the gold word with the same span, or -1
+    """
+    if gold.num_chars != system.num_chars:
+        raise ValueError("The gold and predicted text are different: %d vs %d non-whitespace characters" % (gold.num_chars, system.num_chars))
+    gold_keys = gold.span_keys()
+    system_keys = system.span_keys()
+    order = np.argsort(gold_keys, kind="stable")
+    sorted_keys = gold_keys[order]
+    positions = np.searchsorted(sorted_keys, system_keys)
+    positions = np.minimum(positions, len(sorted_keys) - 1)
+    found = sorted_keys[positions] == system_keys if len(sorted_keys) > 0 else np.zeros(len(system_keys), dtype=bool)
+    return np.where(found, order[positions], -1)
+
+def count_tokens(gold, system):
+    gold_keys = gold.token_spans[:, 0] * (gold.num_chars + 1) + gold.token_spans[:, 1]
+    system_keys = system.token_spans[:, 0] * (system.num_chars + 1) + system.token_spans[:, 1]
+    return len(np.intersect1d(gold_keys, system_keys))
+
+def functional_mismatch(gold, system, alignment, functional):
+    """
+    Return a boolean array over the gold words: does the set of functional children differ in the system?
+
+    Each functional child becomes a row of (head, child, deprel, upos, feats) in
+    gold word indices.  A row which only shows up on one side marks its head
+    as mismatched.
+    """
+    mismatch = np.zeros(len(gold), dtype=bool)
+    gold_children = np.nonzero(functional[gold.deprel] & (gold.head >= 0))[0]
+    system_children = np.nonzero(functional[system.deprel] & (system.head >= 0))[0]
+    gold_rows = np.stack([gold.head[gold_children], gold_children,
+                          gold.deprel[gold_children], gold.upos[gold_children], gold.feats[gold_children]], axis=1)
+    system_rows = np.stack([alignment[system.head[system_children]], alignment[system_children],
+                            system.deprel[system_children], system.upos[system_children], system.feats[system_children]], axis=1)
+    # an unaligned system child can never match, so give it a child index no gold row has
+    system_rows[system_rows[:, 1] < 0, 1] = -2
+    rows = np.concatenate([gold_rows, system_rows])
+    if len(rows) == 0:
+        return mismatch
+    unique, counts = np.unique(rows, axis=0, return_counts=True)
+    heads = unique[counts == 1, 0]
+    heads = heads[heads >= 0]
+    mismatch[heads] = True
+    return mismatch
+
+def evaluate(gold, system, vocabs):
+    """
+    Return a map from metric to (correct, gold total, system total), and the per-word results for the breakdowns
+    """
+    alignment = align(gold, system)
+    aligned = alignment >= 0
+    sys_idx = np.nonzero(aligned)[0]
+    gold_idx = alignment[sys_idx]
+
+    upos = gold.upos[gold_idx] == system.upos[sys_idx]
+    xpos = gold.xpos[gold_idx] == system.xpos[sys_idx]
+    feats = gold.feats[gold_idx] == system.feats[sys_idx]
+    # as in the shared task, a gold lemma of _ matches anything
+    lemma = (gold.lemma[gold_idx] == system.lemma[sys_idx]) | (gold.lemma[gold_idx] == vocabs["lemma"].ids.get("_", -1))
+
+    system_heads = system.head[sys_idx]
+    mapped_heads = np.where(system_heads >= 0, alignment[np.maximum(system_heads, 0)], -1)
+    # a system head of root (-1) matches a gold root.  an unaligned system head (-1 after
+    # mapping from a real word) must not, so use -2 for it
+    mapped_heads = np.where((system_heads >= 0) & (mapped_heads < 0), -2, mapped_heads)
+    uas = gold.head[gold_idx] == mapped_heads
+    las = uas & (gold.deprel[gold_idx] == system.deprel[sys_idx])
+
+    deprel_labels = vocabs["deprel"].labels
+    content = np.array([x in CONTENT_DEPRELS for x in deprel_labels], dtype=bool)
+    functional = np.array([x in FUNCTIONAL_DEPRELS for x in deprel_labels], dtype=bool)
+    gold_content = content[gold.deprel]
+    system_content = content[system.deprel]
+    aligned_content = gold_content[gold_idx]
+
+    clas = las & aligned_content
+    mismatch = functional_mismatch(gold, system, alignment, functional)
+    mlas = clas & upos & feats & ~mismatch[gold_idx]
+    blex = clas & lemma
+
+    num_gold = len(gold)
+    num_system = len(system)
+    num_gold_content = int(gold_content.sum())
+    num_system_content = int(system_content.sum())
+    results = {
+        "Tokens":  (count_tokens(gold, system), len(gold.token_spans), len(system.token_spans)),
+        "Words":   (len(sys_idx), num_gold, num_system),
+        "UPOS":    (int(upos.sum()), num_gold, num_system),
+        "XPOS":    (int(xpos.sum()), num_gold, num_system),
+        "UFeats":  (int(feats.sum()), num_gold, num_system),
+        "AllTags": (int((upos & xpos & feats).sum()), num_gold, num_system),
+        "Lemmas":  (int(lemma.sum()), num_gold, num_system),
+        "UAS":     (int(uas.sum()), num_gold, num_system),
+        "LAS":     (int(las.sum()), num_gold, num_system),
+        "CLAS":    (int(clas.sum()), num_gold_content, num_system_content),
+        "MLAS":    (int(mlas.sum()), num_gold_content, num_system_content),
+        "BLEX":    (int(blex.sum()), num_gold_content, num_system_content),
+    }
+    words = {
+        "gold_idx": gold_idx,
+        "upos": upos,
+        "las": las,
+    }
+    return results, words
+
+def label_breakdown(gold_labels, gold_idx, correct, num_labels):
+    """
+    Return gold count and recall for each label, eg per UPOS tag or per deprel
+    """
+    totals = np.bincount(gold_labels, minlength=num_labels)
+    hits = np.bincount(gold_labels[gold_idx], weights=correct, minlength=num_labels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return totals, hits / totals
+
+def f1_scores(correct, gold_total, system_total):
+    precision = correct / system_total if system_total else 0.0
+    recall = correct / gold_total if gold_total else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+def print_results(results):
+    print("Metric     | Precision |    Recall |  F1 Score |")
+    print("-----------+-----------+-----------+-----------+")
+    for metric in METRICS:
+        precision, recall, f1 = f1_scores(*results[metric])
+        print("%-11s|%10.2f |%10.2f |%10.2f |" % (metric, 100 * precision, 100 * recall, 100 * f1))
+
+def print_breakdown(name, labels, totals, recall):
+    print("%s breakdown (recall)" % name)
+    for label_idx in np.argsort(-totals, kind="stable"):
+        if totals[label_idx] == 0:
+            continue
+        print("  %-12s %6d %.4f" % (labels[label_idx], totals[label_idx], recall[label_idx]))
+
+def main():
+    parser = argparse.ArgumentParser(description='Score predicted conllu files against gold conllu files')
+    parser.add_argument('filenames', nargs='+', help='Pairs of gold and predicted files: gold1 pred1 gold2 pred2 ...')
+    parser.add_argument('--per_label', action='store_true', default=False, help='Also print the UPOS and LAS recall for each gold label')
+    args = parser.parse_args()
+
+    if len(args.filenames) % 2 != 0:
+        raise ValueError("Expected pairs of gold and predicted files, but got %d filenames" % len(args.filenames))
+
+    for gold_filename, system_filename in zip(args.filenames[::2], args.filenames[1::2]):
+        vocabs = {name: Vocab() for name in ("upos", "xpos", "feats", "lemma", "deprel")}
+        gold = Columns(gold_filename, vocabs)
+        system = Columns(system_filename, vocabs)
+        results, words = evaluate(gold, system, vocabs)
+
+        print("Gold: %s" % gold_filename)
+        print("Pred: %s" % system_filename)
+        print_results(results)
+        if args.per_label:
+            totals, recall = label_breakdown(gold.upos, words["gold_idx"], words["upos"], len(vocabs["upos"].labels))
+            print_breakdown("UPOS", vocabs["upos"].labels, totals, recall)
+            totals, recall = label_breakdown(gold.deprel, words["gold_idx"], words["las"], len(vocabs["deprel"].labels))
+            print_breakdown("LAS", vocabs["deprel"].labels, totals, recall)
+        print()
+
+if __name__ == '__main__':
+    main()
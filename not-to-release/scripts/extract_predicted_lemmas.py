@@ -3,15 +3,25 @@ This script gathers words from a Stanza lemmatizer's prediction output
 
 It drops all words already in the ../lemmas/* directory
 Outputs in .tsv format
+
+Every unlemmatized (word, UPOS) pair in every prediction file is
+counted, and the --top_k pairs which cover the most tokens are the
+ones printed, so each batch of corrections fixes as many words in
+the corpus as possible.  The files are streamed a line at a time.
 """
 
+import argparse
+from collections import Counter
+from collections import defaultdict
 import glob
+import heapq
 import sys
 from operator import itemgetter
 
-from stanza.utils.conll import CoNLL
-
 def read_known_lemmas():
+    """
+    The (word, UPOS) pairs in the lemma files, in their exact spelling, as merge_lemmas.find_lemma matches them
+    """
     lemmas = set()
     known_lemma_files = sorted(glob.glob("../lemmas/*.tsv"))
     for lemma_file in known_lemma_files:
@@ -25,32 +35,88 @@ def read_known_lemmas():
             lemmas.add((pieces[0], pieces[1]))
     return lemmas
 
-known_lemmas = read_known_lemmas()
+def iter_words(filename):
+    """
+    Yield (sentence index, word id, text, lemma, upos) for each word in a conllu file
+    """
+    sent_idx = 0
+    in_sentence = False
+    with open(filename, encoding="utf-8") as fin:
+        for line in fin:
+            line = line.rstrip("\n")
+            if not line:
+                if in_sentence:
+                    sent_idx += 1
+                    in_sentence = False
+                continue
+            if line.startswith("#"):
+                continue
+            pieces = line.split("\t")
+            if "-" in pieces[0] or "." in pieces[0]:
+                continue
+            in_sentence = True
+            yield sent_idx, pieces[0], pieces[1], pieces[2], pieces[3]
+
+def count_unknown_pairs(pred_filename, orig_filename, known_lemmas, pair_counts, pair_lemmas):
+    """
+    Count the predicted (word, UPOS) pairs which have no lemma in the original file and are not known
 
-pred_filename = "sd_isra.test.pred.conllu"
-pred_doc = CoNLL.conll2doc(pred_filename)
+    Updates pair_counts and pair_lemmas in place.  Returns the number of words skipped as already known
+    """
+    skipped = 0
+    sentinel = object()
+    pred_words = iter_words(pred_filename)
+    orig_words = iter_words(orig_filename)
+    while True:
+        pred_word = next(pred_words, sentinel)
+        orig_word = next(orig_words, sentinel)
+        if pred_word is sentinel or orig_word is sentinel:
+            if pred_word is not orig_word:
+                raise ValueError("%s and %s have a different number of words" % (pred_filename, orig_filename))
+            break
+        if pred_word[:2] != orig_word[:2]:
+            raise ValueError("%s and %s are not aligned: sentence %d word %s vs sentence %d word %s" % (pred_filename, orig_filename, pred_word[0], pred_word[1], orig_word[0], orig_word[1]))
+        if orig_word[3] and orig_word[3] != '_':
+            continue
+        # another spelling of a known word does not get its lemma from merge_lemmas, so it still needs one
+        if (orig_word[2], orig_word[4]) in known_lemmas:
+            skipped += 1
+            continue
+        pair = (pred_word[2], pred_word[4])
+        pair_counts[pair] += 1
+        pair_lemmas[pair][pred_word[3]] += 1
+    return skipped
 
-orig_filename = "sd_isra.test.in.conllu"
-orig_doc = CoNLL.conll2doc(orig_filename)
+def main():
+    parser = argparse.ArgumentParser(description='Extract the most frequent unknown lemmas from lemmatizer predictions')
+    parser.add_argument('--pred', nargs='+', default=["sd_isra.test.pred.conllu"], help='Prediction files')
+    parser.add_argument('--orig', nargs='+', default=["sd_isra.test.in.conllu"], help='Input files the predictions were made from, one per prediction file')
+    parser.add_argument('--top_k', type=int, default=1000, help='How many (word, UPOS) pairs to output')
+    args = parser.parse_args()
 
-assert len(pred_doc.sentences) == len(orig_doc.sentences)
+    if len(args.pred) != len(args.orig):
+        raise ValueError("Got %d prediction files but %d original files" % (len(args.pred), len(args.orig)))
 
-lemmas = {}
-skipped = 0
+    known_lemmas = read_known_lemmas()
 
-for pred_sent, orig_sent in zip(pred_doc.sentences, orig_doc.sentences):
-    assert len(pred_sent.words) == len(orig_sent.words)
-    for pred_word, orig_word in zip(pred_sent.words, orig_sent.words):
-        if not orig_word.lemma:
-            if (orig_word.text, orig_word.upos) in known_lemmas:
-                skipped += 1
-                continue
-            lemmas[(pred_word.text, pred_word.upos)] = pred_word.lemma
-    if len(lemmas) > 1000:
-        break
+    pair_counts = Counter()
+    pair_lemmas = defaultdict(Counter)
+    skipped = 0
+    for pred_filename, orig_filename in zip(args.pred, args.orig):
+        skipped += count_unknown_pairs(pred_filename, orig_filename, known_lemmas, pair_counts, pair_lemmas)
+
+    top_pairs = heapq.nlargest(args.top_k, pair_counts.items(), key=itemgetter(1))
+    covered = sum(count for _, count in top_pairs)
+    total = sum(pair_counts.values())
+
+    print("Skipped %d words" % skipped, file=sys.stderr)
+    print("%d unknown (word, UPOS) pairs covering %d words" % (len(pair_counts), total), file=sys.stderr)
+    print("Top %d pairs cover %d words" % (len(top_pairs), covered), file=sys.stderr)
 
-print("Skipped %d words" % skipped, file=sys.stderr)
+    keys = sorted((pair for pair, _ in top_pairs), key=itemgetter(1, 0))
+    for k in keys:
+        lemma = pair_lemmas[k].most_common(1)[0][0]
+        print("%s\t%s\t%s" % (k[0], k[1], lemma))
 
-keys = sorted(lemmas, key=itemgetter(1, 0))
-for k in keys:
-    print("%s\t%s\t%s" % (k[0], k[1], lemmas[k]))
+if __name__ == '__main__':
+    main()
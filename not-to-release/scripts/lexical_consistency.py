@@ -0,0 +1,157 @@
+"""
+Find words whose lemma, XPOS or features disagree across the corpus
+
+For each (form, UPOS) in the annotated files, count how often each
+lemma, XPOS, feature bundle and deprel is used, with a few example
+locations for each.  A value which is rare for a (form, UPOS) whose
+other occurrences mostly agree is flagged as a probable error:
+
+  python3 lexical_consistency.py
+  python3 lexical_consistency.py --min_count 3 --columns lemma feats
+  python3 lexical_consistency.py --json lexicon.json     # every distribution
+
+The files are read in parallel, one process per file, and the
+per-file results are combined afterwards.  The same sentence is in
+several files, so by default each distinct sentence (by normalized
+text) is only counted once, from the first file which has it.  The
+released splits come first, so their version is the one counted.
+Blank values are never counted.
+"""
+
+import argparse
+from collections import Counter
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+
+from check_consistency import DEFAULT_EXCLUDE, sentence_key
+from columnar_corpus import RELEASED_FILES, find_corpus_files
+from conllu_io import read_conllu
+
+COLUMNS = ("lemma", "xpos", "feats", "deprel")
+# deprel depends on the sentence, so it is reported but not flagged unless asked for
+DEFAULT_FLAG_COLUMNS = ("lemma", "xpos", "feats")
+MAX_EXAMPLES = 3
+
+def read_file(filename):
+    """
+    The map step: a list of (sentence key, location prefix, words) for each sentence in the file
+
+    Each word is (form, upos, word id, lemma, xpos, feats, deprel)
+    """
+    doc = read_conllu(filename)
+    sentences = []
+    for sent_idx, sentence in enumerate(doc.sentences):
+        sent_id = sentence.sent_id
+        location = "%s#%s" % (filename, sent_id if sent_id else sent_idx)
+        words = [(word.form, word.upos, word.id, word.lemma, word.xpos, word.feats, word.deprel) for word in sentence.words]
+        sentences.append((sentence_key(sentence), location, words))
+    return sentences
+
+class Distribution:
+    """
+    The values of one column for one (form, UPOS), with example locations
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self.examples = defaultdict(list)
+
+    def add(self, value, location):
+        self.counts[value] += 1
+        if len(self.examples[value]) < MAX_EXAMPLES:
+            self.examples[value].append(location)
+
+    def to_json(self):
+        return [{"value": value, "count": count, "examples": self.examples[value]} for value, count in self.counts.most_common()]
+
+def build_lexicon(file_results, dedup=True):
+    """
+    The reduce step: combine the per-file results into {(form, upos): {column: Distribution}}
+    """
+    lexicon = defaultdict(lambda: {column: Distribution() for column in COLUMNS})
+    seen = set()
+    for sentences in file_results:
+        for key, location, words in sentences:
+            if dedup:
+                if key in seen:
+                    continue
+                seen.add(key)
+            for form, upos, word_id, lemma, xpos, feats, deprel in words:
+                if upos == "_":
+                    continue
+                entry = lexicon[(form, upos)]
+                word_location = "%s/%s" % (location, word_id)
+                for column, value in zip(COLUMNS, (lemma, xpos, feats, deprel)):
+                    if value != "_":
+                        entry[column].add(value, word_location)
+    return lexicon
+
+def find_minority_variants(lexicon, columns=DEFAULT_FLAG_COLUMNS, min_count=5, majority=0.75, minority=0.1):
+    """
+    List (form, upos, column, majority value, majority count, variant, variant count, total) for the rare variants
+
+    A variant is flagged when the (form, UPOS) has at least min_count
+    values in the column, the most common value has at least the
+    majority share, and the variant has at most the minority share.
+    """
+    flagged = []
+    for (form, upos), entry in lexicon.items():
+        for column in columns:
+            counts = entry[column].counts
+            total = sum(counts.values())
+            if total < min_count or len(counts) < 2:
+                continue
+            (top_value, top_count), *others = counts.most_common()
+            if top_count < majority * total:
+                continue
+            for value, count in others:
+                if count <= minority * total:
+                    flagged.append((form, upos, column, top_value, top_count, value, count, total))
+    flagged.sort(key=lambda x: (-x[7], x[2], x[1], x[0], x[5]))
+    return flagged
+
+def default_files(exclude=DEFAULT_EXCLUDE):
+    released = [os.path.normpath(x) for x in RELEASED_FILES if os.path.exists(x)]
+    others = [x for x in find_corpus_files() if x not in released and not any(pattern in x for pattern in exclude)]
+    return released + others
+
+def main():
+    parser = argparse.ArgumentParser(description='Find (form, UPOS) pairs with inconsistent lemmas, XPOS or features')
+    parser.add_argument('--files', nargs='+', default=None, help='Which files to read.  Defaults to the released splits, then every other conllu file')
+    parser.add_argument('--all_copies', dest='dedup', action='store_false', default=True, help='Count every copy of a sentence, not just the first')
+    parser.add_argument('--columns', nargs='+', default=DEFAULT_FLAG_COLUMNS, choices=COLUMNS, help='Which columns to flag variants in')
+    parser.add_argument('--min_count', type=int, default=5, help='Only flag (form, UPOS) pairs with at least this many values')
+    parser.add_argument('--majority', type=float, default=0.75, help='The most common value needs at least this share to flag the others')
+    parser.add_argument('--minority', type=float, default=0.1, help='Flag values with at most this share')
+    parser.add_argument('--workers', type=int, default=None, help='How many processes to read the files with')
+    parser.add_argument('--json', default=None, help='Also write every distribution to this file')
+    args = parser.parse_args()
+
+    filenames = args.files if args.files else default_files()
+    workers = args.workers if args.workers is not None else min(os.cpu_count() or 1, len(filenames))
+    if workers <= 1:
+        file_results = [read_file(filename) for filename in filenames]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            file_results = list(executor.map(read_file, filenames))
+
+    lexicon = build_lexicon(file_results, args.dedup)
+    num_sentences = sum(len(sentences) for sentences in file_results)
+    print("%d files, %d sentences, %d (form, UPOS) pairs" % (len(filenames), num_sentences, len(lexicon)), file=sys.stderr)
+
+    flagged = find_minority_variants(lexicon, args.columns, args.min_count, args.majority, args.minority)
+    print("%d probable errors" % len(flagged), file=sys.stderr)
+    for form, upos, column, top_value, top_count, value, count, total in flagged:
+        examples = lexicon[(form, upos)][column].examples[value]
+        print("%s\t%s\t%s\t%s (%d/%d)\t%s (%d)\t%s" % (form, upos, column, top_value, top_count, total, value, count, " ".join(examples)))
+
+    if args.json:
+        data = [{"form": form, "upos": upos, "columns": {column: entry[column].to_json() for column in COLUMNS}}
+                for (form, upos), entry in sorted(lexicon.items())]
+        with open(args.json, "w", encoding="utf-8") as fout:
+            json.dump(data, fout, ensure_ascii=False, indent=1)
+
+if __name__ == '__main__':
+    main()
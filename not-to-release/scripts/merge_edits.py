@@ -4,12 +4,14 @@ import sys
 
 from stanza.utils.conll import CoNLL
 
+from normalize import normalize_text
+
 def merge_edits(new_doc, merge_xpos=False):
     sentences = {}
     for sentence in new_doc.sentences:
         if not sentence.text:
             raise ValueError("Sentence %s has no text!" % sentence.sent_id)
-        text = sentence.text.replace(" ", "")
+        text = normalize_text(sentence.text)
         if sentence in sentences:
             raise ValueError("Multiple copies of sentence found: %s = %s" % (sentence.sent_id, sentence.text))
         sentences[text] = sentence
@@ -27,7 +29,7 @@ def merge_edits(new_doc, merge_xpos=False):
         for sentence in orig_doc.sentences:
             if not sentence.text:
                 raise ValueError("Sentence %s in %s has no text!" % (sentence.sent_id, filename))
-            text = sentence.text.replace(" ", "")
+            text = normalize_text(sentence.text)
             if text in sentences:
                 new_sentences.append(sentences[text])
                 if sentence.sent_id:
@@ -1,8 +1,11 @@
 import argparse
+from collections import Counter
 import glob
 import sys
 
-from stanza.utils.conll import CoNLL
+from conllu_io import read_conllu, write_conllu
+from normalize import normalize_word
+from profiling import add_profile_args, profiler_from_args
 
 def get_filenames():
     filenames = glob.glob("../xpos_features/*conllu") + glob.glob("../xpos_features/*txt") + ["../xpos_standard/xpos_tagged_with_features.conllu"]
@@ -35,31 +38,92 @@ def read_tsv_files(tsv_files):
             locations[word_tag] = (filename, line_idx)
     return lemmas
 
-def set_lemmas(filename, lemmas, remove_existing):
-    print("Lemmatizing %s" % filename)
-    doc = CoNLL.conll2doc(filename)
-    for sentence in doc.sentences:
-        for word in sentence.words:
-            if (word.text, word.upos) in lemmas:
-                word.lemma = lemmas[(word.text, word.upos)]
-            elif remove_existing:
-                word.lemma = None
-    CoNLL.write_doc2conll(doc, filename)
+def normalize_lemmas(lemmas):
+    """
+    Key the lemmas by (normalized word, upos) as well, for words spelled differently than in the lemma files
+
+    Different spellings of a word are sometimes lemmatized differently,
+    so any normalized key with more than one lemma is left out
+    """
+    normalized = {}
+    ambiguous = set()
+    for (word, upos), lemma in lemmas.items():
+        word_tag = (normalize_word(word), upos)
+        if normalized.get(word_tag, lemma) != lemma:
+            ambiguous.add(word_tag)
+        normalized[word_tag] = lemma
+    for word_tag in ambiguous:
+        del normalized[word_tag]
+    return normalized
+
+def find_lemma(word, upos, lemmas):
+    """
+    The lemma for exactly this spelling of the word, or None
+    """
+    return lemmas.get((word, upos))
+
+def find_variant_lemma(word, upos, normalized_lemmas):
+    """
+    The lemma of another spelling of the word, or None
 
+    The lemma is in the spelling of the lemma file, such as with tatweel
+    or ھ, so it is only reported and never written into the annotation
+    """
+    return normalized_lemmas.get((normalize_word(word), upos))
+
+def set_lemmas(filename, lemmas, normalized_lemmas, remove_existing, profiler):
+    """
+    Set the lemmas of the words which are in the lemma files, returning the (word, upos, lemma, lemma file lemma) of the words only found under another spelling
+    """
+    print("Lemmatizing %s" % filename)
+    with profiler.stage("parse") as stage:
+        doc = read_conllu(filename)
+        stage.add_doc(doc)
+    variants = []
+    with profiler.stage("lemmatize") as stage:
+        for sentence in doc.sentences:
+            for word in sentence.words:
+                lemma = find_lemma(word.form, word.upos, lemmas)
+                if lemma is not None:
+                    word.lemma = lemma
+                    continue
+                variant_lemma = find_variant_lemma(word.form, word.upos, normalized_lemmas)
+                if variant_lemma is not None:
+                    # the existing lemma is kept, for an annotator to compare with the lemma file
+                    variants.append((word.form, word.upos, word.lemma, variant_lemma))
+                elif remove_existing:
+                    word.lemma = "_"
+        stage.add_doc(doc)
+    with profiler.stage("write") as stage:
+        write_conllu(doc, filename)
+        stage.add_doc(doc)
+    return variants
 
 def main():
     parser = argparse.ArgumentParser(description='Merge all known lemmas into the conllu files')
     parser.add_argument('--remove_existing', action='store_true', default=False, dest='remove_existing',
                         help="If a lemma is currently set, but is not in the known lemma files, remove it.  Makes it easy to look for ones which have been manually edited")
+    add_profile_args(parser)
     args = parser.parse_args()
+    profiler = profiler_from_args(args, "merge_lemmas")
 
-    tsv_files = glob.glob("../lemmas/*.tsv")
-    lemmas = read_tsv_files(tsv_files)
+    with profiler.stage("read lemmas"):
+        tsv_files = glob.glob("../lemmas/*.tsv")
+        lemmas = read_tsv_files(tsv_files)
+        normalized_lemmas = normalize_lemmas(lemmas)
 
     filenames = get_filenames()
 
+    variants = Counter()
     for filename in filenames:
-        set_lemmas(filename, lemmas, args.remove_existing)
+        variants.update(set_lemmas(filename, lemmas, normalized_lemmas, args.remove_existing, profiler))
+
+    if variants:
+        print("%d words are only in the lemma files under another spelling.  Their lemmas were not changed:" % len(variants), file=sys.stderr)
+        for (word, upos, lemma, variant_lemma), count in variants.most_common():
+            print("%s\t%s\t%s\t%s\t%d" % (word, upos, lemma, variant_lemma, count), file=sys.stderr)
+
+    profiler.finish()
 
 if __name__ == '__main__':
     main()
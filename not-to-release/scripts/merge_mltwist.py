@@ -1,25 +1,230 @@
-from stanza.utils.conll import CoNLL
-from validate import validate
+"""
+Merge the dependencies from MLtwist output files into the annotated files
 
-new_doc = CoNLL.conll2doc("sd_isra.leftover_output_jul_14_2024")
-orig_doc = CoNLL.conll2doc("sd_isra.leftover.conllu")
+MLtwist sends back each batch renumbered from sent_id 1, sometimes
+with sentences dropped, repeated or resplit, so the sentences are
+matched to the files they came from by normalized text (see
+normalize.py) rather than by position:
 
-for new_sent, orig_sent in zip(new_doc.sentences, orig_doc.sentences):
-  new_sent.sent_id = orig_sent.sent_id
+  python3 merge_mltwist.py ../mltwist_dependencies/sd_isra.leftover_output_jul_14_2024
+  python3 merge_mltwist.py ../mltwist_dependencies/*output* --dry_run --log mltwist.jsonl
 
-problem_sentences = validate(new_doc)
+Each output file is read and checked with validate.py in its own
+process.  A sentence is merged into every copy of it in the target
+files, by default ../dependencies/*.conllu, if it passes validation
+and has the same words as the copy.  As before, the heads and deprels
+are copied over, and a changed UPOS replaces the old one and blanks
+the xpos and features.  The outputs are ordered by the date in their
+names, such as _output_jul_28_2024, and a file without a date is an
+error.  If more than one output has the same sentence, the most recent
+one wins, and within one output the last copy wins.  Each target file
+is written once, at the end, and only if something in it changed.
 
+--log writes one json line per output sentence, with its status:
+merged, unchanged, superseded (by a later output), repeated (later in
+the same output), unmatched, tokenization or invalid.
+"""
 
-for sent_idx, (new_sent, orig_sent) in enumerate(zip(new_doc.sentences, orig_doc.sentences)):
-  if sent_idx in problem_sentences:
-    continue
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import glob
+import io
+import json
+import os
+import sys
 
-  for new_word, orig_word in zip(new_sent.words, orig_sent.words):
-    if orig_word.upos != new_word.upos:
-      orig_word.upos = new_word.upos
-      orig_word.xpos = None
-      orig_word.feats = None
-    orig_word.head = new_word.head
-    orig_word.deprel = new_word.deprel
+from annotation_history import date_from_name
+from check_consistency import sentence_key
+from conllu_io import read_conllu, write_conllu
+from normalize import normalize_word
 
-CoNLL.write_doc2conll(orig_doc, "sd_isra.leftover.conllu")
+DEFAULT_TARGETS = "../dependencies/*.conllu"
+
+def sentence_lines(doc):
+    """
+    The line number in the file where each sentence starts
+    """
+    lines = []
+    line = doc.prefix.count("\n") + 1
+    for sentence in doc.sentences:
+        lines.append(line)
+        line += sentence.to_text().count("\n")
+    return lines
+
+def validate_output(filename, check_xpos=False, check_feats=False):
+    """
+    Read one output file and run validate.py on it
+
+    Returns the doc, the line each sentence starts on, and a map from
+    the index of each sentence with a problem to what validate.py
+    printed about it
+    """
+    from stanza.utils.conll import CoNLL
+    from validate import validate
+
+    doc = read_conllu(filename)
+    stanza_doc = CoNLL.conll2doc(filename, keep_line_numbers=True)
+    if len(stanza_doc.sentences) != len(doc.sentences):
+        raise ValueError("Read %d sentences from %s with stanza, but %d with conllu_io" % (len(stanza_doc.sentences), filename, len(doc.sentences)))
+    with redirect_stdout(io.StringIO()):
+        problems = validate(stanza_doc, check_xpos=check_xpos, check_feats=check_feats)
+
+    # the report for the whole file is not split by sentence, so each problem sentence is checked again on its own
+    reports = {}
+    for sent_idx in sorted(problems):
+        sentence = doc.sentences[sent_idx]
+        text = "\n".join(sentence.comments + [row.to_line() for row in sentence.rows]) + "\n\n"
+        report = io.StringIO()
+        with redirect_stdout(report):
+            validate(CoNLL.conll2doc(input_str=text, keep_line_numbers=True), check_xpos=check_xpos, check_feats=check_feats)
+        reports[sent_idx] = [line for line in report.getvalue().split("\n") if line.strip()]
+    return doc, sentence_lines(doc), reports
+
+def same_words(first, second):
+    first_words = first.words
+    second_words = second.words
+    if len(first_words) != len(second_words):
+        return False
+    return all(normalize_word(x.form) == normalize_word(y.form) for x, y in zip(first_words, second_words))
+
+def merge_sentence(new_sentence, orig_sentence):
+    """
+    Copy the UPOS, heads and deprels from new_sentence, returning True if anything changed
+    """
+    changed = False
+    for new_word, orig_word in zip(new_sentence.words, orig_sentence.words):
+        if orig_word.upos != new_word.upos:
+            orig_word.upos = new_word.upos
+            orig_word.xpos = "_"
+            orig_word.feats = "_"
+            changed = True
+        if (orig_word.head, orig_word.deprel) != (new_word.head, new_word.deprel):
+            orig_word.head = new_word.head
+            orig_word.deprel = new_word.deprel
+            changed = True
+    return changed
+
+def index_targets(filenames):
+    """
+    Read the target files and map each sentence key to its (file index, sentence index) copies
+    """
+    docs = []
+    index = {}
+    for file_idx, filename in enumerate(filenames):
+        doc = read_conllu(filename)
+        docs.append(doc)
+        for sent_idx, sentence in enumerate(doc.sentences):
+            index.setdefault(sentence_key(sentence), []).append((file_idx, sent_idx))
+    return docs, index
+
+def align_outputs(outputs, target_docs, index):
+    """
+    Decide what happens to every sentence of every output file
+
+    outputs is a list of (filename, doc, lines, reports), oldest first.
+    Returns the log entries and a map from each target copy to the
+    (output index, sentence index) which is merged into it
+    """
+    entries = []
+    merges = {}
+    owner = {}
+    for output_idx, (filename, doc, lines, reports) in enumerate(outputs):
+        for sent_idx, sentence in enumerate(doc.sentences):
+            entry = {"output": filename, "line": lines[sent_idx], "sent_id": sentence.sent_id, "text": sentence.text}
+            entries.append(entry)
+            copies = index.get(sentence_key(sentence))
+            if sent_idx in reports:
+                entry["status"] = "invalid"
+                entry["problems"] = reports[sent_idx]
+                continue
+            if not copies:
+                entry["status"] = "unmatched"
+                continue
+            entry["targets"] = []
+            for file_idx, target_idx in copies:
+                if not same_words(sentence, target_docs[file_idx].sentences[target_idx]):
+                    continue
+                previous = owner.get((file_idx, target_idx))
+                if previous is not None and previous["output"] == filename:
+                    previous["status"] = "repeated"
+                    previous["repeated_at"] = lines[sent_idx]
+                elif previous is not None:
+                    previous["status"] = "superseded"
+                    previous["superseded_by"] = filename
+                owner[(file_idx, target_idx)] = entry
+                merges[(file_idx, target_idx)] = (output_idx, sent_idx)
+                entry["targets"].append((file_idx, target_idx))
+            if not entry["targets"]:
+                entry["status"] = "tokenization"
+                del entry["targets"]
+            else:
+                entry["status"] = "merged"
+    return entries, merges
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge MLtwist dependency outputs into the annotated files, matching sentences by text')
+    parser.add_argument('outputs', nargs='+', help='MLtwist output files, with dates in their names.  When two have the same sentence, the more recent one wins')
+    parser.add_argument('--targets', nargs='+', default=[DEFAULT_TARGETS], help='Files or globs to merge into.  Defaults to %s' % DEFAULT_TARGETS)
+    parser.add_argument('--check_xpos', action='store_true', default=False, help="Also validate the xpos, which MLtwist leaves blank")
+    parser.add_argument('--check_feats', action='store_true', default=False, help="Also validate the features, which MLtwist leaves blank")
+    parser.add_argument('--workers', type=int, default=None, help='How many processes to validate the outputs with')
+    parser.add_argument('--log', default=None, help='Write what happened to each output sentence to this file, one json object per line')
+    parser.add_argument('--dry_run', action='store_true', default=False, help="Report what would be merged, but don't write the target files")
+    args = parser.parse_args()
+
+    dates = {filename: date_from_name(filename) for filename in args.outputs}
+    undated = [filename for filename, date in dates.items() if date is None]
+    if undated:
+        raise ValueError("Cannot tell the order of the outputs without a date in their names: %s" % ", ".join(undated))
+    # a shell glob sorts by name, not by date, so the outputs are put in date order here
+    outputs = sorted(dict.fromkeys(args.outputs), key=lambda x: dates[x])
+
+    targets = []
+    for pattern in args.targets:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError("Target %s matched nothing" % pattern)
+        targets.extend(x for x in matches if x not in targets)
+    target_docs, index = index_targets(targets)
+
+    workers = args.workers if args.workers is not None else min(os.cpu_count() or 1, len(outputs))
+    if workers <= 1:
+        results = [validate_output(x, args.check_xpos, args.check_feats) for x in outputs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(validate_output, outputs, [args.check_xpos] * len(outputs), [args.check_feats] * len(outputs)))
+    output_docs = [(filename,) + result for filename, result in zip(outputs, results)]
+
+    entries, merges = align_outputs(output_docs, target_docs, index)
+
+    changed_copies = set()
+    for (file_idx, target_idx), (output_idx, sent_idx) in merges.items():
+        if merge_sentence(output_docs[output_idx][1].sentences[sent_idx], target_docs[file_idx].sentences[target_idx]):
+            changed_copies.add((file_idx, target_idx))
+    changed_files = {file_idx for file_idx, _ in changed_copies}
+    for entry in entries:
+        if "targets" not in entry:
+            continue
+        if entry["status"] == "merged" and not any(x in changed_copies for x in entry["targets"]):
+            entry["status"] = "unchanged"
+        entry["targets"] = ["%s#%s" % (targets[file_idx], target_docs[file_idx].sentences[target_idx].sent_id or target_idx)
+                            for file_idx, target_idx in entry["targets"]]
+
+    for file_idx in sorted(changed_files):
+        if not args.dry_run:
+            write_conllu(target_docs[file_idx], targets[file_idx])
+        print("%s %s" % ("Would update" if args.dry_run else "Updated", targets[file_idx]), file=sys.stderr)
+
+    for filename in outputs:
+        counts = Counter(entry["status"] for entry in entries if entry["output"] == filename)
+        print("%s %s: %s" % (dates[filename], filename, ", ".join("%d %s" % (counts[x], x) for x in ("merged", "unchanged", "superseded", "repeated", "unmatched", "tokenization", "invalid") if counts[x])), file=sys.stderr)
+
+    if args.log:
+        with open(args.log, "w", encoding="utf-8") as fout:
+            for entry in entries:
+                fout.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+if __name__ == '__main__':
+    main()
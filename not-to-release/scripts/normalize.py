@@ -0,0 +1,77 @@
+"""
+Orthographic normalization of Sindhi text for lookups and deduplication
+
+The corpus mixes several spellings of the same word:
+  - ھ (heh doachashmee) and ہ (Urdu heh goal) for ه, as in هجي / ھجي or نه / نہ
+  - ی (Farsi yeh) and ى (alef maksura) for ي
+  - ك (Arabic kaf) for ڪ
+  - zero width joiners, marks, and the tatweel ـ used to stretch letters
+Keys for lookups are built with normalize_word or normalize_text, so
+that the variant spellings do not have to be listed by hand.  The
+annotations themselves are never changed.
+
+normalize_text also maps the Arabic script punctuation and digits to
+their ASCII equivalents and drops whitespace, for comparing whole
+sentences.
+"""
+
+import unicodedata
+
+WORD_TABLE = str.maketrans({
+    "ھ": "ه",     # U+06BE heh doachashmee
+    "ہ": "ه",     # U+06C1 heh goal
+    "ۀ": "ه",     # U+06C0 heh with yeh above
+    "ە": "ه",     # U+06D5 ae
+    "ی": "ي",     # U+06CC farsi yeh
+    "ى": "ي",     # U+0649 alef maksura
+    "ك": "ڪ",     # U+0643 arabic kaf
+    "\u0640": None,  # tatweel
+    "\u200b": None,  # zero width space
+    "\u200c": None,  # zero width non-joiner
+    "\u200d": None,  # zero width joiner
+    "\u200e": None,  # left to right mark
+    "\u200f": None,  # right to left mark
+    "\ufeff": None,  # byte order mark
+})
+
+PUNCT_TABLE = str.maketrans({
+    "،": ",",
+    "۔": ".",
+    "؟": "?",
+    "؛": ";",
+    "٪": "%",
+    **{chr(0x0660 + x): str(x) for x in range(10)},
+    **{chr(0x06F0 + x): str(x) for x in range(10)},
+})
+
+def normalize_word(word):
+    """
+    The lookup key for a single word: letter variants merged, invisible characters removed
+    """
+    if word is None:
+        return None
+    return unicodedata.normalize("NFC", word).translate(WORD_TABLE)
+
+def normalize_text(text):
+    """
+    The lookup key for a sentence: normalize_word plus punctuation and digits, with no whitespace
+    """
+    if text is None:
+        return None
+    return "".join(normalize_word(text).translate(PUNCT_TABLE).split())
+
+def normalize_keys(mapping):
+    """
+    Rebuild a dict keyed by words so that it is keyed by normalized words
+
+    The values for keys which normalize to the same word are combined if
+    they are lists, otherwise the first one is kept
+    """
+    normalized = {}
+    for key, value in mapping.items():
+        key = normalize_word(key)
+        if key in normalized and isinstance(value, list):
+            normalized[key] = normalized[key] + [x for x in value if x not in normalized[key]]
+        else:
+            normalized.setdefault(key, value)
+    return normalized
@@ -0,0 +1,311 @@
+"""
+An on-disk cache of Sindhi Stanza pipeline output
+
+Each sentence is stored as CoNLL-U text in a file named by the hash of
+  - the sentence text
+  - the language, processors, package, and any other pipeline options
+  - the hashes of the model files in the stanza resources directory
+so retraining or redownloading a model invalidates the old entries.
+
+The cache is bounded in size.  Entries are touched when read, and the
+least recently used entries are deleted once the cache gets too large.
+
+Typical use:
+
+  pipe = CachedPipeline("sd", "tokenize,pos,lemma,depparse", "default_accurate")
+  sentences = pipe(["first sentence", "second sentence"])
+  print(pipe.cache.stats())
+
+The Stanza pipeline itself is only built if there is a cache miss, or
+if there are no models yet for it to download.  The models are hashed
+again once the pipeline is built, as building it may update them.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ud_sindhi_isra", "pipeline")
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+MODEL_HASH_FILE = "model_hashes.json"
+
+def hash_file(filename, chunk_size=1024*1024):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as fin:
+        while True:
+            chunk = fin.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def hash_model_files(model_dir, lang, known_hashes=None):
+    """
+    Return a single hash of every model file for lang in model_dir
+
+    known_hashes maps filename -> (size, mtime_ns, sha) and is updated in
+    place, so that the (large) model files only get rehashed when they change
+    """
+    if known_hashes is None:
+        known_hashes = {}
+    filenames = sorted(x for x in glob.glob(os.path.join(model_dir, lang, "**"), recursive=True) if os.path.isfile(x))
+    if len(filenames) == 0:
+        raise FileNotFoundError("No %s models found in %s" % (lang, model_dir))
+    sha = hashlib.sha256()
+    for filename in filenames:
+        stat = os.stat(filename)
+        known = known_hashes.get(filename)
+        if known is None or known[0] != stat.st_size or known[1] != stat.st_mtime_ns:
+            known = (stat.st_size, stat.st_mtime_ns, hash_file(filename))
+            known_hashes[filename] = known
+        sha.update(os.path.relpath(filename, model_dir).encode("utf-8"))
+        sha.update(known[2].encode("utf-8"))
+    return sha.hexdigest()
+
+class PipelineCache:
+    """
+    Stores one CoNLL-U string per key in cache_dir, evicting the least recently used entries past max_bytes
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> (mtime_ns, size)
+        self.entries = {}
+        self.total_bytes = 0
+        self.last_touch = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        for filename in glob.glob(os.path.join(cache_dir, "*", "*.conllu")):
+            stat = os.stat(filename)
+            key = os.path.split(filename)[1][:-len(".conllu")]
+            self.entries[key] = (stat.st_mtime_ns, stat.st_size)
+            self.total_bytes += stat.st_size
+            self.last_touch = max(self.last_touch, stat.st_mtime_ns)
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".conllu")
+
+    def touch(self, path):
+        """
+        Set the mtime of path to now, making sure it is strictly newer than any other entry
+
+        Some filesystems only keep coarse timestamps, which would make the LRU order ambiguous
+        """
+        now = max(time.time_ns(), self.last_touch + 1)
+        self.last_touch = now
+        os.utime(path, ns=(now, now))
+        return now
+
+    def get(self, key, count=True):
+        """
+        Return the text stored for key, or None.  With count=False, the lookup is left out of the hits and misses
+        """
+        if key not in self.entries:
+            self.misses += count
+            return None
+        path = self.entry_path(key)
+        try:
+            with open(path, encoding="utf-8") as fin:
+                text = fin.read()
+        except FileNotFoundError:
+            # someone else cleaned up the cache
+            self.total_bytes -= self.entries.pop(key)[1]
+            self.misses += count
+            return None
+        self.entries[key] = (self.touch(path), self.entries[key][1])
+        self.hits += count
+        return text
+
+    def put(self, key, text):
+        path = self.entry_path(key)
+        os.makedirs(os.path.split(path)[0], exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fout:
+            fout.write(text)
+        os.replace(temp_path, path)
+        size = os.stat(path).st_size
+        if key in self.entries:
+            self.total_bytes -= self.entries[key][1]
+        self.entries[key] = (self.touch(path), size)
+        self.total_bytes += size
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self.entries, key=lambda x: self.entries[x][0]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self.entry_path(key))
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= self.entries.pop(key)[1]
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+        }
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups > 0 else 0.0
+        return "Pipeline cache %s: %d hits, %d misses (%.2f hit rate), %d evictions, %d entries, %d bytes" % (self.cache_dir, self.hits, self.misses, hit_rate, self.evictions, len(self.entries), self.total_bytes)
+
+def process_in_batches(pipe, texts, batch_size=32):
+    """
+    Process the given sentence texts, batch_size sentences per pipeline call
+
+    The pipeline is expected to be built with tokenize_no_ssplit, so
+    each \n\n separated chunk comes back as exactly one sentence.
+    Returns one stanza Sentence per input text, in the same order.
+    """
+    parsed = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start+batch_size]
+        doc = pipe("\n\n".join(batch))
+        if len(doc.sentences) != len(batch):
+            raise ValueError("Processing %d sentences starting at %d produced %d sentences" % (len(batch), start, len(doc.sentences)))
+        parsed.extend(doc.sentences)
+    return parsed
+
+def sentence_to_conll(sentence):
+    """
+    Format one sentence without the character offsets, which are relative to the batch it was processed in
+    """
+    for token in sentence.tokens:
+        token._start_char = None
+        token._end_char = None
+    for word in sentence.words:
+        word._start_char = None
+        word._end_char = None
+    return "{:C}".format(sentence)
+
+class CachedPipeline:
+    """
+    Wraps a tokenize_no_ssplit stanza Pipeline with a PipelineCache
+
+    Sentences are always returned as parsed from the cached CoNLL-U,
+    so a hit and a miss give exactly the same result.  If cache_dir
+    is None, nothing is cached.
+    """
+    def __init__(self, lang, processors, package, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, model_dir=None, **kwargs):
+        self.lang = lang
+        self.processors = processors
+        self.package = package
+        self.kwargs = kwargs
+        self.pipe = None
+
+        if model_dir is None:
+            from stanza.resources.common import DEFAULT_MODEL_DIR
+            model_dir = kwargs.get("dir", DEFAULT_MODEL_DIR)
+        self.model_dir = model_dir
+
+        # computed on the first lookup, as the models may not have been downloaded yet
+        self.config_hash = None
+        self.cache = None if cache_dir is None else PipelineCache(cache_dir, max_bytes)
+
+    def hash_config(self):
+        """
+        Hash the pipeline options and the model files, or return None if there are no models yet
+        """
+        model_hash_file = os.path.join(self.cache.cache_dir, MODEL_HASH_FILE)
+        known_hashes = {}
+        if os.path.exists(model_hash_file):
+            with open(model_hash_file, encoding="utf-8") as fin:
+                known_hashes = json.load(fin)
+        try:
+            model_hash = hash_model_files(self.model_dir, self.lang, known_hashes)
+        except FileNotFoundError:
+            return None
+        with open(model_hash_file, "w", encoding="utf-8") as fout:
+            json.dump(known_hashes, fout, indent=2)
+
+        config = [self.lang, self.processors, self.package, sorted((k, repr(v)) for k, v in self.kwargs.items()), model_hash]
+        return hashlib.sha256(json.dumps(config, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def sentence_key(self, text):
+        sha = hashlib.sha256(self.config_hash.encode("utf-8"))
+        sha.update(text.encode("utf-8"))
+        return sha.hexdigest()
+
+    def get_pipeline(self):
+        if self.pipe is None:
+            from stanza import Pipeline
+            self.pipe = Pipeline(self.lang, processors=self.processors, package=self.package, dir=self.model_dir, tokenize_no_ssplit=True, **{k: v for k, v in self.kwargs.items() if k != "dir"})
+        return self.pipe
+
+    def lookup(self, texts):
+        """
+        Return the cache key of each text and its cached CoNLL-U, or None if it is not cached
+
+        If anything is missing, the pipeline is built first, as that
+        can download newer models, and the lookup is repeated if the
+        models changed.  Only the final lookup counts as hits and misses.
+        """
+        if self.config_hash is None:
+            self.config_hash = self.hash_config()
+        if self.config_hash is None:
+            # building the pipeline downloads the models, which can then be hashed
+            self.get_pipeline()
+            self.config_hash = self.hash_config()
+            if self.config_hash is None:
+                raise FileNotFoundError("No %s models found in %s after building the pipeline" % (self.lang, self.model_dir))
+
+        keys = [self.sentence_key(text) for text in texts]
+        results = [self.cache.get(key, count=False) for key in keys]
+        if self.pipe is None and any(result is None for result in results):
+            self.get_pipeline()
+            config_hash = self.hash_config()
+            if config_hash != self.config_hash:
+                self.config_hash = config_hash
+                keys = [self.sentence_key(text) for text in texts]
+                results = [self.cache.get(key, count=False) for key in keys]
+        misses = sum(1 for result in results if result is None)
+        self.cache.hits += len(results) - misses
+        self.cache.misses += misses
+        return keys, results
+
+    def process_conll(self, texts, batch_size=32):
+        """
+        Return a list of CoNLL-U strings, one per text
+        """
+        if self.cache is None:
+            return [sentence_to_conll(x) for x in process_in_batches(self.get_pipeline(), texts, batch_size)]
+
+        keys, results = self.lookup(texts)
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if len(missing) > 0:
+            # a text repeated in this call only needs to be processed once
+            unique_missing = list(dict.fromkeys(texts[idx] for idx in missing))
+            parsed = process_in_batches(self.get_pipeline(), unique_missing, batch_size)
+            parsed = {text: sentence_to_conll(sentence) for text, sentence in zip(unique_missing, parsed)}
+            for idx in missing:
+                results[idx] = parsed[texts[idx]]
+                self.cache.put(keys[idx], results[idx])
+            self.cache.evict()
+        return results
+
+    def __call__(self, texts, batch_size=32):
+        """
+        Return a list of stanza Sentences, one per text
+        """
+        from stanza.utils.conll import CoNLL
+
+        if len(texts) == 0:
+            return []
+        conll = self.process_conll(texts, batch_size)
+        doc = CoNLL.conll2doc(input_str="\n\n".join(x.strip() for x in conll) + "\n\n")
+        if len(doc.sentences) != len(texts):
+            raise ValueError("Expected %d sentences from the cached pipeline, but got %d" % (len(texts), len(doc.sentences)))
+        return doc.sentences
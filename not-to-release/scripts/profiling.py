@@ -0,0 +1,228 @@
+"""
+Optional timing and memory instrumentation for the corpus scripts
+
+A script adds the options with add_profile_args and builds a Profiler
+from its arguments.  The work is then split into named stages:
+
+  profiler = profiler_from_args(args, "merge_lemmas")
+  with profiler.stage("parse") as stage:
+      doc = CoNLL.conll2doc(filename)
+      stage.add_doc(doc)
+  ...
+  profiler.finish()
+
+Without --profile the stages do nothing.  With --profile, each stage
+records its wall time, the peak traced memory while it ran, and the
+sentences and words it processed, and finish() writes a json report
+to --profile_output, or SCRIPT.profile.json by default.
+Stages with the same name, such as one per file, are added together.
+--profile_cprofile also saves cProfile stats for the whole run,
+which can be read with pstats or snakeviz.
+
+Two reports can be compared with
+
+  python3 profiling.py old.json new.json
+"""
+
+import argparse
+import cProfile
+from contextlib import contextmanager
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+class Stage:
+    """
+    The totals for one named stage
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak_memory = 0
+        self.memory_change = 0
+        self.sentences = 0
+        self.words = 0
+
+    def add(self, sentences=0, words=0):
+        self.sentences += sentences
+        self.words += words
+
+    def add_doc(self, doc):
+        self.add(len(doc.sentences), sum(len(sentence.words) for sentence in doc.sentences))
+
+    def to_json(self):
+        result = {
+            "name": self.name,
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "peak_memory": self.peak_memory,
+            "memory_change": self.memory_change,
+            "sentences": self.sentences,
+            "words": self.words,
+        }
+        if self.seconds > 0:
+            result["sentences_per_second"] = self.sentences / self.seconds
+            result["words_per_second"] = self.words / self.seconds
+        return result
+
+class NoStage:
+    """
+    Stands in for a Stage when profiling is off
+    """
+    def add(self, sentences=0, words=0):
+        pass
+
+    def add_doc(self, doc):
+        pass
+
+NO_STAGE = NoStage()
+
+class Profiler:
+    def __init__(self, script, enabled=False, output=None, trace_memory=True, cprofile_output=None):
+        self.script = script
+        self.enabled = enabled
+        self.output = output
+        self.trace_memory = enabled and trace_memory
+        self.cprofile_output = cprofile_output if enabled else None
+        self.stages = {}
+        # peaks seen by the stages which are currently running, outermost first
+        self.running = []
+        self.start_time = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.cprofile = None
+        if self.cprofile_output:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield NO_STAGE
+            return
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # resetting the peak would otherwise lose it for the stages this one is nested in
+            self.running = [max(x, peak) for x in self.running]
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+        self.running.append(0)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds += time.perf_counter() - start
+            stage.calls += 1
+            peak = self.running.pop()
+            if self.trace_memory:
+                end, traced_peak = tracemalloc.get_traced_memory()
+                peak = max(peak, traced_peak)
+                self.running = [max(x, peak) for x in self.running]
+                stage.peak_memory = max(stage.peak_memory, peak)
+                stage.memory_change += end - current
+
+    def report(self):
+        report = {
+            "script": self.script,
+            "argv": sys.argv[1:],
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "total_seconds": time.perf_counter() - self.start_time,
+            "stages": [stage.to_json() for stage in self.stages.values()],
+        }
+        if self.trace_memory:
+            report["peak_memory"] = max([stage.peak_memory for stage in self.stages.values()] + [tracemalloc.get_traced_memory()[1]])
+        return report
+
+    def finish(self):
+        """
+        Stop profiling and write the report, if profiling is on
+        """
+        if not self.enabled:
+            return None
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_output)
+            print("Wrote cProfile stats to %s" % self.cprofile_output, file=sys.stderr)
+        report = self.report()
+        if self.trace_memory:
+            tracemalloc.stop()
+        with open(self.output, "w", encoding="utf-8") as fout:
+            json.dump(report, fout, indent=2)
+        print_report(report)
+        print("Wrote profile to %s" % self.output, file=sys.stderr)
+        return report
+
+def add_profile_args(parser):
+    parser.add_argument('--profile', action='store_true', default=False, help='Time each stage and write a json report')
+    parser.add_argument('--profile_output', default=None, help='With --profile, write the report to this file instead of SCRIPT.profile.json')
+    parser.add_argument('--profile_cprofile', default=None, help='With --profile, also save cProfile stats to this file')
+    parser.add_argument('--profile_no_memory', dest='profile_memory', action='store_false', default=True, help="With --profile, don't trace memory, which is much faster")
+
+def profiler_from_args(args, script):
+    if not args.profile:
+        return Profiler(script)
+    output = args.profile_output if args.profile_output else "%s.profile.json" % script
+    return Profiler(script, enabled=True, output=output, trace_memory=args.profile_memory, cprofile_output=args.profile_cprofile)
+
+def format_memory(num_bytes):
+    if num_bytes is None:
+        return "-"
+    return "%.1fM" % (num_bytes / 1024 / 1024)
+
+def print_report(report):
+    print("%-24s %6s %9s %9s %10s %10s" % ("stage", "calls", "seconds", "peak", "sent/s", "words/s"), file=sys.stderr)
+    for stage in report["stages"]:
+        print("%-24s %6d %9.3f %9s %10.0f %10.0f" % (stage["name"], stage["calls"], stage["seconds"], format_memory(stage["peak_memory"] if "peak_memory" in report else None),
+                                                     stage.get("sentences_per_second", 0), stage.get("words_per_second", 0)), file=sys.stderr)
+    print("%-24s %6s %9.3f %9s" % ("total", "", report["total_seconds"], format_memory(report.get("peak_memory"))), file=sys.stderr)
+
+def percent_change(old_seconds, new_seconds):
+    if old_seconds is None or new_seconds is None:
+        return "-"
+    if old_seconds == 0:
+        return "n/a"
+    return "%+.1f%%" % (100 * (new_seconds - old_seconds) / old_seconds)
+
+def compare_reports(old, new):
+    old_stages = {stage["name"]: stage for stage in old["stages"]}
+    new_stages = {stage["name"]: stage for stage in new["stages"]}
+    names = list(old_stages) + [name for name in new_stages if name not in old_stages]
+    print("%-24s %9s %9s %8s %9s %9s" % ("stage", "old s", "new s", "change", "old peak", "new peak"))
+    for name in names:
+        old_stage = old_stages.get(name)
+        new_stage = new_stages.get(name)
+        old_seconds = old_stage["seconds"] if old_stage else None
+        new_seconds = new_stage["seconds"] if new_stage else None
+        print("%-24s %9s %9s %8s %9s %9s" % (name,
+                                            "%.3f" % old_seconds if old_seconds is not None else "-",
+                                            "%.3f" % new_seconds if new_seconds is not None else "-",
+                                            percent_change(old_seconds, new_seconds),
+                                            format_memory(old_stage.get("peak_memory") if old_stage and "peak_memory" in old else None),
+                                            format_memory(new_stage.get("peak_memory") if new_stage and "peak_memory" in new else None)))
+    print("%-24s %9.3f %9.3f %8s" % ("total", old["total_seconds"], new["total_seconds"], percent_change(old["total_seconds"], new["total_seconds"])))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two profile reports')
+    parser.add_argument('old', help='The earlier report')
+    parser.add_argument('new', help='The later report')
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as fin:
+        old = json.load(fin)
+    with open(args.new, encoding="utf-8") as fin:
+        new = json.load(fin)
+    compare_reports(old, new)
+
+if __name__ == '__main__':
+    main()
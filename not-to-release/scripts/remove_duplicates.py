@@ -1,5 +1,7 @@
 from stanza.utils.conll import CoNLL
 
+from normalize import normalize_text
+
 files = [
     "sd_isra_initial_gold_100.conllu",
     "Sindhi_50Sentences_Jan_17.conllu",
@@ -27,7 +29,7 @@ for filename in files:
     for sentence in doc.sentences:
         if not sentence.text or not sentence.text.strip():
             print(filename, sentence.sent_id)
-        text = sentence.text.strip()
+        text = normalize_text(sentence.text)
         if text in known_text:
             continue
         known_text.add(text)
@@ -0,0 +1,266 @@
+"""
+Rank the sentences of another language's treebank by how much they look like the Sindhi corpus
+
+build_stanza_training_set.py mixes Hindi, Urdu, Tamil or Marathi trees
+into the training data.  Rather than a random sample, each auxiliary
+sentence is scored against a profile of the Sindhi sentences on:
+
+  forms    the share of its words which are also Sindhi words, once
+           Urdu spelling and Hindi Devanagari are transliterated into
+           Sindhi letters
+  upos     the cosine between its UPOS bigrams and the Sindhi ones
+  deprel   the cosine between its deprels, without subtypes, and the Sindhi ones
+  length   how typical its length is, from the mean and deviation of the Sindhi log lengths
+
+The score is the weighted mean of the four, each between 0 and 1.
+The sentences are flattened into arrays of word ids with the start of
+each sentence, so a whole treebank such as HDTB is scored with a few
+numpy operations rather than a loop over its sentences.
+
+  python3 select_auxiliary.py ../../sd_isra-ud-train.conllu --aux hi_hdtb-ud-train.conllu --top 1000 --output hindi_selected.conllu
+  python3 select_auxiliary.py ../../sd_isra-ud-train.conllu --aux ur_udtb-ud-train.conllu --urdu --show 10
+"""
+
+import argparse
+import unicodedata
+
+import numpy as np
+
+from conllu_io import ConlluDoc, read_conllu, write_conllu
+from normalize import normalize_word
+
+DEFAULT_WEIGHTS = {"forms": 1.0, "upos": 1.0, "deprel": 1.0, "length": 0.5}
+
+# UPOS which say nothing about the vocabulary
+NON_LEXICAL_UPOS = ("PUNCT", "NUM", "SYM", "X")
+
+# Urdu letters and digraphs which Sindhi writes differently.  The single
+# letters go first, so the digraphs are written with the Sindhi letters,
+# and the ک of کھ is not turned back into ڪ afterwards.
+# Sindhi uses ک for kh, so this is only applied to a treebank known to be Urdu
+URDU_TO_SINDHI = [
+    ("ک", "ڪ"), ("ٹ", "ٽ"), ("ڈ", "ڊ"), ("ڑ", "ڙ"), ("ے", "ي"),
+    ("ڪھ", "ک"), ("بھ", "ڀ"), ("تھ", "ٿ"), ("ٽھ", "ٺ"), ("پھ", "ڦ"),
+    ("چھ", "ڇ"), ("دھ", "ڌ"), ("ڊھ", "ڍ"),
+]
+
+DEVANAGARI_NUKTA = {
+    "क": "ق", "ख": "خ", "ग": "غ", "ज": "ز", "फ": "ف", "ड": "ڙ", "ढ": "ڙه",
+}
+
+DEVANAGARI = {
+    "क": "ڪ", "ख": "ک", "ग": "گ", "घ": "گه", "ङ": "ڱ",
+    "च": "چ", "छ": "ڇ", "ज": "ج", "झ": "جه", "ञ": "ڃ",
+    "ट": "ٽ", "ठ": "ٺ", "ड": "ڊ", "ढ": "ڍ", "ण": "ڻ",
+    "त": "ت", "थ": "ٿ", "द": "د", "ध": "ڌ", "न": "ن",
+    "प": "پ", "फ": "ڦ", "ब": "ب", "भ": "ڀ", "म": "م",
+    "य": "ي", "र": "ر", "ल": "ل", "व": "و", "श": "ش", "ष": "ش", "स": "س", "ह": "ه",
+    # the long vowel signs are written as letters in Sindhi, the short ones are usually left out
+    "ा": "ا", "ी": "ي", "ू": "و", "े": "ي", "ै": "ي", "ो": "و", "ौ": "و", "ॉ": "ا",
+    "ि": "", "ु": "", "ृ": "ر", "्": "", "ः": "", "ं": "ن", "ँ": "ن",
+    "अ": "ا", "आ": "آ", "इ": "ا", "ई": "اي", "उ": "ا", "ऊ": "او", "ऋ": "ر",
+    "ए": "اي", "ऐ": "اي", "ओ": "او", "औ": "او", "ऑ": "ا",
+}
+
+# an independent vowel after the start of a word follows another vowel, which Urdu and Sindhi write with hamza
+DEVANAGARI_MEDIAL = {
+    "इ": "ئ", "ई": "ئي", "ए": "ئي", "ऐ": "ئي",
+}
+
+def is_devanagari(word):
+    return any("ऀ" <= x <= "ॿ" for x in word)
+
+def strip_marks(word):
+    """
+    Drop the harakat and other combining marks, which are written inconsistently in all three languages
+    """
+    return "".join(x for x in word if not unicodedata.combining(x))
+
+def transliterate(word, urdu=False):
+    """
+    Spell a Hindi or Sindhi word, or an Urdu word if urdu is set, in Sindhi letters, for comparing it with the Sindhi vocabulary
+    """
+    if urdu:
+        word = unicodedata.normalize("NFC", word)
+        for urdu_letters, sindhi_letters in URDU_TO_SINDHI:
+            word = word.replace(urdu_letters, sindhi_letters)
+    word = unicodedata.normalize("NFD", word)
+    if is_devanagari(word):
+        letters = []
+        for idx, letter in enumerate(word):
+            if letter == "़":
+                continue
+            if idx + 1 < len(word) and word[idx + 1] == "़" and letter in DEVANAGARI_NUKTA:
+                letters.append(DEVANAGARI_NUKTA[letter])
+            elif idx > 0 and letter in DEVANAGARI_MEDIAL:
+                letters.append(DEVANAGARI_MEDIAL[letter])
+            else:
+                letters.append(DEVANAGARI.get(letter, letter))
+        word = "".join(letters)
+    return strip_marks(normalize_word(unicodedata.normalize("NFC", word)))
+
+def base_deprel(deprel):
+    return deprel.split(":")[0] if deprel else "_"
+
+def sentence_columns(sentences):
+    """
+    (forms, upos, deprels) for each conllu_io sentence
+    """
+    columns = []
+    for sentence in sentences:
+        words = sentence.words
+        columns.append(([x.form for x in words], [x.upos for x in words], [x.deprel for x in words]))
+    return columns
+
+class FlatSentences:
+    """
+    The words of many sentences in flat arrays, with the offset where each sentence starts
+    """
+    def __init__(self, columns, upos_vocab, deprel_vocab, urdu=False):
+        lengths = np.array([len(forms) for forms, _, _ in columns], dtype=np.int64)
+        self.lengths = lengths
+        self.offsets = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.sentence = np.repeat(np.arange(len(columns)), lengths)
+        # each distinct form is transliterated once, and the words refer to it by id
+        form_ids = {}
+        self.form_ids = np.array([form_ids.setdefault(form, len(form_ids)) for forms, _, _ in columns for form in forms], dtype=np.int64)
+        self.form_types = [transliterate(form, urdu) for form in form_ids]
+        self.upos = np.array([upos_vocab.setdefault(x, len(upos_vocab)) for _, upos, _ in columns for x in upos], dtype=np.int64)
+        self.deprel = np.array([deprel_vocab.setdefault(base_deprel(x), len(deprel_vocab)) for _, _, deprels in columns for x in deprels], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def count_matrix(self, feature_ids, size, rows=None):
+        """
+        A (sentences, size) matrix of how often each feature occurs in each sentence
+        """
+        rows = self.sentence if rows is None else rows
+        counts = np.bincount(rows * size + feature_ids, minlength=len(self) * size)
+        return counts.reshape(len(self), size).astype(np.float64)
+
+    def upos_bigrams(self, num_upos):
+        """
+        The UPOS bigram ids, with num_upos standing for the start and end of the sentence, and the sentence of each bigram
+        """
+        boundary = num_upos
+        first = self.offsets[:-1][self.lengths > 0]
+        previous = np.concatenate([[boundary], self.upos[:-1]])
+        previous[first] = boundary
+        bigrams = previous * (num_upos + 1) + self.upos
+        last = self.offsets[1:][self.lengths > 0] - 1
+        end_bigrams = self.upos[last] * (num_upos + 1) + boundary
+        return np.concatenate([bigrams, end_bigrams]), np.concatenate([self.sentence, self.sentence[last]])
+
+def cosine(matrix, profile):
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(profile)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(norms > 0, matrix @ profile / norms, 0.0)
+
+class CorpusProfile:
+    """
+    The vocabulary and the UPOS, deprel and length distributions of the Sindhi sentences
+    """
+    def __init__(self, columns):
+        self.upos_vocab = {}
+        self.deprel_vocab = {}
+        self.flat = FlatSentences(columns, self.upos_vocab, self.deprel_vocab)
+        self.vocab = {form for form in self.flat.form_types if form}
+        log_lengths = np.log(np.maximum(self.flat.lengths, 1))
+        self.length_mean = float(log_lengths.mean())
+        self.length_std = max(float(log_lengths.std()), 1e-3)
+
+    def score(self, columns, weights=None, urdu=False):
+        """
+        Score each sentence in columns, returning the combined scores and a dict of each component
+
+        urdu respells Urdu letters as Sindhi ones before comparing the forms
+        """
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        # the auxiliary treebank may add UPOS or deprels the Sindhi corpus never uses, which count against it
+        upos_vocab = dict(self.upos_vocab)
+        deprel_vocab = dict(self.deprel_vocab)
+        flat = FlatSentences(columns, upos_vocab, deprel_vocab, urdu)
+
+        # the bigram ids depend on how many UPOS there are, so the Sindhi bigrams are counted with the combined UPOS
+        num_upos = len(upos_vocab)
+        sindhi_bigrams, _ = self.flat.upos_bigrams(num_upos)
+        sindhi_upos = np.bincount(sindhi_bigrams, minlength=(num_upos + 1) ** 2).astype(np.float64)
+        aux_bigrams, bigram_rows = flat.upos_bigrams(num_upos)
+        upos_matrix = flat.count_matrix(aux_bigrams, (num_upos + 1) ** 2, bigram_rows)
+
+        sindhi_deprel = np.bincount(self.flat.deprel, minlength=len(deprel_vocab)).astype(np.float64)
+        deprel_matrix = flat.count_matrix(flat.deprel, len(deprel_vocab))
+
+        non_lexical = np.array([upos_vocab.get(x, -1) for x in NON_LEXICAL_UPOS])
+        lexical = ~np.isin(flat.upos, non_lexical)
+        known_types = np.array([form in self.vocab for form in flat.form_types], dtype=bool)
+        known = known_types[flat.form_ids] & lexical
+        lexical_counts = np.bincount(flat.sentence[lexical], minlength=len(flat)).astype(np.float64)
+        known_counts = np.bincount(flat.sentence[known], minlength=len(flat)).astype(np.float64)
+
+        z = (np.log(np.maximum(flat.lengths, 1)) - self.length_mean) / self.length_std
+        components = {
+            "forms": np.divide(known_counts, lexical_counts, out=np.zeros(len(flat)), where=lexical_counts > 0),
+            "upos": cosine(upos_matrix, sindhi_upos),
+            "deprel": cosine(deprel_matrix, sindhi_deprel),
+            "length": np.exp(-0.5 * z * z),
+        }
+        total_weight = sum(weights.values())
+        scores = sum(weights[name] * components[name] for name in weights) / total_weight
+        return scores, components
+
+def top_indices(scores, size):
+    """
+    The indices of the size best scores, in their original order, breaking ties by position
+    """
+    if size >= len(scores):
+        return np.arange(len(scores))
+    order = np.argsort(-scores, kind="stable")[:size]
+    return np.sort(order)
+
+def parse_weights(pieces):
+    weights = dict(DEFAULT_WEIGHTS)
+    for piece in pieces or []:
+        if "=" not in piece or piece.split("=")[0] not in DEFAULT_WEIGHTS:
+            raise ValueError("Expected a weight such as forms=1.0, one of %s, but got %s" % (", ".join(DEFAULT_WEIGHTS), piece))
+        name, value = piece.split("=", maxsplit=1)
+        weights[name] = float(value)
+    return weights
+
+def main():
+    parser = argparse.ArgumentParser(description='Score the sentences of an auxiliary treebank by their similarity to the Sindhi corpus')
+    parser.add_argument('sindhi', nargs='+', help='The Sindhi conllu files to build the profile from')
+    parser.add_argument('--aux', required=True, help='The auxiliary treebank to score')
+    parser.add_argument('--top', type=int, default=None, help='Keep this many of the best sentences')
+    parser.add_argument('--output', default=None, help='Write the kept sentences here')
+    parser.add_argument('--show', type=int, default=5, help='Print this many of the best and worst sentences')
+    parser.add_argument('--urdu', action='store_true', default=False, help='The auxiliary treebank is Urdu, so respell its Urdu letters as Sindhi ones')
+    parser.add_argument('--weights', nargs='+', default=None, help='Weights for the components, such as forms=2 length=0')
+    args = parser.parse_args()
+
+    sindhi_sentences = [sentence for filename in args.sindhi for sentence in read_conllu(filename).sentences]
+    profile = CorpusProfile(sentence_columns(sindhi_sentences))
+    aux_doc = read_conllu(args.aux)
+    scores, components = profile.score(sentence_columns(aux_doc.sentences), parse_weights(args.weights), args.urdu)
+
+    print("%d Sindhi sentences, %d auxiliary sentences" % (len(sindhi_sentences), len(aux_doc.sentences)))
+    for name, values in components.items():
+        print("%-8s mean %.3f" % (name, values.mean()))
+    order = np.argsort(-scores, kind="stable")
+    for title, indices in (("best", order[:args.show]), ("worst", order[::-1][:args.show])):
+        print(title)
+        for idx in indices:
+            sentence = aux_doc.sentences[idx]
+            print("  %.3f  %s  %s" % (scores[idx], " ".join("%s=%.2f" % (name, values[idx]) for name, values in components.items()),
+                                      sentence.text or " ".join(x.form for x in sentence.words)))
+
+    if args.top is not None:
+        kept = top_indices(scores, args.top)
+        print("Kept %d sentences, mean score %.3f against %.3f for all of them" % (len(kept), scores[kept].mean(), scores.mean()))
+        if args.output:
+            write_conllu(ConlluDoc([aux_doc.sentences[idx] for idx in kept], aux_doc.prefix), args.output)
+
+if __name__ == '__main__':
+    main()
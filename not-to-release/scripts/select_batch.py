@@ -0,0 +1,215 @@
+"""
+Choose the next batch of sentences to send to the annotators
+
+The candidates are Stanza's predictions for a pool of unannotated
+sentences, either a conllu file of predictions or a text file with
+one sentence per line, which is parsed with the cached pipeline.
+Each candidate is scored against the annotated corpus for:
+
+  - (form, UPOS) pairs which are not in the corpus yet
+  - deprels which are rare in the corpus
+  - words the model is probably unsure of: forms which are not in
+    the corpus, forms whose UPOS varies in the corpus, and, with
+    --compare, words where a second model's prediction differs
+
+The batch is built greedily, always taking the sentence which adds
+the most per token.  A new pair only counts for the first sentence
+which has it, and each rare deprel is worth less as the batch gets
+more of them, so the batch does not fill up with near repeats.
+
+  python3 select_batch.py pool.txt --size 500 --output sd_batch_6.conllu
+  python3 select_batch.py pool.pred.conllu --compare pool.pred2.conllu --size 500 --output sd_batch_6.conllu
+
+Sentences which are already annotated, by normalized text, are skipped.
+"""
+
+import argparse
+import heapq
+import sys
+
+import numpy as np
+
+from columnar_corpus import DEFAULT_CORPUS_DIR, load_corpus
+from conllu_io import ConlluDoc, parse_conllu, read_conllu, write_conllu
+from normalize import normalize_text
+from pipeline_cache import CachedPipeline, DEFAULT_CACHE_DIR
+
+class Reference:
+    """
+    What the annotated corpus already covers
+    """
+    def __init__(self, corpus):
+        vocab = corpus.vocab
+        form = np.asarray(corpus.form)
+        upos = np.asarray(corpus.upos)
+        deprel = np.asarray(corpus.deprel)
+        annotated = upos != corpus.vocab_id("upos", "_")
+
+        pair_ids = np.unique(form[annotated].astype(np.int64) * len(vocab["upos"]) + upos[annotated])
+        self.pairs = {(vocab["form"][x // len(vocab["upos"])], vocab["upos"][x % len(vocab["upos"])]) for x in pair_ids}
+
+        deprel_counts = np.bincount(deprel[deprel != corpus.vocab_id("deprel", "_")], minlength=len(vocab["deprel"]))
+        self.deprel_counts = {label: int(count) for label, count in zip(vocab["deprel"], deprel_counts)}
+
+        # how often each form has its most common UPOS
+        form_upos = np.zeros((len(vocab["form"]), len(vocab["upos"])), dtype=np.int32)
+        np.add.at(form_upos, (form[annotated], upos[annotated]), 1)
+        totals = form_upos.sum(axis=1)
+        seen = totals > 0
+        self.ambiguity = {vocab["form"][x]: float(1 - form_upos[x].max() / totals[x]) for x in np.nonzero(seen)[0]}
+
+        self.texts = {normalize_text(text) for text in vocab["text"]}
+
+class Pool:
+    """
+    The candidate sentences as flat per-word arrays
+    """
+    def __init__(self, doc, reference, compare_doc=None):
+        self.doc = doc
+        sentences = doc.sentences
+        lengths = np.array([len(sentence.words) for sentence in sentences], dtype=np.int64)
+        self.lengths = lengths
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.already_annotated = np.array([normalize_text(sentence.text or " ".join(word.form for word in sentence.words)) in reference.texts for sentence in sentences], dtype=bool)
+
+        words = [word for sentence in sentences for word in sentence.words]
+        self.word_sentence = np.repeat(np.arange(len(sentences)), lengths)
+
+        pair_ids = {}
+        self.pair = np.array([pair_ids.setdefault((word.form, word.upos), len(pair_ids)) for word in words], dtype=np.int64)
+        self.pair_is_new = np.array([pair not in reference.pairs for pair in pair_ids], dtype=bool)
+
+        deprel_ids = {}
+        self.deprel = np.array([deprel_ids.setdefault(word.deprel, len(deprel_ids)) for word in words], dtype=np.int64)
+        self.deprel_labels = list(deprel_ids)
+        self.deprel_reference = np.array([reference.deprel_counts.get(label, 0) for label in self.deprel_labels], dtype=np.float64)
+
+        uncertainty = np.array([reference.ambiguity.get(word.form, 1.0) for word in words], dtype=np.float64)
+        if compare_doc is not None:
+            other_words = [word for sentence in compare_doc.sentences for word in sentence.words]
+            if len(other_words) != len(words):
+                raise ValueError("The comparison predictions have %d words, but the candidates have %d" % (len(other_words), len(words)))
+            disagree = np.array([(x.upos, x.head, x.deprel) != (y.upos, y.head, y.deprel) for x, y in zip(words, other_words)], dtype=bool)
+            uncertainty = np.maximum(uncertainty, disagree)
+        self.uncertainty = np.bincount(self.word_sentence, weights=uncertainty, minlength=len(sentences))
+
+        # the distinct new pairs in each sentence, as sorted (sentence, pair) rows
+        new = self.pair_is_new[self.pair]
+        sentence_pairs = np.unique(np.stack([self.word_sentence[new], self.pair[new]], axis=1), axis=0) if new.any() else np.zeros((0, 2), dtype=np.int64)
+        self.sentence_pairs = sentence_pairs
+        self.pair_starts = np.searchsorted(sentence_pairs[:, 0], np.arange(len(sentences) + 1))
+
+class Selector:
+    """
+    Greedy selection with lazy updates: gains only go down as the batch grows,
+    so a stale score is an upper bound and only the top of the heap is rescored
+    """
+    def __init__(self, pool, pair_weight=1.0, deprel_weight=1.0, uncertainty_weight=0.5, min_length=3, max_length=60):
+        self.pool = pool
+        self.pair_weight = pair_weight
+        self.deprel_weight = deprel_weight
+        self.uncertainty_weight = uncertainty_weight
+        self.covered = np.zeros(len(pool.pair_is_new), dtype=bool)
+        self.deprel_selected = np.zeros(len(pool.deprel_labels), dtype=np.float64)
+        self.eligible = (~pool.already_annotated) & (pool.lengths >= min_length) & (pool.lengths <= max_length)
+
+    def initial_scores(self):
+        """
+        The score of every candidate for an empty batch, computed over the whole pool at once
+        """
+        pool = self.pool
+        new_pairs = np.diff(pool.pair_starts).astype(np.float64)
+        rarity = 1.0 / (1.0 + pool.deprel_reference[pool.deprel])
+        deprel_gain = np.bincount(pool.word_sentence, weights=rarity, minlength=len(pool.lengths))
+        gain = self.pair_weight * new_pairs + self.deprel_weight * deprel_gain + self.uncertainty_weight * pool.uncertainty
+        return gain / np.maximum(pool.lengths, 1)
+
+    def score(self, sent_idx):
+        pool = self.pool
+        pairs = pool.sentence_pairs[pool.pair_starts[sent_idx]:pool.pair_starts[sent_idx+1], 1]
+        new_pairs = np.count_nonzero(~self.covered[pairs])
+        deprels = pool.deprel[pool.offsets[sent_idx]:pool.offsets[sent_idx+1]]
+        deprel_gain = (1.0 / (1.0 + pool.deprel_reference[deprels] + self.deprel_selected[deprels])).sum()
+        gain = self.pair_weight * new_pairs + self.deprel_weight * deprel_gain + self.uncertainty_weight * pool.uncertainty[sent_idx]
+        return gain / max(pool.lengths[sent_idx], 1)
+
+    def take(self, sent_idx):
+        pool = self.pool
+        self.covered[pool.sentence_pairs[pool.pair_starts[sent_idx]:pool.pair_starts[sent_idx+1], 1]] = True
+        np.add.at(self.deprel_selected, pool.deprel[pool.offsets[sent_idx]:pool.offsets[sent_idx+1]], 1)
+
+    def select(self, size, max_tokens=None):
+        scores = self.initial_scores()
+        heap = [(-score, int(idx)) for idx, score in zip(np.nonzero(self.eligible)[0], scores[self.eligible])]
+        heapq.heapify(heap)
+        selected = []
+        tokens = 0
+        while heap and len(selected) < size:
+            _, sent_idx = heapq.heappop(heap)
+            score = self.score(sent_idx)
+            if heap and score < -heap[0][0]:
+                heapq.heappush(heap, (-score, sent_idx))
+                continue
+            if max_tokens is not None and tokens + self.pool.lengths[sent_idx] > max_tokens:
+                continue
+            self.take(sent_idx)
+            selected.append(sent_idx)
+            tokens += int(self.pool.lengths[sent_idx])
+        return selected
+
+def read_candidates(filename, cache_dir, batch_size):
+    """
+    Predictions for the candidate sentences, from a conllu file or by parsing a file of raw sentences
+    """
+    with open(filename, encoding="utf-8") as fin:
+        lines = [x.strip() for x in fin]
+    if any(len(line.split("\t")) == 10 for line in lines[:100]):
+        return read_conllu(filename)
+    texts = list(dict.fromkeys(x for x in lines if x))
+    pipe = CachedPipeline("sd", processors="tokenize,pos,lemma,depparse", package="default_accurate", cache_dir=cache_dir)
+    conll = pipe.process_conll(texts, batch_size)
+    return parse_conllu("".join(x.strip() + "\n\n" for x in conll), filename)
+
+def main():
+    parser = argparse.ArgumentParser(description='Pick the candidate sentences which add the most new coverage per token')
+    parser.add_argument('candidates', help='Predictions in conllu format, or raw sentences one per line')
+    parser.add_argument('--compare', default=None, help='A second set of predictions for the same sentences.  Words where they disagree count as uncertain')
+    parser.add_argument('--size', type=int, default=500, help='How many sentences to pick')
+    parser.add_argument('--max_tokens', type=int, default=None, help='Stop adding sentences at this many words')
+    parser.add_argument('--min_length', type=int, default=3, help='Skip sentences shorter than this')
+    parser.add_argument('--max_length', type=int, default=60, help='Skip sentences longer than this')
+    parser.add_argument('--pair_weight', type=float, default=1.0, help='Value of each new (form, UPOS) pair')
+    parser.add_argument('--deprel_weight', type=float, default=1.0, help='Value of the rare deprels')
+    parser.add_argument('--uncertainty_weight', type=float, default=0.5, help='Value of each uncertain word')
+    parser.add_argument('--output', default=None, help='Where to write the picked sentences.  Their sent_ids are printed otherwise')
+    parser.add_argument('--corpus_dir', default=DEFAULT_CORPUS_DIR, help='Where the columnar corpus is kept')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help='Where to cache the pipeline output for raw sentences')
+    parser.add_argument('--no_cache', dest='cache_dir', action='store_const', const=None, help="Don't cache the pipeline output")
+    parser.add_argument('--batch_size', type=int, default=32, help='How many raw sentences to parse at once')
+    args = parser.parse_args()
+
+    reference = Reference(load_corpus(args.corpus_dir))
+    doc = read_candidates(args.candidates, args.cache_dir, args.batch_size)
+    compare_doc = read_conllu(args.compare) if args.compare else None
+    pool = Pool(doc, reference, compare_doc)
+    print("%d candidates, %d already annotated, %d new (form, UPOS) pairs in the pool" % (len(doc.sentences), pool.already_annotated.sum(), pool.pair_is_new.sum()), file=sys.stderr)
+
+    selector = Selector(pool, args.pair_weight, args.deprel_weight, args.uncertainty_weight, args.min_length, args.max_length)
+    selected = selector.select(args.size, args.max_tokens)
+    tokens = int(pool.lengths[selected].sum())
+    print("Picked %d sentences, %d words, covering %d of the new pairs" % (len(selected), tokens, selector.covered.sum()), file=sys.stderr)
+
+    selected = sorted(selected)
+    if args.output:
+        batch = [doc.sentences[x] for x in selected]
+        for sentence in batch:
+            sentence.separator = sentence.newline * 2
+        write_conllu(ConlluDoc(batch), args.output)
+        print("Wrote %s" % args.output, file=sys.stderr)
+    else:
+        for sent_idx in selected:
+            sentence = doc.sentences[sent_idx]
+            print("%s\t%s" % (sentence.sent_id if sentence.sent_id else sent_idx, sentence.text))
+
+if __name__ == '__main__':
+    main()
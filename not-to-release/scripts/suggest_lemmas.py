@@ -0,0 +1,283 @@
+"""
+Suggest lemmas for (word, UPOS) pairs which have no known lemma
+
+The known (word, UPOS, lemma) triples come from ../lemmas/*.tsv and
+from the lemmas already in the annotated conllu files.  Each triple
+is turned into a suffix rewrite rule, such as strip ين and add و,
+and the rule is counted at every node of a trie of the reversed
+words for that UPOS, from the node for the stripped suffix down to
+the whole word.  An unknown word follows its own reversed letters as
+far down the trie as they go, and the rules at the deepest nodes are
+the candidates, most common first.  A lookup only touches as many
+nodes as the word has letters, so there is no model to load and no
+need for the neural lemmatizer.
+
+  python3 suggest_lemmas.py --word ڪتابن NOUN
+  python3 suggest_lemmas.py --pairs unknown_pairs.tsv > suggested.tsv
+  python3 suggest_lemmas.py --conllu sd_batch_6.conllu --top_k 1000 > suggested.tsv
+  python3 suggest_lemmas.py --evaluate
+
+The tsv output has the same columns as the files in ../lemmas.  With
+--candidates, the other suggestions go in the Remarks column, which
+read_tsv_files skips until the annotator removes the remark.
+"""
+
+import argparse
+from collections import Counter
+import glob
+import random
+import sys
+import time
+
+from check_consistency import DEFAULT_EXCLUDE
+from columnar_corpus import find_corpus_files
+from conllu_io import read_conllu
+from lexical_consistency import build_lexicon, read_file
+from merge_lemmas import find_lemma, read_tsv_files
+
+TSV_HEADER = "Raw Form\tUPOS\tproposed lemma\tRemarks"
+
+def suffix_rule(word, lemma):
+    """
+    The (strip, add) which turns word into lemma: strip is removed from the end of word, then add is appended
+    """
+    prefix = 0
+    for x, y in zip(word, lemma):
+        if x != y:
+            break
+        prefix += 1
+    return word[prefix:], lemma[prefix:]
+
+class TrieNode:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children = {}
+        self.rules = None
+
+class SuffixTrie:
+    """
+    One trie of reversed words per UPOS, with the rewrite rules counted at each node
+    """
+    def __init__(self, max_context=None):
+        """
+        max_context limits how many letters past the stripped suffix a rule is counted at.  None counts it along the whole word
+        """
+        self.roots = {}
+        self.max_context = max_context
+
+    def add(self, word, upos, lemma, count=1):
+        strip, add = suffix_rule(word, lemma)
+        rule = (strip, add)
+        node = self.roots.setdefault(upos, TrieNode())
+        depth_limit = len(word) if self.max_context is None else min(len(word), len(strip) + self.max_context)
+        for depth in range(depth_limit + 1):
+            if depth >= len(strip):
+                if node.rules is None:
+                    node.rules = Counter()
+                node.rules[rule] += count
+            if depth == depth_limit:
+                break
+            node = node.children.setdefault(word[-depth-1], TrieNode())
+
+    def suggest(self, word, upos, k=3):
+        """
+        Return up to k (lemma, score, matched suffix length) candidates, best first
+
+        The rules at the deepest node which matches the word come first,
+        scored by their share of that node.  If there are fewer than k,
+        the shallower nodes add their other rules, scored lower.
+        """
+        node = self.roots.get(upos)
+        if node is None:
+            return [(word, 0.0, 0)]
+        path = []
+        depth = 0
+        while True:
+            if node.rules is not None:
+                path.append((depth, node.rules))
+            if depth == len(word):
+                break
+            node = node.children.get(word[-depth-1])
+            if node is None:
+                break
+            depth += 1
+
+        candidates = []
+        seen = set()
+        # each step back toward the root halves the score, so a deeper match always ranks higher
+        weight = 1.0
+        for depth, rules in reversed(path):
+            total = sum(rules.values())
+            for (strip, add), count in rules.most_common():
+                lemma = word[:len(word)-len(strip)] + add
+                if lemma in seen:
+                    continue
+                seen.add(lemma)
+                candidates.append((lemma, weight * count / total, depth))
+            if len(candidates) >= k:
+                break
+            weight /= 2
+        if not candidates:
+            candidates.append((word, 0.0, 0))
+        return candidates[:k]
+
+class LemmaSuggester:
+    """
+    The known lemmas, looked up first, and the suffix trie for everything else
+    """
+    def __init__(self, lemmas, corpus_lemmas=None, max_context=None):
+        """
+        lemmas is {(word, upos): lemma} from the tsv files, which win over corpus_lemmas, {(word, upos): Counter of lemmas}
+        """
+        self.lemmas = dict(lemmas)
+        if corpus_lemmas:
+            for pair, counts in corpus_lemmas.items():
+                if pair not in self.lemmas:
+                    self.lemmas[pair] = counts.most_common(1)[0][0]
+        self.trie = SuffixTrie(max_context)
+        # each pair counts once, however common the word is, which suggests better for the rare words which are left
+        for (word, upos), lemma in self.lemmas.items():
+            self.trie.add(word, upos, lemma)
+
+    def known(self, word, upos):
+        return find_lemma(word, upos, self.lemmas)
+
+    def suggest(self, word, upos, k=3):
+        """
+        Return up to k (lemma, score, source) candidates.  A known lemma comes first, with a score of 1
+        """
+        candidates = []
+        lemma = self.known(word, upos)
+        if lemma is not None:
+            candidates.append((lemma, 1.0, "known"))
+        for candidate, score, depth in self.trie.suggest(word, upos, k):
+            if lemma is not None and candidate == lemma:
+                continue
+            candidates.append((candidate, score, "suffix %d" % depth))
+        return candidates[:k]
+
+def read_corpus_lemmas(filenames):
+    """
+    {(word, upos): Counter of lemmas} from the lemma column of the conllu files, counting each sentence once
+    """
+    lexicon = build_lexicon(read_file(filename) for filename in filenames)
+    return {pair: entry["lemma"].counts for pair, entry in lexicon.items() if entry["lemma"].counts}
+
+def default_corpus_files():
+    return [x for x in find_corpus_files() if not any(pattern in x for pattern in DEFAULT_EXCLUDE)]
+
+def build_suggester(tsv_files, conllu_files, max_context=None):
+    lemmas = read_tsv_files(tsv_files)
+    corpus_lemmas = read_corpus_lemmas(conllu_files) if conllu_files else None
+    return LemmaSuggester(lemmas, corpus_lemmas, max_context)
+
+def read_pairs(filename):
+    """
+    (word, upos) pairs from a tsv, skipping a header line if it has one
+    """
+    pairs = []
+    with open(filename, encoding="utf-8") as fin:
+        for line_idx, line in enumerate(fin):
+            pieces = line.strip().split("\t")
+            if len(pieces) < 2 or (line_idx == 0 and pieces[0] == TSV_HEADER.split("\t")[0]):
+                continue
+            pairs.append((pieces[0], pieces[1]))
+    return pairs
+
+def unknown_pairs(filenames, suggester):
+    """
+    The (word, upos) pairs with no lemma in the conllu files and no known lemma, most frequent first
+    """
+    counts = Counter()
+    for filename in filenames:
+        for sentence in read_conllu(filename).sentences:
+            for word in sentence.words:
+                if word.lemma == "_" and word.upos != "_" and suggester.known(word.form, word.upos) is None:
+                    counts[(word.form, word.upos)] += 1
+    return [pair for pair, _ in counts.most_common()]
+
+def evaluate(lemmas, corpus_lemmas, held_out=0.1, k=3, seed=1234, max_context=None):
+    """
+    Hold out some of the known pairs, build a suggester from the rest, and return the top 1 and top k accuracy on the held out pairs
+    """
+    suggester = LemmaSuggester(lemmas, corpus_lemmas, max_context)
+    pairs = sorted(suggester.lemmas)
+    random.seed(seed)
+    random.shuffle(pairs)
+    test_pairs = set(pairs[:int(len(pairs) * held_out)])
+    train_lemmas = {pair: lemma for pair, lemma in suggester.lemmas.items() if pair not in test_pairs}
+    train_corpus = {pair: counts for pair, counts in corpus_lemmas.items() if pair not in test_pairs} if corpus_lemmas else None
+    trie_only = LemmaSuggester(train_lemmas, train_corpus, max_context).trie
+
+    top1 = topk = identity = 0
+    start = time.perf_counter()
+    for word, upos in test_pairs:
+        candidates = [x[0] for x in trie_only.suggest(word, upos, k)]
+        gold = suggester.lemmas[(word, upos)]
+        top1 += candidates[0] == gold
+        topk += gold in candidates
+        identity += word == gold
+    seconds = time.perf_counter() - start
+    return len(test_pairs), top1, topk, identity, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description='Suggest lemmas for unknown (word, UPOS) pairs from suffix rules learned from the known lemmas')
+    parser.add_argument('--word', nargs=2, metavar=('WORD', 'UPOS'), default=None, help='Print the candidates for one word')
+    parser.add_argument('--pairs', default=None, help='A tsv of word, UPOS pairs to suggest lemmas for')
+    parser.add_argument('--conllu', nargs='+', default=None, help='Suggest lemmas for every unlemmatized, unknown pair in these conllu files, most frequent first')
+    parser.add_argument('--top_k', type=int, default=None, help='With --conllu, only the most frequent this many pairs')
+    parser.add_argument('--candidates', type=int, default=1, help='How many candidates to list for each pair.  The ones after the first go in the Remarks column')
+    parser.add_argument('--include_known', action='store_true', default=False, help='With --pairs, also output pairs which already have a known lemma')
+    parser.add_argument('--evaluate', action='store_true', default=False, help='Report the accuracy on a held out tenth of the known pairs')
+    parser.add_argument('--max_context', type=int, default=None, help='Only count each rule this many letters past its suffix')
+    parser.add_argument('--lemma_files', nargs='+', default=None, help='The known lemma files.  Defaults to ../lemmas/*.tsv')
+    parser.add_argument('--corpus', nargs='*', default=None, help='The conllu files to learn lemmas from.  Defaults to every annotated file; give no files to use only the tsvs')
+    args = parser.parse_args()
+
+    tsv_files = args.lemma_files if args.lemma_files else sorted(glob.glob("../lemmas/*.tsv"))
+    conllu_files = args.corpus if args.corpus is not None else default_corpus_files()
+
+    if args.evaluate:
+        lemmas = read_tsv_files(tsv_files)
+        corpus_lemmas = read_corpus_lemmas(conllu_files) if conllu_files else None
+        total, top1, topk, identity, seconds = evaluate(lemmas, corpus_lemmas, k=max(args.candidates, 3), max_context=args.max_context)
+        print("%d held out pairs" % total)
+        print("top 1:    %.4f" % (top1 / total))
+        print("top %d:    %.4f" % (max(args.candidates, 3), topk / total))
+        print("identity: %.4f" % (identity / total))
+        print("%.1f microseconds per lookup" % (seconds / total * 1e6))
+        return
+
+    suggester = build_suggester(tsv_files, conllu_files, args.max_context)
+    print("%d known (word, UPOS) pairs" % len(suggester.lemmas), file=sys.stderr)
+
+    if args.word:
+        for lemma, score, source in suggester.suggest(args.word[0], args.word[1], max(args.candidates, 5)):
+            print("%s\t%.3f\t%s" % (lemma, score, source))
+        return
+
+    if args.pairs:
+        pairs = read_pairs(args.pairs)
+        if not args.include_known:
+            pairs = [pair for pair in pairs if suggester.known(*pair) is None]
+    elif args.conllu:
+        pairs = unknown_pairs(args.conllu, suggester)
+        if args.top_k is not None:
+            pairs = pairs[:args.top_k]
+        # the same order as extract_predicted_lemmas, so the annotators can work through one UPOS at a time
+        pairs.sort(key=lambda x: (x[1], x[0]))
+    else:
+        raise ValueError("Nothing to do: use --word, --pairs, --conllu or --evaluate")
+
+    print(TSV_HEADER)
+    for word, upos in pairs:
+        candidates = suggester.suggest(word, upos, args.candidates)
+        line = "%s\t%s\t%s" % (word, upos, candidates[0][0])
+        if len(candidates) > 1:
+            line += "\t" + " ".join(x[0] for x in candidates[1:])
+        print(line)
+    print("Suggested lemmas for %d pairs" % len(pairs), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
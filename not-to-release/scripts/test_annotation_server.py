@@ -0,0 +1,49 @@
+import threading
+
+from stanza.models.common.doc import Document
+
+from annotation_client import AnnotationClient
+from annotation_server import AnnotationServer, Annotator
+from pipeline_cache import CachedPipeline
+
+class TaggingPipeline:
+    """
+    Tags every word as a NOUN, in place of the neural models
+    """
+    def __call__(self, doc, processors=None):
+        if isinstance(doc, str):
+            doc = Document([[{"id": idx + 1, "text": token} for idx, token in enumerate(sentence.split())] for sentence in doc.split("\n\n")])
+        for sentence in doc.sentences:
+            for word in sentence.words:
+                word.upos = "NOUN"
+        return doc
+
+class TaggingCachedPipeline(CachedPipeline):
+    def get_pipeline(self):
+        if self.pipe is None:
+            self.pipe = TaggingPipeline()
+        return self.pipe
+
+def test_pretokenized_request(tmp_path):
+    (tmp_path / "models" / "sd").mkdir(parents=True)
+    (tmp_path / "models" / "sd" / "pos.pt").write_text("v1", encoding="utf-8")
+    pipe = TaggingCachedPipeline("sd", "tokenize,pos", "default", cache_dir=str(tmp_path / "cache"), model_dir=str(tmp_path / "models"))
+    # as main() does, the pipeline is loaded before serving
+    pipe.get_pipeline()
+    annotator = Annotator(pipe, max_wait=0)
+    server = AnnotationServer(("127.0.0.1", 0), annotator)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = AnnotationClient("127.0.0.1:%d" % server.server_port)
+        first = client.annotate([["الف", "ب"], "ت ث ج"], pretokenized=True)
+        assert len(first) == 2
+        assert "\tNOUN\t" in first[0]
+        assert len([line for line in first[1].split("\n") if line and not line.startswith("#")]) == 3
+        assert client.annotate([["الف", "ب"]], pretokenized=True) == first[:1]
+        assert client.status()["cache"]["hits"] == 1
+        assert client.status()["cache"]["misses"] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+        annotator.stop()
@@ -0,0 +1,38 @@
+import numpy as np
+
+from bootstrap import (bootstrap, confidence_interval, kappa_statistic, ratio_statistic, resample_weights,
+                       sentence_confusions, sentence_counts)
+
+# three sentences: 2 of 3 words right, 1 of 1, 0 of 2
+SENTENCE_IDS = np.array([0, 0, 0, 1, 2, 2])
+CORRECT = np.array([1, 1, 0, 1, 0, 0])
+
+def test_sentence_counts():
+    counts = sentence_counts(SENTENCE_IDS, CORRECT)
+    assert counts.tolist() == [[2, 3], [1, 1], [0, 2]]
+
+def test_resample_weights_draw_every_sentence_slot():
+    weights = resample_weights(np.random.default_rng(0), 5, 7)
+    assert weights.shape == (7, 5)
+    assert (weights.sum(axis=1) == 5).all()
+
+def test_confidence_interval():
+    counts = sentence_counts(SENTENCE_IDS, CORRECT)
+    point, low, high = confidence_interval(counts, num_resamples=2000, seed=1, workers=1)
+    assert point == 0.5
+    assert 0.0 <= low <= point <= high <= 1.0
+
+def test_same_seed_same_resamples_with_any_number_of_workers():
+    counts = sentence_counts(SENTENCE_IDS, CORRECT)
+    one = bootstrap(counts, ratio_statistic, num_resamples=1000, seed=7, workers=1, chunk_size=100)
+    two = bootstrap(counts, ratio_statistic, num_resamples=1000, seed=7, workers=2, chunk_size=100)
+    assert np.array_equal(one, two)
+
+def test_kappa_statistic():
+    first = np.array([0, 0, 1, 1, 2, 0])
+    second = np.array([0, 1, 1, 1, 2, 0])
+    confusions = sentence_confusions(SENTENCE_IDS, first, second, 3)
+    assert confusions.shape == (3, 9)
+    # observed 5/6, expected from the marginals (3,2,1) and (2,3,1): 13/36
+    kappa = kappa_statistic(confusions.sum(axis=0, keepdims=True))[0]
+    assert abs(kappa - (5 / 6 - 13 / 36) / (1 - 13 / 36)) < 1e-9
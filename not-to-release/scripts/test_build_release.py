@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from build_release import main
+
+VALID = """# sent_id = 1
+# text = ڪتاب آهي
+1	ڪتاب	ڪتاب	NOUN	NN	Case=Nom|Gender=Masc|Number=Sing	2	nsubj	_	_
+2	آهي	آهي	AUX	VAUX	Number=Sing|Person=3	0	root	_	_
+
+"""
+
+TWO_ROOTS = """# sent_id = 2
+# text = ڪتاب هو
+1	ڪتاب	ڪتاب	NOUN	NN	Case=Nom|Gender=Masc|Number=Sing	0	root	_	_
+2	هو	آهي	AUX	VAUX	Number=Sing|Person=3	0	root	_	_
+
+"""
+
+def write_manifest(tmp_path, text):
+    (tmp_path / "source.conllu").write_text(text, encoding="utf-8")
+    manifest = {
+        "checksums": "checksums.json",
+        "splits": [{"name": "train", "output": "train.conllu", "sources": ["source.conllu"]}],
+    }
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    return str(path)
+
+def build(manifest, *args):
+    main(["--manifest", manifest, "--no_cache", "--workers", "1"] + list(args))
+
+def test_valid_release_is_written(tmp_path):
+    manifest = write_manifest(tmp_path, VALID)
+    build(manifest)
+    assert (tmp_path / "train.conllu").read_text(encoding="utf-8") == VALID
+    assert os.path.exists(tmp_path / "checksums.json")
+    build(manifest, "--check")
+
+def test_invalid_release_is_not_written(tmp_path):
+    manifest = write_manifest(tmp_path, VALID + TWO_ROOTS)
+    with pytest.raises(SystemExit) as excinfo:
+        build(manifest)
+    assert excinfo.value.code == 1
+    assert not os.path.exists(tmp_path / "train.conllu")
+    assert not os.path.exists(tmp_path / "checksums.json")
+
+def test_check_fails_on_an_invalid_release(tmp_path):
+    manifest = write_manifest(tmp_path, VALID + TWO_ROOTS)
+    build(manifest, "--force")
+    assert os.path.exists(tmp_path / "train.conllu")
+    with pytest.raises(SystemExit) as excinfo:
+        build(manifest, "--check")
+    assert excinfo.value.code == 1
@@ -0,0 +1,52 @@
+import subprocess
+
+from conllu_diff import FileDiff, count_moved, diff_git_revisions
+from conllu_io import parse_conllu
+
+def make_text(texts):
+    lines = []
+    for idx, text in enumerate(texts):
+        lines.append("# sent_id = %d" % idx)
+        lines.append("# text = %s" % text)
+        lines.append("1\t%s\t_\tNOUN\t_\t_\t0\troot\t_\t_" % text)
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+def make_doc(texts):
+    return parse_conllu(make_text(texts))
+
+def test_count_moved():
+    assert count_moved([]) == 0
+    assert count_moved([(0, 0), (1, 1), (2, 2)]) == 0
+    # one sentence moved from the end to the front
+    assert count_moved([(4, 0), (0, 1), (1, 2), (2, 3), (3, 4)]) == 1
+    # swapping two blocks of two has one descent, but two sentences have to move
+    assert count_moved([(2, 0), (3, 1), (0, 2), (1, 3)]) == 2
+    assert count_moved([(3, 0), (2, 1), (1, 2), (0, 3)]) == 3
+
+def test_file_diff_counts_moved_sentences():
+    old_doc = make_doc(["الف", "ب", "ت", "ث", "ج"])
+    new_doc = make_doc(["ب", "ت", "ث", "ج", "الف"])
+    diff = FileDiff("old", "new", old_doc, new_doc)
+    assert diff.reordered == 1
+
+def git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] + list(args), cwd=repo, check=True, capture_output=True)
+
+def test_git_diff_skips_binary_files(tmp_path, monkeypatch):
+    git(tmp_path, "init", "-q")
+    (tmp_path / "sd.conllu").write_text(make_text(["الف", "ب"]), encoding="utf-8")
+    (tmp_path / "tagset.docx").write_bytes(b"PK\x03\x04\xff\xfe\x00\x81")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "first")
+    (tmp_path / "sd.conllu").write_text(make_text(["ب", "الف"]), encoding="utf-8")
+    (tmp_path / "tagset.docx").write_bytes(b"PK\x03\x04\xff\xfe\x00\x82")
+    monkeypatch.chdir(tmp_path)
+
+    # the working tree against HEAD, then two commits
+    diffs = diff_git_revisions("HEAD")
+    assert [diff.new_name for diff in diffs] == ["sd.conllu"]
+    assert diffs[0].reordered == 1
+    git(tmp_path, "commit", "-q", "-a", "-m", "second")
+    diffs = diff_git_revisions("HEAD~1", "HEAD")
+    assert [diff.new_name for diff in diffs] == ["HEAD:sd.conllu"]
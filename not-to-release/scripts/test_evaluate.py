@@ -0,0 +1,68 @@
+from evaluate import Columns, Vocab, evaluate, f1_scores
+
+GOLD = """# sent_id = 1
+1	الف	الف	NOUN	NN	Case=Nom	3	nsubj	_	_
+2	ب	ب	ADP	PSP	_	1	case	_	_
+3	ت	ت	VERB	VM	_	0	root	_	_
+4	.	.	PUNCT	PUNCT	_	3	punct	_	_
+
+"""
+
+# word 1 has the wrong UPOS, word 2 the wrong deprel and word 4 the wrong head
+SYSTEM = """# sent_id = 1
+1	الف	الف	PROPN	NN	Case=Nom	3	nsubj	_	_
+2	ب	ب	ADP	PSP	_	1	mark	_	_
+3	ت	ت	VERB	VM	_	0	root	_	_
+4	.	.	PUNCT	PUNCT	_	1	punct	_	_
+
+"""
+
+GOLD_TOKENS = """# sent_id = 1
+1	ab	ab	NOUN	NN	_	0	root	_	_
+2	c	c	NOUN	NN	_	1	nmod	_	_
+3	d	d	PUNCT	PUNCT	_	1	punct	_	_
+
+"""
+
+# ab is split in two, so c and d line up but their head does not
+SYSTEM_TOKENS = """# sent_id = 1
+1	a	a	NOUN	NN	_	0	root	_	_
+2	b	b	NOUN	NN	_	1	nmod	_	_
+3	c	c	NOUN	NN	_	1	nmod	_	_
+4	d	d	PUNCT	PUNCT	_	1	punct	_	_
+
+"""
+
+def score(tmp_path, gold_text, system_text):
+    gold_file = tmp_path / "gold.conllu"
+    system_file = tmp_path / "system.conllu"
+    gold_file.write_text(gold_text, encoding="utf-8")
+    system_file.write_text(system_text, encoding="utf-8")
+    vocabs = {name: Vocab() for name in ("upos", "xpos", "feats", "lemma", "deprel")}
+    results, _ = evaluate(Columns(str(gold_file), vocabs), Columns(str(system_file), vocabs), vocabs)
+    return results
+
+def test_same_tokenization(tmp_path):
+    results = score(tmp_path, GOLD, SYSTEM)
+    assert results["Tokens"] == (4, 4, 4)
+    assert results["Words"] == (4, 4, 4)
+    assert results["UPOS"] == (3, 4, 4)
+    assert results["XPOS"] == (4, 4, 4)
+    assert results["AllTags"] == (3, 4, 4)
+    assert results["UAS"] == (3, 4, 4)
+    assert results["LAS"] == (2, 4, 4)
+    # only nsubj and root are content words
+    assert results["CLAS"] == (2, 2, 2)
+    # word 1 has the wrong UPOS, and its case child became mark
+    assert results["MLAS"] == (1, 2, 2)
+    assert results["BLEX"] == (2, 2, 2)
+
+def test_different_tokenization(tmp_path):
+    results = score(tmp_path, GOLD_TOKENS, SYSTEM_TOKENS)
+    assert results["Tokens"] == (2, 3, 4)
+    assert results["Words"] == (2, 3, 4)
+    assert results["UPOS"] == (2, 3, 4)
+    assert results["UAS"] == (0, 3, 4)
+    precision, recall, f1 = f1_scores(*results["Words"])
+    assert (precision, recall) == (0.5, 2 / 3)
+    assert abs(f1 - 4 / 7) < 1e-9
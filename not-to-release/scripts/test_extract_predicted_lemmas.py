@@ -0,0 +1,28 @@
+from collections import Counter, defaultdict
+
+from extract_predicted_lemmas import count_unknown_pairs
+
+ORIG = """# sent_id = 1
+1	ويچار	_	NOUN	_	_	0	root	_	_
+2	ڪتاب	_	NOUN	_	_	1	nmod	_	_
+
+"""
+
+PRED = """# sent_id = 1
+1	ويچار	ويچار	NOUN	_	_	0	root	_	_
+2	ڪتاب	ڪتاب	NOUN	_	_	1	nmod	_	_
+
+"""
+
+def test_variant_spelling_is_unknown(tmp_path):
+    orig = tmp_path / "orig.conllu"
+    pred = tmp_path / "pred.conllu"
+    orig.write_text(ORIG, encoding="utf-8")
+    pred.write_text(PRED, encoding="utf-8")
+    known = {("ويـچـار", "NOUN"), ("ڪتاب", "NOUN")}
+    pair_counts = Counter()
+    pair_lemmas = defaultdict(Counter)
+    skipped = count_unknown_pairs(str(pred), str(orig), known, pair_counts, pair_lemmas)
+    assert skipped == 1
+    assert pair_counts == Counter({("ويچار", "NOUN"): 1})
+    assert pair_lemmas[("ويچار", "NOUN")] == Counter({"ويچار": 1})
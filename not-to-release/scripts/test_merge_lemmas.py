@@ -0,0 +1,29 @@
+from merge_lemmas import find_lemma, find_variant_lemma, normalize_lemmas, set_lemmas
+from conllu_io import read_conllu
+from profiling import Profiler
+
+LEMMAS = {
+    ("ويـچـار", "NOUN"): "ويـچـار",
+    ("ڪتاب", "NOUN"): "ڪتاب",
+}
+
+SENTENCE = """# sent_id = 1
+# text = ويچار ڪتاب
+1	ويچار	ويچار	NOUN	_	_	0	root	_	_
+2	ڪتاب	_	NOUN	_	_	1	nmod	_	_
+
+"""
+
+def test_variant_is_not_an_exact_match():
+    normalized = normalize_lemmas(LEMMAS)
+    assert find_lemma("ويچار", "NOUN", LEMMAS) is None
+    assert find_variant_lemma("ويچار", "NOUN", normalized) == "ويـچـار"
+
+def test_variant_match_keeps_the_lemma_spelling(tmp_path):
+    filename = tmp_path / "test.conllu"
+    filename.write_text(SENTENCE, encoding="utf-8")
+    variants = set_lemmas(str(filename), LEMMAS, normalize_lemmas(LEMMAS), remove_existing=True, profiler=Profiler("test"))
+    words = read_conllu(str(filename)).sentences[0].words
+    assert words[0].lemma == "ويچار"
+    assert words[1].lemma == "ڪتاب"
+    assert variants == [("ويچار", "NOUN", "ويچار", "ويـچـار")]
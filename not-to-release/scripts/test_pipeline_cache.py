@@ -0,0 +1,67 @@
+from stanza.models.common.doc import Document
+
+from pipeline_cache import CachedPipeline
+
+class WhitespacePipeline:
+    """
+    Splits each \\n\\n separated sentence on spaces, in place of the neural models
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return Document([[{"id": idx + 1, "text": token} for idx, token in enumerate(sentence.split())] for sentence in text.split("\n\n")])
+
+class WhitespaceCachedPipeline(CachedPipeline):
+    """
+    Building the pipeline writes model_text to the model file, as a download or an update would
+    """
+    def __init__(self, model_dir, cache_dir, model_text=None):
+        super().__init__("sd", "tokenize", "default", cache_dir=str(cache_dir), model_dir=str(model_dir))
+        self.model_text = model_text
+
+    def get_pipeline(self):
+        if self.pipe is None:
+            if self.model_text is not None:
+                model_file = self.model_dir + "/sd/tokenize/default.pt"
+                with open(model_file, "w", encoding="utf-8") as fout:
+                    fout.write(self.model_text)
+            self.pipe = WhitespacePipeline()
+        return self.pipe
+
+def write_model(model_dir, text):
+    (model_dir / "sd" / "tokenize").mkdir(parents=True, exist_ok=True)
+    (model_dir / "sd" / "tokenize" / "default.pt").write_text(text, encoding="utf-8")
+
+def test_hits_and_misses_are_counted_once(tmp_path):
+    write_model(tmp_path / "models", "v1")
+    pipe = WhitespaceCachedPipeline(tmp_path / "models", tmp_path / "cache")
+    first = pipe.process_conll(["الف ب", "ت ث"])
+    assert pipe.cache.stats()["hits"] == 0
+    assert pipe.cache.stats()["misses"] == 2
+
+    pipe = WhitespaceCachedPipeline(tmp_path / "models", tmp_path / "cache")
+    assert pipe.process_conll(["الف ب", "ت ث", "ج"]) == first + pipe.process_conll(["ج"])
+    assert pipe.cache.stats()["hits"] == 3
+    assert pipe.cache.stats()["misses"] == 1
+
+def test_updated_models_are_rehashed(tmp_path):
+    write_model(tmp_path / "models", "v1")
+    pipe = WhitespaceCachedPipeline(tmp_path / "models", tmp_path / "cache")
+    pipe.process_conll(["الف ب"])
+
+    # the text is cached for v1, but building the pipeline updates the models
+    pipe = WhitespaceCachedPipeline(tmp_path / "models", tmp_path / "cache", model_text="v2")
+    pipe.process_conll(["الف ب", "ت ث"])
+    assert pipe.pipe.calls == 1
+    assert pipe.cache.stats()["hits"] == 0
+    assert pipe.cache.stats()["misses"] == 2
+
+def test_models_downloaded_by_the_pipeline(tmp_path):
+    (tmp_path / "models").mkdir()
+    pipe = WhitespaceCachedPipeline(tmp_path / "models", tmp_path / "cache", model_text="v1")
+    (tmp_path / "models" / "sd" / "tokenize").mkdir(parents=True)
+    # the directory exists, but there is no model in it until the pipeline is built
+    assert len(pipe.process_conll(["الف ب"])) == 1
+    assert pipe.config_hash is not None
@@ -0,0 +1,26 @@
+import argparse
+
+from profiling import add_profile_args, compare_reports, profiler_from_args
+
+def make_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename')
+    add_profile_args(parser)
+    return parser
+
+def test_profile_does_not_take_the_positional():
+    args = make_parser().parse_args(['--profile', 'file.conllu', '--profile_no_memory'])
+    assert args.filename == 'file.conllu'
+    assert profiler_from_args(args, "test").output == "test.profile.json"
+
+def test_profile_output():
+    args = make_parser().parse_args(['file.conllu', '--profile', '--profile_output', 'out.json', '--profile_no_memory'])
+    assert profiler_from_args(args, "test").output == "out.json"
+
+def test_compare_zero_seconds(capsys):
+    old = {"total_seconds": 0.0, "stages": [{"name": "parse", "seconds": 0.0}]}
+    new = {"total_seconds": 1.0, "stages": [{"name": "parse", "seconds": 1.0}]}
+    compare_reports(old, new)
+    lines = capsys.readouterr().out.strip().split("\n")
+    assert "n/a" in lines[1]
+    assert "n/a" in lines[2]
@@ -0,0 +1,9 @@
+from select_auxiliary import transliterate
+
+def test_urdu_and_hindi_spell_the_same():
+    for urdu, hindi in (("کھانا", "खाना"), ("ٹھیک", "ठीक"), ("بھائی", "भाई"), ("کتاب", "किताब"), ("ڈھول", "ढोल")):
+        assert transliterate(urdu, urdu=True) == transliterate(hindi)
+
+def test_urdu_kh_is_sindhi_kh():
+    assert transliterate("کھانا", urdu=True) == "کانا"
+    assert transliterate("کانا") == "کانا"
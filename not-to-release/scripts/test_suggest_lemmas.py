@@ -0,0 +1,18 @@
+from suggest_lemmas import LemmaSuggester
+
+LEMMAS = {
+    ("ويـچـار", "NOUN"): "ويـچـار",
+    ("ڪتاب", "NOUN"): "ڪتاب",
+}
+
+def test_known_is_an_exact_match():
+    suggester = LemmaSuggester(LEMMAS)
+    assert suggester.known("ڪتاب", "NOUN") == "ڪتاب"
+    assert suggester.known("ويچار", "NOUN") is None
+    assert suggester.known("ڪتاب", "VERB") is None
+
+def test_variant_is_not_suggested_as_known():
+    suggester = LemmaSuggester(LEMMAS)
+    candidates = suggester.suggest("ويچار", "NOUN")
+    assert all(source != "known" for _, _, source in candidates)
+    assert all(lemma != "ويـچـار" for lemma, _, _ in candidates)
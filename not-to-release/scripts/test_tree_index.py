@@ -0,0 +1,17 @@
+from tree_index import TreeIndex
+
+def test_projective_tree_has_no_nonprojective_arcs():
+    index = TreeIndex([2, 0, 2])
+    assert index.is_projective
+    assert index.nonprojective_arcs() == []
+
+def test_nonprojective_arcs():
+    # 1 -> 3 crosses 2, which hangs off 4
+    index = TreeIndex([4, 4, 1, 0])
+    assert not index.is_projective
+    assert index.nonprojective_arcs() == [(1, 3)]
+
+def test_arcs_are_in_dependent_order():
+    # 2 -> 5 crosses 3 and 4, and 6 -> 3 crosses 4 and 5
+    index = TreeIndex([0, 1, 6, 1, 2, 1])
+    assert index.nonprojective_arcs() == [(6, 3), (2, 5)]
@@ -0,0 +1,17 @@
+from stanza.utils.conll import CoNLL
+
+from validate import validate
+
+# the genitive جون is marked Masc, but the noun its possessor modifies is Fem
+GENITIVE_MISMATCH = """# sent_id = 1
+# text = جانورن جون آکاڻيون
+1	جانورن	جانور	NOUN	NN	Case=Nom|Gender=Masc|Number=Plur	3	nmod	_	_
+2	جون	جو	ADP	PSPG	Case=Nom|Gender=Masc|Number=Plur	1	case	_	_
+3	آکاڻيون	آکاڻي	NOUN	NN	Case=Nom|Gender=Fem|Number=Plur	0	root	_	_
+
+"""
+
+def test_genitive_agreement_is_opt_in():
+    doc = CoNLL.conll2doc(input_str=GENITIVE_MISMATCH, keep_line_numbers=True)
+    assert validate(doc) == set()
+    assert validate(doc, check_genitive=True) == {0}
@@ -0,0 +1,139 @@
+"""
+The tree structure of a sentence, computed once from its heads
+
+validate.py and the other scripts only have word.head, so asking for
+the children of a word, or whether an arc crosses another, means
+scanning the whole sentence again for every word.  A TreeIndex is
+built from the list of heads in time linear in the length of the
+sentence and then answers those questions directly:
+
+  index = TreeIndex([word.head for word in sentence.words])
+  index.children(3)           # the word ids which have 3 as their head
+  index.depth[3]              # how far 3 is below the root
+  index.span[3]               # the first and last word id in the subtree of 3
+  index.is_projective         # whether every subtree is a contiguous span
+  index.nonprojective_arcs()  # the (head, dependent) arcs which cross another subtree
+
+Word ids are 1 based, as in the conllu files, and index 0 of each
+list is the artificial root.  Heads may be ints or the strings from a
+conllu file.  A sentence with a missing head or a cycle still gets an
+index, with is_tree False, and cycle() returns one of its cycles.
+"""
+
+class TreeIndex:
+    __slots__ = ("heads", "child_offsets", "child_ids", "depth", "span", "size", "is_tree", "is_projective", "order", "entry", "exit")
+
+    def __init__(self, heads):
+        n = len(heads)
+        # -1 for a head which is missing or outside the sentence
+        self.heads = [0] * (n + 1)
+        self.heads[0] = -1
+        for idx, head in enumerate(heads):
+            try:
+                head = int(head)
+            except (TypeError, ValueError):
+                head = -1
+            self.heads[idx + 1] = head if 0 <= head <= n else -1
+
+        # children as one flat list grouped by head, in word order
+        counts = [0] * (n + 2)
+        for word_id in range(1, n + 1):
+            if self.heads[word_id] >= 0:
+                counts[self.heads[word_id] + 1] += 1
+        for idx in range(1, n + 2):
+            counts[idx] += counts[idx - 1]
+        self.child_offsets = counts
+        self.child_ids = [0] * counts[n + 1]
+        fill = counts[:]
+        for word_id in range(1, n + 1):
+            head = self.heads[word_id]
+            if head >= 0:
+                self.child_ids[fill[head]] = word_id
+                fill[head] += 1
+
+        # one depth first walk from the root gives the depths, the
+        # preorder used for dominance, and the spans and sizes on the way back up
+        self.depth = [-1] * (n + 1)
+        self.span = [None] * (n + 1)
+        self.size = [0] * (n + 1)
+        self.entry = [-1] * (n + 1)
+        self.exit = [-1] * (n + 1)
+        self.order = []
+        self.depth[0] = 0
+        stack = [(0, False)]
+        while stack:
+            node, finished = stack.pop()
+            if finished:
+                low, high = (node, node) if node > 0 else (n + 1, 0)
+                size = 1
+                for child in self.children(node):
+                    low = min(low, self.span[child][0])
+                    high = max(high, self.span[child][1])
+                    size += self.size[child]
+                self.span[node] = (low, high)
+                self.size[node] = size
+                self.exit[node] = len(self.order)
+                continue
+            self.entry[node] = len(self.order)
+            self.order.append(node)
+            stack.append((node, True))
+            for child in reversed(self.children(node)):
+                self.depth[child] = self.depth[node] + 1
+                stack.append((child, False))
+
+        # the size of the root counts the root itself
+        self.is_tree = self.size[0] == n + 1
+        self.is_projective = self.is_tree and all(self.span[x][1] - self.span[x][0] + 1 == self.size[x] for x in range(1, n + 1))
+
+    def __len__(self):
+        return len(self.heads) - 1
+
+    def children(self, word_id):
+        return self.child_ids[self.child_offsets[word_id]:self.child_offsets[word_id + 1]]
+
+    def dominates(self, ancestor, word_id):
+        """
+        True if word_id is in the subtree of ancestor, including ancestor itself
+        """
+        if self.entry[ancestor] < 0 or self.entry[word_id] < 0:
+            return False
+        return self.entry[ancestor] <= self.entry[word_id] < self.exit[ancestor]
+
+    def nonprojective_arcs(self):
+        """
+        The (head, dependent) arcs with a word between them which the head does not dominate
+
+        Only the arcs of heads whose subtree is not contiguous are
+        searched, as every word inside a contiguous subtree is dominated
+        by its head, so a projective sentence costs nothing more.  The
+        arcs are in the order of their dependents
+        """
+        if not self.is_tree or self.is_projective:
+            return []
+        arcs = []
+        for head in range(1, len(self) + 1):
+            if self.span[head][1] - self.span[head][0] + 1 == self.size[head]:
+                continue
+            for word_id in self.children(head):
+                low, high = min(head, word_id), max(head, word_id)
+                if any(not self.dominates(head, x) for x in range(low + 1, high)):
+                    arcs.append((head, word_id))
+        arcs.sort(key=lambda x: x[1])
+        return arcs
+
+    def cycle(self):
+        """
+        The word ids of one cycle, in head order, or None if there is no cycle
+        """
+        for start in range(1, len(self) + 1):
+            if self.entry[start] >= 0:
+                continue
+            seen = {}
+            node = start
+            while node > 0 and node not in seen and self.entry[node] < 0:
+                seen[node] = len(seen)
+                node = self.heads[node]
+            if node > 0 and node in seen:
+                path = list(seen)
+                return path[seen[node]:]
+        return None
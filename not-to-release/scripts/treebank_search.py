@@ -0,0 +1,187 @@
+"""
+Search every conllu file in the treebank for words matching a pattern
+
+A query is a list of conditions which all have to hold:
+  form=هجي              the word itself
+  upos!=AUX             negated
+  form~^ها$             regular expression over the vocabulary
+  feat=Case=Nom         one feature of the word; feats= matches the whole bundle
+  head.upos=VERB        the head of the word
+  child.deprel=nsubj    at least one dependent of the word
+
+The columns are form, lemma, upos, xpos, feats, feat and deprel.
+form= and lemma= also match the other spellings of the word, so
+form=هجي finds ھجي as well.  Use form~^هجي$ for the exact spelling.
+
+  python3 treebank_search.py form=هجي upos!=AUX
+  python3 treebank_search.py deprel=advmod:emph head.upos=NOUN
+
+Each match is printed with its file, line, sent_id, and the word and its head.
+
+The search runs on the columnar copy of the corpus from columnar_corpus.py
+and an inverted index from each value to the words which have it.
+The index is saved next to the columns and rebuilt whenever the
+columns are, which only rereads the conllu files that changed.
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+from columnar_corpus import DEFAULT_CORPUS_DIR, WORD_COLUMNS, load_corpus
+from normalize import normalize_word
+
+INDEX_DIR = "index"
+# = and != on these columns match every spelling which normalizes to the same word
+NORMALIZED_COLUMNS = ("form", "lemma")
+QUERY_PATTERN = re.compile(r"^(?:(head|child)\.)?(form|lemma|upos|xpos|feats|feat|deprel)(=|!=|~|!~)(.*)$")
+
+class InvertedIndex:
+    """
+    For each column, the word positions sorted by value id, and where each value starts
+
+    The positions of value v in column c are order[c][starts[c][v]:starts[c][v+1]]
+    """
+    def __init__(self, corpus):
+        self.corpus = corpus
+        index_dir = os.path.join(corpus.corpus_dir, INDEX_DIR)
+        build_id_file = os.path.join(index_dir, "build_id")
+        current = False
+        if os.path.exists(build_id_file):
+            with open(build_id_file) as fin:
+                current = fin.read().strip() == corpus.build_id
+        if not current:
+            self.build(index_dir)
+            with open(build_id_file, "w") as fout:
+                fout.write(corpus.build_id)
+        self.order = {}
+        self.starts = {}
+        for column in WORD_COLUMNS:
+            self.order[column] = np.load(os.path.join(index_dir, column + "_order.npy"), mmap_mode="r")
+            self.starts[column] = np.load(os.path.join(index_dir, column + "_starts.npy"), mmap_mode="r")
+        self._heads = None
+
+    def build(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        for column in WORD_COLUMNS:
+            values = np.asarray(getattr(self.corpus, column))
+            order = np.argsort(values, kind="stable").astype(np.int64)
+            starts = np.searchsorted(values[order], np.arange(len(self.corpus.vocab[column]) + 1))
+            np.save(os.path.join(index_dir, column + "_order.npy"), order)
+            np.save(os.path.join(index_dir, column + "_starts.npy"), starts)
+
+    @property
+    def heads(self):
+        if self._heads is None:
+            self._heads = self.corpus.head_index()
+        return self._heads
+
+    def postings(self, column, value_ids):
+        """
+        Boolean mask of the words whose column value is in value_ids
+        """
+        mask = np.zeros(self.corpus.num_words, dtype=bool)
+        order = self.order[column]
+        starts = self.starts[column]
+        for value_id in value_ids:
+            mask[order[starts[value_id]:starts[value_id+1]]] = True
+        return mask
+
+    def value_ids(self, column, operator, value):
+        """
+        The ids in the vocabulary of column which match value
+        """
+        if column == "feat":
+            vocab = self.corpus.vocab["feats"]
+            if operator in ("=", "!="):
+                return [idx for idx, feats in enumerate(vocab) if value in feats.split("|")]
+            pattern = re.compile(value)
+            return [idx for idx, feats in enumerate(vocab) if any(pattern.search(x) for x in feats.split("|"))]
+        vocab = self.corpus.vocab[column]
+        if operator in ("=", "!=") and column in NORMALIZED_COLUMNS:
+            value = normalize_word(value)
+            return [idx for idx, label in enumerate(vocab) if normalize_word(label) == value]
+        if operator in ("=", "!="):
+            value_id = self.corpus.vocab_id(column, value)
+            return [value_id] if value_id >= 0 else []
+        pattern = re.compile(value)
+        return [idx for idx, label in enumerate(vocab) if pattern.search(label)]
+
+    def condition_mask(self, column, operator, value):
+        index_column = "feats" if column == "feat" else column
+        mask = self.postings(index_column, self.value_ids(column, operator, value))
+        if operator.startswith("!"):
+            mask = ~mask
+        return mask
+
+    def search(self, conditions):
+        """
+        Return the positions of the words which satisfy all of the conditions
+
+        conditions is a list of (relation, column, operator, value) where relation is None, "head", or "child"
+        """
+        mask = np.ones(self.corpus.num_words, dtype=bool)
+        heads = None
+        for relation, column, operator, value in conditions:
+            condition = self.condition_mask(column, operator, value)
+            if relation is None:
+                mask &= condition
+            elif relation == "head":
+                heads = self.heads
+                mask &= (heads >= 0) & condition[np.maximum(heads, 0)]
+            else:
+                heads = self.heads
+                parents = np.zeros(self.corpus.num_words, dtype=bool)
+                children = np.nonzero(condition & (heads >= 0))[0]
+                parents[heads[children]] = True
+                mask &= parents
+        return np.nonzero(mask)[0]
+
+def parse_query(query):
+    conditions = []
+    for piece in query:
+        match = QUERY_PATTERN.match(piece)
+        if not match:
+            raise ValueError("Could not understand the search term |%s|" % piece)
+        conditions.append(match.groups())
+    return conditions
+
+def format_match(corpus, heads, sentences, position):
+    sent_idx = sentences[position]
+    vocab = corpus.vocab
+    head = heads[position]
+    if head >= 0:
+        head_text = "%s/%s" % (vocab["form"][corpus.form[head]], vocab["upos"][corpus.upos[head]])
+    else:
+        head_text = "ROOT"
+    return "%s:%d\t%s\t%d\t%s\t%s\t%s\t%s\t%s" % (corpus.sentence_file(sent_idx), corpus.line[position], corpus.sentence_id(sent_idx), corpus.word_id[position],
+                                               vocab["form"][corpus.form[position]], vocab["upos"][corpus.upos[position]], vocab["feats"][corpus.feats[position]],
+                                               vocab["deprel"][corpus.deprel[position]], head_text)
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the treebank for words matching a pattern')
+    parser.add_argument('query', nargs='+', help='Conditions such as form=هجي upos!=AUX head.upos=VERB')
+    parser.add_argument('--corpus_dir', default=DEFAULT_CORPUS_DIR, help='Where the columnar corpus is kept')
+    parser.add_argument('--count', action='store_true', default=False, help='Only print the number of matches')
+    parser.add_argument('--limit', type=int, default=None, help='Only print this many matches')
+    args = parser.parse_args()
+
+    conditions = parse_query(args.query)
+    corpus = load_corpus(args.corpus_dir)
+    index = InvertedIndex(corpus)
+    matches = index.search(conditions)
+    print("%d matches" % len(matches), file=sys.stderr)
+    if args.count:
+        return
+    if args.limit is not None:
+        matches = matches[:args.limit]
+    sentences = np.searchsorted(corpus.sent_offsets, matches, side="right") - 1
+    sentences = dict(zip(matches, sentences))
+    for position in matches:
+        print(format_match(corpus, index.heads, sentences, position))
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,11 @@ import argparse
 import re
 import sys
 
-import networkx as nx
-
 from stanza.utils.conll import CoNLL
 
+from normalize import normalize_keys, normalize_word
+from tree_index import TreeIndex
+
 ALLOWED_UPOS = { "ADJ", "ADP", "ADV", "AUX", "CCONJ", "DET", "INTJ", "NOUN", "NUM", "PART", "PRON", "PROPN", "PUNCT", "SCONJ", "SYM", "VERB"}
 
 ALLOWED_UPOS_TO_XPOS = {
@@ -72,6 +73,7 @@ ADVMOD_EMPH_EXCEPTIONS = {
     }
 
 
+# keys are compared after normalize_word, so the ھ spellings such as ھجي and ناھي are covered as well
 ENFORCED_POS = {
     "مطابق": ["ADP"],
     "جڏهن": ["ADV"],
@@ -79,24 +81,44 @@ ENFORCED_POS = {
 }
 for word in ('هجان', 'هجون', 'هجين', 'هجو', 'هجي', 'هجن'):
     ENFORCED_POS[word] = ["AUX"]
-for word in ('ھجان', 'ھجون', 'ھجين', 'ھجو', 'ھجي', 'ھجن'):
-    ENFORCED_POS[word] = ["AUX"]
 ENFORCED_POS['هجئي'] = ["AUX"]
 ENFORCED_POS['ڪانهي'] = ["AUX"]
-ENFORCED_POS['ھئي'] = ["AUX"]
+ENFORCED_POS['هئي'] = ["AUX"]
 
 # the negative polarity AUX words should all be AUX
-for word in ['ناهن', 'ناهي', 'ناهيان', 'ناهيون', 'ناھن', 'ناھي', 'ناھيان', 'ناھيون', 'نٿا', 'نٿو', 'نٿي', 'نٿيون', 'ڪونهن', 'ڪونهي', 'ڪونھن', 'ڪونھي']:
+for word in ['ناهن', 'ناهي', 'ناهيان', 'ناهيون', 'نٿا', 'نٿو', 'نٿي', 'نٿيون', 'ڪونهن', 'ڪونهي']:
     ENFORCED_POS[word] = ["AUX"]
+ENFORCED_POS = normalize_keys(ENFORCED_POS)
 
-ALLOWED_STRUCTURE = {
+ALLOWED_STRUCTURE = normalize_keys({
     'ها': [('AUX', 'aux'), ('INTJ', 'discourse')],
-   'ھا': [('AUX', 'aux'), ('INTJ', 'discourse')],
-}
-
-def validate(new_doc, print_sent_idx=False, check_xpos=True, check_feats=True):
+})
+
+# the verb's [subj] features which should match the features of its nsubj
+SUBJECT_AGREEMENT = ("Gender", "Number", "Person")
+# the features a genitive postposition shares with the noun its possessor modifies
+# only the direct case forms are checked, as the oblique جي is used for any masculine noun
+GENITIVE_AGREEMENT = ("Gender", "Number")
+
+def feature_map(word):
+    if not word.feats or word.feats == '_':
+        return {}
+    return dict(x.split("=", maxsplit=1) for x in word.feats.split("|") if "=" in x)
+
+def validate(new_doc, print_sent_idx=False, check_xpos=True, check_feats=True, check_projectivity=False, check_genitive=False):
+    """
+    Print the problems found in new_doc and return the indices of the sentences which had any
+
+    Subject agreement is part of check_feats.  Genitive agreement is
+    only checked with check_genitive, as it still flags correct
+    sentences.  Non-projective punct is always a problem, other
+    non-projective arcs only with check_projectivity
+    """
     problem_sentences = set()
 
+    # the children, spans and dominance of each tree, computed once for all of the structural checks
+    trees = [TreeIndex([word.head for word in sent.words]) for sent in new_doc.sentences]
+
     printed = False
     for sent_idx, sent in enumerate(new_doc.sentences):
         for word_idx, word in enumerate(sent.words):
@@ -222,24 +244,38 @@ def validate(new_doc, print_sent_idx=False, check_xpos=True, check_feats=True):
 
     printed = False
     for sent_idx, sent in enumerate(new_doc.sentences):
-        graph = nx.MultiDiGraph()
-        for word_idx, word in enumerate(sent.words):
-            if word.parent is None or word.deprel is None:
-                continue
-            graph.add_edge(word.head, word.id, word.deprel)
-        try:
-            # will throw an error if there is no cycle
-            cycle = nx.find_cycle(graph)
+        cycle = trees[sent_idx].cycle()
+        if cycle is None:
+            continue
+        problem_sentences.add(sent_idx)
+        if not printed:
+            printed = True
+            print("CYCLES")
+        print("Cycle in sentence %s" % sent.sent_id)
+        for word_id in cycle:
+            word = sent.words[word_id-1]
+            print(word.head, sent.words[word.head-1].text, word.id, word.text, word.deprel)
 
+    printed = False
+    for sent_idx, sent in enumerate(new_doc.sentences):
+        tree = trees[sent_idx]
+        for head, word_id in tree.nonprojective_arcs():
+            word = sent.words[word_id-1]
+            low, high = min(head, word_id), max(head, word_id)
+            gap_punct = [x for x in range(low + 1, high) if sent.words[x-1].upos == "PUNCT" and not tree.dominates(head, x)]
+            if word.upos == "PUNCT":
+                error = "Sentence %s (%d) word %d |%s| (line %d) is punct attached non-projectively to %d" % (sent.sent_id, sent_idx, word.id, word.text, word.line_number, head)
+            elif gap_punct:
+                error = "Sentence %s (%d) arc %d -> %d (line %d) crosses the punct at %s" % (sent.sent_id, sent_idx, head, word.id, word.line_number, ", ".join(str(x) for x in gap_punct))
+            elif check_projectivity:
+                error = "Sentence %s (%d) arc %d -> %d |%s| %s (line %d) is non-projective" % (sent.sent_id, sent_idx, head, word.id, word.text, word.deprel, word.line_number)
+            else:
+                continue
             problem_sentences.add(sent_idx)
             if not printed:
                 printed = True
-                print("CYCLES")
-            print("Cycle in sentence %s" % sent.sent_id)
-            for edge in cycle:
-                print(edge[0], sent.words[edge[0]-1].text, edge[1], sent.words[edge[1]-1].text, edge[2])
-        except nx.NetworkXNoCycle:
-            pass
+                print("NON-PROJECTIVE ARCS")
+            print(error)
 
     if check_xpos:
         printed = False
@@ -292,18 +328,20 @@ def validate(new_doc, print_sent_idx=False, check_xpos=True, check_feats=True):
     printed = False
     for sent_idx, sent in enumerate(new_doc.sentences):
         for word_idx, word in enumerate(sent.words):
-            if word.text in ENFORCED_POS and word.upos not in ENFORCED_POS[word.text]:
+            key = normalize_word(word.text)
+            if key in ENFORCED_POS and word.upos not in ENFORCED_POS[key]:
                 if not printed:
                     printed = True
                     print("Word-specific POS error")
-                print("Sentence %s (%d) word %d (line %d) is |%s| with a POS of %s, which is not in %s" % (sent.sent_id, sent_idx, word.id, word.line_number, word.text, word.upos, ENFORCED_POS[word.text]))
+                print("Sentence %s (%d) word %d (line %d) is |%s| with a POS of %s, which is not in %s" % (sent.sent_id, sent_idx, word.id, word.line_number, word.text, word.upos, ENFORCED_POS[key]))
 
     printed = False
     for sent_idx, sent in enumerate(new_doc.sentences):
         for word_idx, word in enumerate(sent.words):
-            if word.text in ALLOWED_STRUCTURE:
+            key = normalize_word(word.text)
+            if key in ALLOWED_STRUCTURE:
                 structure = (word.pos, word.deprel)
-                if structure not in ALLOWED_STRUCTURE[word.text]:
+                if structure not in ALLOWED_STRUCTURE[key]:
                     if not printed:
                         printed = True
                         print("Found an expected POS & deprel combination")
@@ -356,19 +394,70 @@ def validate(new_doc, print_sent_idx=False, check_xpos=True, check_feats=True):
                                 print("FEATURE ERRORS")
                             print("Sentence %s (%d) word %d |%s| (line %d) had VerbForm=Inf but an Aspect=%s" % (sent.sent_id, sent_idx, word_idx, word.text, word.line_number, feat_map.get('Aspect')))
 
+        printed = False
+        for sent_idx, sent in enumerate(new_doc.sentences):
+            tree = trees[sent_idx]
+            for word in sent.words:
+                if word.upos not in ("VERB", "AUX"):
+                    continue
+                verb_feats = feature_map(word)
+                if not any(feat + "[subj]" in verb_feats for feat in SUBJECT_AGREEMENT):
+                    continue
+                for child_id in tree.children(word.id):
+                    child = sent.words[child_id-1]
+                    if not child.deprel or not child.deprel.startswith("nsubj"):
+                        continue
+                    child_feats = feature_map(child)
+                    for feat in SUBJECT_AGREEMENT:
+                        verb_value = verb_feats.get(feat + "[subj]")
+                        if verb_value is None or feat not in child_feats or child_feats[feat] == verb_value:
+                            continue
+                        problem_sentences.add(sent_idx)
+                        if not printed:
+                            printed = True
+                            print("SUBJECT AGREEMENT ERRORS")
+                        print("Sentence %s (%d) word %d |%s| (line %d) has %s[subj]=%s but its nsubj %d |%s| has %s=%s" % (sent.sent_id, sent_idx, word.id, word.text, word.line_number, feat, verb_value, child.id, child.text, feat, child_feats[feat]))
+
+    if check_genitive:
+        printed = False
+        for sent_idx, sent in enumerate(new_doc.sentences):
+            for word in sent.words:
+                if word.xpos != 'PSPG' or not word.head:
+                    continue
+                possessor = sent.words[word.head-1]
+                if possessor.deprel != 'nmod' or not possessor.head:
+                    continue
+                possessed = sent.words[possessor.head-1]
+                if possessed.upos not in ("NOUN", "PROPN"):
+                    continue
+                word_feats = feature_map(word)
+                if word_feats.get("Case") != "Nom":
+                    continue
+                possessed_feats = feature_map(possessed)
+                for feat in GENITIVE_AGREEMENT:
+                    if feat not in word_feats or feat not in possessed_feats or word_feats[feat] == possessed_feats[feat]:
+                        continue
+                    problem_sentences.add(sent_idx)
+                    if not printed:
+                        printed = True
+                        print("GENITIVE AGREEMENT ERRORS")
+                    print("Sentence %s (%d) word %d |%s| (line %d) has %s=%s but the noun it attaches %d |%s| to, %d |%s|, has %s=%s" % (sent.sent_id, sent_idx, word.id, word.text, word.line_number, feat, word_feats[feat], possessor.id, possessor.text, possessed.id, possessed.text, feat, possessed_feats[feat]))
+
     return problem_sentences
 
 def main():
     parser = argparse.ArgumentParser(description='Validate a file of SD dependencies & tags')
     parser.add_argument('filename', nargs='+', help='File to validate')
     parser.add_argument('--no_check_xpos', action='store_false', dest='check_xpos', help="Don't check the xpos in the file")
-    parser.add_argument('--no_check_feats', action='store_false', dest='check_feats', help="Don't check the feats in the file")
+    parser.add_argument('--no_check_feats', action='store_false', dest='check_feats', help="Don't check the feats or their agreement in the file")
+    parser.add_argument('--check_projectivity', action='store_true', default=False, help="Report every non-projective arc, not just the ones involving punct")
+    parser.add_argument('--check_genitive', action='store_true', default=False, help="Check that genitive postpositions agree with the noun their possessor modifies.  Still flags some correct sentences")
     args = parser.parse_args()
 
     for filename in args.filename:
         print("Validating %s" % filename)
         new_doc = CoNLL.conll2doc(filename, keep_line_numbers=True)
-        validate(new_doc, check_xpos=args.check_xpos, check_feats=args.check_feats)
+        validate(new_doc, check_xpos=args.check_xpos, check_feats=args.check_feats, check_projectivity=args.check_projectivity, check_genitive=args.check_genitive)
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,14 @@
 import argparse
 import difflib
+import os
+import sys
 
 from stanza.utils.conll import CoNLL
-from stanza import Pipeline
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from annotation_client import AnnotationClient
+from pipeline_cache import CachedPipeline, DEFAULT_CACHE_DIR
+from profiling import add_profile_args, profiler_from_args
 
 def yield_update_spans(orig_lines, new_lines):
     orig_idx = 0
@@ -67,10 +73,29 @@ def yield_update_spans(orig_lines, new_lines):
                 print(operations)
             break
 
+def clean_reparsed_sentence(sentence, orig_text, sent_id):
+    sentence.add_comment("# orig_text = %s" % orig_text)
+    for token in sentence.tokens:
+        token._start_char = None
+        token._end_char = None
+    for word in sentence.words:
+        word._start_char = None
+        word._end_char = None
+        word._lemma = None
+    sentence.tokens[-1].spaces_after = " "
+    sentence.sent_id = sent_id
+
 def main():
     parser = argparse.ArgumentParser(description='Find tokenization edits relative to a particular conllu file and reparse those sentences')
     parser.add_argument('filename', type=str, help='File to search for retokenized sentences')
+    parser.add_argument('--output', type=str, default="twonsubj_reparsed.conllu", help='Where to write the reparsed sentences')
+    parser.add_argument('--batch_size', type=int, default=32, help='How many sentences to send through the pipeline at once')
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR, help='Where to cache the pipeline output')
+    parser.add_argument('--no_cache', dest='cache_dir', action='store_const', const=None, help="Don't cache the pipeline output")
+    parser.add_argument('--server', default=None, help='Send the sentences to a running annotation_server.py at this address, such as 127.0.0.1:5905, instead of loading the models')
+    add_profile_args(parser)
     args = parser.parse_args()
+    profiler = profiler_from_args(args, "find_updates")
 
     with open("two_nsubj.txt") as fin:
         orig_lines = fin.readlines()
@@ -86,47 +111,53 @@ def main():
     print("%d lines in original" % len(orig_lines))
     print("%d lines in new" % len(new_lines))
 
-    doc = CoNLL.conll2doc(args.filename)
+    with profiler.stage("parse") as stage:
+        doc = CoNLL.conll2doc(args.filename)
+        stage.add_doc(doc)
     known_text = {sent.text.replace(" ", "") for sent in doc.sentences}
 
-    pipe = Pipeline("sd", processors="tokenize,pos,lemma,depparse", package="default_accurate", tokenize_no_ssplit=True)
+    if args.server:
+        pipe = AnnotationClient(args.server)
+    else:
+        pipe = CachedPipeline("sd", processors="tokenize,pos,lemma,depparse", package="default_accurate", cache_dir=args.cache_dir)
 
-    docs = []
+    # (orig_text, new_text) for each sentence which needs to be reparsed
+    replacements = []
 
     errors = 0
-    for span in yield_update_spans(orig_lines, new_lines):
-        if span[0].replace(" ", "") in known_text:
-            if len(span[1]) > 1 or span[0] != span[1][0]:
-                if len(span[1]) == 1 and span[0][-1] in (".", "،", "؟") and span[0][-2] == ' ' and span[1][0][-1] == span[0][-1] and span[0][:-2] == span[1][0][:-1]:
-                    continue
-                errors += 1
-                print("Replacing:")
-                print("  |%s|" % span[0])
-                print("with")
-                for sentence in span[1]:
-                    print("  |%s|" % sentence)
-                    # not efficient... not too many sentences, fortunately
-                    doc = pipe(sentence)
-                    assert len(doc.sentences) == 1
-                    doc.sentences[0].add_comment("# orig_text = %s" % span[0])
-                    for token in doc.sentences[0].tokens:
-                        token._start_char = None
-                        token._end_char = None
-                    for word in doc.sentences[0].words:
-                        word._start_char = None
-                        word._end_char = None
-                        word._lemma = None
-                    doc.sentences[0].tokens[-1].spaces_after = " "
-                    doc.sentences[0].sent_id = str(len(docs)+1)
-                    docs.append(doc)
-            #if len(span[1]) == 1 and span[0] != span[1][0]:
-            #    print(span[0])
-            #    print(span[1][0])
+    with profiler.stage("align") as stage:
+        for span in yield_update_spans(orig_lines, new_lines):
+            if span[0].replace(" ", "") in known_text:
+                if len(span[1]) > 1 or span[0] != span[1][0]:
+                    if len(span[1]) == 1 and span[0][-1] in (".", "،", "؟") and span[0][-2] == ' ' and span[1][0][-1] == span[0][-1] and span[0][:-2] == span[1][0][:-1]:
+                        continue
+                    errors += 1
+                    print("Replacing:")
+                    print("  |%s|" % span[0])
+                    print("with")
+                    for sentence in span[1]:
+                        print("  |%s|" % sentence)
+                        replacements.append((span[0], sentence))
+                #if len(span[1]) == 1 and span[0] != span[1][0]:
+                #    print(span[0])
+                #    print(span[1][0])
+        stage.add(sentences=len(orig_lines))
 
     print(errors)
-    for doc in docs:
-        CoNLL.write_doc2conll(doc, "twonsubj_reparsed.conllu", mode='a')
+    print("Reparsing %d sentences" % len(replacements))
+    with profiler.stage("pipeline") as stage:
+        parsed = pipe([x[1] for x in replacements], args.batch_size)
+        stage.add(len(parsed), sum(len(sentence.words) for sentence in parsed))
+    if pipe.cache is not None:
+        print(pipe.cache)
+    with profiler.stage("write") as stage:
+        with open(args.output, "w", encoding="utf-8") as fout:
+            for sent_idx, ((orig_text, _), sentence) in enumerate(zip(replacements, parsed)):
+                clean_reparsed_sentence(sentence, orig_text, str(sent_idx+1))
+                fout.write("{:C}\n\n".format(sentence))
+        stage.add(len(parsed), sum(len(sentence.words) for sentence in parsed))
+
+    profiler.finish()
 
 if __name__ == '__main__':
     main()
-
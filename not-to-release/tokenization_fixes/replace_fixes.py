@@ -1,67 +1,122 @@
 """
 Replace fix tokenization sentences in the tokenization dataset and the dependencies dataset
+
+The reparsed sentences are indexed by their orig_text once.  Each
+target file is then streamed a sentence at a time, with any original
+sentence replaced by all of its new sentences.  Files with no
+replaced sentences are not rewritten.
 """
 
 import argparse
 from collections import defaultdict
+import os
+
+def iter_blocks(fin):
+    """
+    Yield each sentence in a conllu file as a list of lines, without the trailing blank line
+    """
+    block = []
+    for line in fin:
+        line = line.rstrip("\n")
+        if not line.strip():
+            if block:
+                yield block
+                block = []
+            continue
+        block.append(line)
+    if block:
+        yield block
+
+def get_comment(block, key):
+    prefix = "# %s" % key
+    for line in block:
+        if not line.startswith("#"):
+            break
+        if line.startswith(prefix) and line[len(prefix):].lstrip().startswith("="):
+            return line.split("=", 1)[1].strip()
+    return None
 
-from stanza.models.common.doc import Document
-from stanza.utils.conll import CoNLL
-
-def replace_sentences(sentences, orig_to_new, reindex=True):
-    new_sentences = []
-    for sentence in sentences:
-        if sentence.text in orig_to_new:
-            if reindex:
-                sent_id = sentence.sent_id
-                for idx, new_sent in enumerate(orig_to_new[sentence.text]):
-                    # we do this twice so that
-                    #  the original tokenization file gets sentences indexed by where they are in the file
-                    #  the dependencies file gets updated indices from at least one sentence
-                    new_sent_id = sent_id + chr(97 + idx)
-                    new_sent.sent_id = new_sent_id
-
-                    new_sent_dict = new_sent.to_dict()
-                    new_sent_comments = new_sent.comments
-                    new_doc = Document([new_sent_dict], comments=[new_sent_comments])
-                    new_sent = new_doc.sentences[0]
-
-                    new_sent_id = sent_id + chr(97 + idx)
-                    new_sent.sent_id = new_sent_id
-                    new_sentences.append(new_sent)
-            else:
-                new_sentences.extend(orig_to_new[sentence.text])
-        else:
-            new_sentences.append(sentence)
-    return new_sentences
-
-parser = argparse.ArgumentParser(description='Replace some retokenized & reparsed sentences')
-parser.add_argument('--reparsed', default="../xpos_features/sd_batch_3_retok.conllu")
-parser.add_argument('--original', default=["../dependencies/sd_batch_3.conllu"], nargs="+")
-args = parser.parse_args()
-tokenized_filename = "../tokenization/combined_tokenization.conllu"
-
-reparsed = CoNLL.conll2doc(args.reparsed)
-full_tokenized = CoNLL.conll2doc(tokenized_filename)
-
-orig_to_new = defaultdict(list)
-
-for sentence in reparsed.sentences:
-    comments = sentence.comments
-    for comment in comments:
-        if comment.startswith("# orig_text"):
-            orig_text = comment.split("=")[1].strip()
+def set_sent_id(block, sent_id):
+    """
+    Set the sent_id comment of the block in place, adding one at the start if necessary
+    """
+    for line_idx, line in enumerate(block):
+        if not line.startswith("#"):
             break
+        if get_comment([line], "sent_id") is not None:
+            block[line_idx] = "# sent_id = %s" % sent_id
+            return
+    block.insert(0, "# sent_id = %s" % sent_id)
+
+def read_reparsed(filename):
+    """
+    Return a map from orig_text to the list of reparsed sentence blocks which replace it
+
+    The orig_text comment itself is removed from the blocks
+    """
+    orig_to_new = defaultdict(list)
+    with open(filename, encoding="utf-8") as fin:
+        for block in iter_blocks(fin):
+            orig_text = get_comment(block, "orig_text")
+            if orig_text is None:
+                raise ValueError("Missing orig_text on a sentence in %s" % filename)
+            block = [x for x in block if get_comment([x], "orig_text") is None]
+            orig_to_new[orig_text].append(block)
+    return orig_to_new
+
+def splice_file(filename, orig_to_new, reindex=True):
+    """
+    Replace each sentence in filename whose text is in orig_to_new, in one streaming pass
+
+    If reindex is set, the new sentences are given the sent_id of the
+    original plus a, b, c...  This updates the blocks in orig_to_new
+    as well, so that later files get the same sent_ids as this one.
+
+    The file is only rewritten if something was replaced.  Returns
+    the number of original sentences which were replaced.
+    """
+    replaced = 0
+    temp_filename = filename + ".splice"
+    with open(filename, encoding="utf-8") as fin, open(temp_filename, "w", encoding="utf-8") as fout:
+        for block in iter_blocks(fin):
+            text = get_comment(block, "text")
+            if text not in orig_to_new:
+                fout.write("\n".join(block))
+                fout.write("\n\n")
+                continue
+            replaced += 1
+            sent_id = get_comment(block, "sent_id")
+            for idx, new_block in enumerate(orig_to_new[text]):
+                if reindex and sent_id is not None:
+                    set_sent_id(new_block, sent_id + chr(97 + idx))
+                fout.write("\n".join(new_block))
+                fout.write("\n\n")
+
+    if replaced > 0:
+        os.replace(temp_filename, filename)
     else:
-        raise ValueError("Missing orig_text on a sentence")
-    comments = [x for x in comments if not x.startswith("# orig_text")]
-    sentence._comments = comments
-    orig_to_new[orig_text].append(sentence)
-
-full_tokenized.sentences = replace_sentences(full_tokenized.sentences, orig_to_new)
-CoNLL.write_doc2conll(full_tokenized, tokenized_filename)
-
-for filename in args.original:
-    original = CoNLL.conll2doc(filename)
-    original.sentences = replace_sentences(original.sentences, orig_to_new, reindex=False)
-    CoNLL.write_doc2conll(original, filename)
+        os.remove(temp_filename)
+    return replaced
+
+def main():
+    parser = argparse.ArgumentParser(description='Replace some retokenized & reparsed sentences')
+    parser.add_argument('--reparsed', default="../xpos_features/sd_batch_3_retok.conllu")
+    parser.add_argument('--original', default=["../dependencies/sd_batch_3.conllu"], nargs="+")
+    parser.add_argument('--tokenized', default="../tokenization/combined_tokenization.conllu", help='The combined tokenization file, which determines the new sent_ids')
+    args = parser.parse_args()
+
+    orig_to_new = read_reparsed(args.reparsed)
+    print("%d sentences to replace with %d new sentences" % (len(orig_to_new), sum(len(x) for x in orig_to_new.values())))
+
+    # the tokenization file goes first so that
+    #  the original tokenization file gets sentences indexed by where they are in the file
+    #  the dependencies file gets updated indices from at least one sentence
+    replaced = splice_file(args.tokenized, orig_to_new)
+    print("Replaced %d sentences in %s" % (replaced, args.tokenized))
+
+    for filename in args.original:
+        replaced = splice_file(filename, orig_to_new, reindex=False)
+        print("Replaced %d sentences in %s" % (replaced, filename))
+
+if __name__ == '__main__':
+    main()